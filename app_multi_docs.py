@@ -5,7 +5,8 @@ import logging
 from datetime import datetime
 
 from pdf_processor import extract_text_from_pdf, chunk_pdf_text
-from knowledge_base import KnowledgeBase
+from kb_service import get_knowledge_base_service
+from embedding_cache import CachedEmbeddings
 from file_manager import FileManager
 from response_generator import ResponseGenerator
 
@@ -97,11 +98,14 @@ def initialize_session_state():
         st.session_state.openai_api_key = default_api_key
 
 def initialize_knowledge_base():
-    """Inicializa a base de conhecimento."""
+    """
+    Obtém a base de conhecimento compartilhada pelo processo; a sessão guarda apenas uma
+    referência ao serviço, que carrega o índice uma única vez para todas as sessões.
+    """
     if st.session_state.knowledge_base is None:
-        st.session_state.knowledge_base = KnowledgeBase(
-            openai_api_key=st.session_state.openai_api_key,
-            kb_path=KB_DIR
+        st.session_state.knowledge_base = get_knowledge_base_service(
+            kb_path=KB_DIR,
+            openai_api_key=st.session_state.openai_api_key
         )
         st.session_state.file_manager = FileManager(st.session_state.knowledge_base)
         logger.info("Base de conhecimento inicializada")
@@ -161,20 +165,27 @@ def display_document_list():
         return
     
     st.write(f"### Documentos na Base de Conhecimento ({len(documents)})")
+    read_only = st.session_state.knowledge_base.read_only
     
     for doc_id, doc_info in documents.items():
         with st.container():
             col1, col2 = st.columns([3, 1])
             
             with col1:
+                tokens_removed = doc_info.get("normalization", {}).get("tokens_removed")
+                boilerplate_info = f"<p>Tokens de boilerplate removidos: {tokens_removed}</p>" if tokens_removed else ""
                 st.markdown(f"""
                 <div class="document-card">
                     <h4>{doc_info['name']}</h4>
                     <p>Adicionado em: {doc_info['added_at'][:16].replace('T', ' às ')}</p>
                     <p>Chunks: {doc_info['chunk_count']}</p>
+                    {boilerplate_info}
                 </div>
                 """, unsafe_allow_html=True)
             
+            if read_only:
+                continue
+            
             with col2:
                 st.markdown("<div class='document-actions'>", unsafe_allow_html=True)
                 if st.button(f"Remover", key=f"remove_{doc_id}"):
@@ -184,6 +195,18 @@ def display_document_list():
                     else:
                         st.error(f"Erro ao remover documento '{doc_info['name']}'")
                 st.markdown("</div>", unsafe_allow_html=True)
+            
+            # Nova revisão do documento: apenas as páginas alteradas são reprocessadas
+            with st.expander(f"Enviar nova revisão de '{doc_info['name']}'"):
+                revision = st.file_uploader("Nova revisão (PDF)", type="pdf", key=f"revision_{doc_id}")
+                if revision is not None and st.button("Substituir documento", key=f"replace_{doc_id}"):
+                    with st.spinner("Atualizando documento..."):
+                        stats = st.session_state.file_manager.replace_file(doc_id, revision)
+                    if stats:
+                        st.success(f"Documento atualizado: {stats['pages_changed']} páginas alteradas, "
+                                   f"{stats['chunks_added']} chunks novos, {stats['chunks_kept']} mantidos")
+                    else:
+                        st.error(f"Erro ao substituir documento '{doc_info['name']}'")
 
 def main():
     # Inicializar estado da sessão
@@ -204,10 +227,10 @@ def main():
         openai_api_key = st.text_input("Chave da API OpenAI", value=st.session_state.openai_api_key, type="password")
         if openai_api_key:
             st.session_state.openai_api_key = openai_api_key
-            # Reinicializar a base de conhecimento se a chave mudar
+            # Usar o serviço da nova chave se ela mudar (o serviço da chave anterior continua aberto
+            # para as demais sessões)
             if st.session_state.knowledge_base is not None and st.session_state.knowledge_base.openai_api_key != openai_api_key:
                 st.session_state.knowledge_base = None
-                st.experimental_rerun()
         
         # Inicializar a base de conhecimento
         initialize_knowledge_base()
@@ -216,7 +239,27 @@ def main():
         st.header("Informações")
         documents = st.session_state.knowledge_base.get_all_documents()
         st.info(f"Documentos na base: {len(documents)}")
-        
+        index_stats = st.session_state.knowledge_base.get_index_stats()
+        st.caption(f"Vetores no índice ({index_stats['type'] or '-'}, codificação {index_stats['quantization'] or '-'}, "
+                   f"{index_stats['bytes_per_vector']} bytes/vetor): {index_stats['vectors']} "
+                   f"({index_stats['deleted']} excluídos aguardando compactação)")
+        cache_stats = st.session_state.file_manager.ingest_cache.get_stats()
+        st.caption(f"Cache de ingestão: {cache_stats['hits']} acertos, {cache_stats['misses']} erros, "
+                   f"{cache_stats['entries']} entradas ({cache_stats['bytes'] / (1024 * 1024):.1f} MB)")
+        embeddings = st.session_state.knowledge_base.embeddings
+        if isinstance(embeddings, CachedEmbeddings):
+            embedding_stats = embeddings.get_stats()
+            st.caption(f"Cache de embeddings: taxa de acerto {embedding_stats['hit_rate']:.0%}, "
+                       f"{embedding_stats['api_calls_saved']} chamadas à API evitadas, "
+                       f"{embedding_stats['bytes_stored'] / (1024 * 1024):.1f} MB")
+        else:
+            st.caption(f"Embeddings: {getattr(embeddings, 'model', type(embeddings).__name__)}")
+        query_stats = st.session_state.knowledge_base.query_embedder.get_stats()
+        batch_sizes = ", ".join(f"≤{size}: {count}" for size, count in query_stats["batch_sizes"].items())
+        st.caption(f"Cache de consultas: taxa de acerto {query_stats['hit_rate']:.0%} "
+                   f"({query_stats['entries']} consultas), {query_stats['requests']} requisições "
+                   f"(lotes {batch_sizes or '-'})")
+
         # Botão para limpar sessão
         if st.button("Limpar Histórico de Consultas"):
             st.session_state.history = []
@@ -235,12 +278,17 @@ def main():
         st.header("Upload de Documentos PDF")
         st.markdown("Faça upload de um ou mais documentos PDF para adicionar à base de conhecimento.")
         
-        # Upload de múltiplos arquivos
-        uploaded_files = st.file_uploader(
-            "Escolha um ou mais arquivos PDF", 
-            type="pdf",
-            accept_multiple_files=True
-        )
+        # Upload de múltiplos arquivos (indisponível com a base em modo somente leitura)
+        uploaded_files = None
+        if st.session_state.knowledge_base.read_only:
+            st.info("A base de conhecimento está aberta em modo somente leitura (KB_READ_ONLY); "
+                    "o envio de documentos está desativado nesta instância.")
+        else:
+            uploaded_files = st.file_uploader(
+                "Escolha um ou mais arquivos PDF",
+                type="pdf",
+                accept_multiple_files=True
+            )
         
         if uploaded_files:
             st.write(f"Arquivos selecionados: {len(uploaded_files)}")
@@ -0,0 +1,749 @@
+import os
+import re
+import sys
+import zlib
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Any, List
+
+import fitz  # PyMuPDF
+import faiss
+import numpy as np
+import tiktoken
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from create_test_pdf import TEST_TEXT, create_test_pdf
+from embedding_scheduler import EmbeddingScheduler
+from faiss_index import FaissIndex, QUANTIZATIONS
+from segmented_index import SegmentedIndex
+from sharded_index import ShardedIndex, shard_names
+from docstore import DocStore
+from knowledge_base import KnowledgeBase
+from query_embedding import QueryEmbedder
+from kb_service import get_knowledge_base_service
+from pdf_processor import extract_text_from_pdf, extract_pages_from_pdf, join_pages, chunk_pdf_text
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def _legacy_extract_text(pdf_path: str) -> str:
+    """Implementação original da extração (concatenação e log por página), usada como referência."""
+    text = ""
+    with fitz.open(pdf_path) as doc:
+        for page_num, page in enumerate(doc):
+            logger.info(f"Processando página {page_num + 1}/{len(doc)}")
+            text += page.get_text()
+    return text
+
+def _legacy_chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list:
+    """Implementação original do chunking (tokenização a cada candidato de divisão), usada como referência."""
+    def count_tokens(value: str) -> int:
+        return len(tiktoken.get_encoding("cl100k_base").encode(value))
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=count_tokens,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    return [{"content": chunk, "token_count": count_tokens(chunk)} for chunk in text_splitter.split_text(text)]
+
+def _measure(func: Callable[[], Any], repeat: int = 3) -> Dict[str, float]:
+    """
+    Mede o melhor tempo e o pico de memória alocada por uma função.
+
+    Args:
+        func: Função sem argumentos a ser medida
+        repeat: Número de repetições para o tempo
+
+    Returns:
+        Dicionário com o melhor tempo (s) e o pico de memória (MB)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"seconds": best, "peak_mb": peak / (1024 * 1024)}
+
+def _print_table(title: str, rows: Dict[str, Dict[str, float]]):
+    """Imprime os resultados de um benchmark em formato de tabela."""
+    print(f"\n=== {title} ===")
+    for name, result in rows.items():
+        print(f"{name:<30} {result['seconds'] * 1000:>10.1f} ms {result['peak_mb']:>10.1f} MB")
+
+def benchmark_extraction(num_pages: int, repeat: int = 3):
+    """
+    Compara a extração original com a extração por páginas.
+
+    Args:
+        num_pages: Número de páginas do PDF gerado para o benchmark
+        repeat: Número de repetições para o tempo
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, f"bench_{num_pages}.pdf")
+        create_test_pdf(pdf_path, num_pages)
+
+        # O log por página da implementação original é mantido: seu custo faz parte da comparação
+        rows = {
+            "original (text +=, log INFO)": _measure(lambda: _legacy_extract_text(pdf_path), repeat),
+            "extract_text_from_pdf": _measure(lambda: extract_text_from_pdf(pdf_path), repeat),
+            "extract_pages_from_pdf + join": _measure(lambda: join_pages(extract_pages_from_pdf(pdf_path)), repeat),
+        }
+        _print_table(f"Extração de texto ({num_pages} páginas)", rows)
+
+def benchmark_parallel_extraction(num_pages: int, repeat: int = 3):
+    """
+    Compara a extração serial com a extração paralela usando diferentes números de processos.
+
+    Args:
+        num_pages: Número de páginas do PDF gerado para o benchmark
+        repeat: Número de repetições para o tempo
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, f"bench_{num_pages}.pdf")
+        create_test_pdf(pdf_path, num_pages)
+
+        serial_pages = extract_pages_from_pdf(pdf_path, parallel=False)
+        rows = {"serial": _measure(lambda: extract_pages_from_pdf(pdf_path, parallel=False), repeat)}
+
+        for workers in sorted({2, 4, os.cpu_count() or 1} - {1}):
+            if extract_pages_from_pdf(pdf_path, parallel=True, max_workers=workers) != serial_pages:
+                logger.error(f"Resultado paralelo ({workers} processos) difere do serial")
+            rows[f"paralelo ({workers} processos)"] = _measure(
+                lambda: extract_pages_from_pdf(pdf_path, parallel=True, max_workers=workers), repeat
+            )
+        _print_table(f"Extração serial x paralela ({num_pages} páginas)", rows)
+
+def benchmark_chunking(num_pages: int, repeat: int = 3):
+    """
+    Compara o chunking original (RecursiveCharacterTextSplitter) com o chunking por tokens.
+
+    Args:
+        num_pages: Número de páginas do PDF gerado para o benchmark
+        repeat: Número de repetições para o tempo
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, f"bench_{num_pages}.pdf")
+        create_test_pdf(pdf_path, num_pages)
+        text = extract_text_from_pdf(pdf_path)
+
+        legacy_chunks = _legacy_chunk_text(text)
+        chunks = chunk_pdf_text(text)
+        print(f"\nChunks gerados - original: {len(legacy_chunks)}, por tokens: {len(chunks)}")
+
+        rows = {
+            "original (length_function)": _measure(lambda: _legacy_chunk_text(text), repeat),
+            "chunk_pdf_text (por tokens)": _measure(lambda: chunk_pdf_text(text), repeat),
+        }
+        _print_table(f"Chunking ({num_pages} páginas, {len(text)} caracteres)", rows)
+
+class _LatencyEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings falsos que simulam a latência de uma requisição à API."""
+
+    latency: float = 0.05
+    requests: int = 0
+
+    async def aembed_documents(self, texts):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return self.embed_documents(texts)
+
+class _SyncLatencyEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings falsos com latência fixa por requisição síncrona (uma por chamada)."""
+
+    latency: float = 0.05
+    requests: int = 0
+
+    def embed_documents(self, texts):
+        self.requests += 1
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts):
+        # Consultas em uma única requisição, como no backend da OpenAI
+        return self.embed_documents(texts)
+
+def benchmark_embedding(num_documents: int, repeat: int = 3, chunks_per_document: int = 20,
+                        latency: float = 0.05):
+    """
+    Compara o envio de embeddings documento a documento com o agendador em lotes concorrentes,
+    usando um modelo falso com latência fixa por requisição.
+
+    Args:
+        num_documents: Número de documentos simulados
+        repeat: Número de repetições para o tempo
+        chunks_per_document: Número de chunks de cada documento
+        latency: Latência simulada de cada requisição, em segundos
+    """
+    documents = [[f"{TEST_TEXT} documento {d} chunk {c}" for c in range(chunks_per_document)]
+                 for d in range(num_documents)]
+    all_texts = [text for texts in documents for text in texts]
+    model = _LatencyEmbeddings(size=64, latency=latency)
+
+    async def per_document():
+        for texts in documents:
+            await model.aembed_documents(texts)
+
+    scheduler = EmbeddingScheduler(model, requests_per_minute=0, tokens_per_minute=0)
+    rows = {
+        "um documento por vez": _measure(lambda: asyncio.run(per_document()), repeat),
+        "EmbeddingScheduler": _measure(lambda: scheduler.embed_documents(all_texts), repeat),
+    }
+    stats = scheduler.get_stats()
+    print(f"\nAgendador: {stats['requests']} requisições para {stats['texts']} textos "
+          f"({stats['tokens']} tokens)")
+    _print_table(f"Embeddings ({num_documents} documentos, latência {latency * 1000:.0f} ms)", rows)
+
+def _clustered_vectors(num_vectors: int, dimension: int, num_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Gera vetores sintéticos agrupados em torno de centróides, como embeddings de temas distintos."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((num_clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, num_clusters, size=num_vectors)
+    vectors = centroids[assignments] + 0.5 * rng.standard_normal((num_vectors, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def _recall_at_k(labels: np.ndarray, ground_truth: np.ndarray) -> float:
+    """Fração dos vizinhos exatos encontrados, em média por consulta."""
+    hits = sum(len(np.intersect1d(found, truth)) for found, truth in zip(labels, ground_truth))
+    return hits / ground_truth.size
+
+def benchmark_index(num_vectors: int, dimension: int, num_queries: int = 1000, k: int = 10):
+    """
+    Compara os tipos de índice FAISS em tempo de construção, tamanho, latência por consulta
+    e recall@k em relação à busca exata, variando nprobe (IVF) e efSearch (HNSW).
+
+    Args:
+        num_vectors: Número de vetores indexados
+        dimension: Dimensão dos vetores
+        num_queries: Número de consultas
+        k: Número de vizinhos por consulta
+    """
+    vectors = _clustered_vectors(num_vectors + num_queries, dimension)
+    vectors, queries = vectors[:num_vectors], vectors[num_vectors:]
+    ids = np.arange(num_vectors, dtype=np.int64)
+    sweeps = {
+        "flat": [None],
+        "ivf_flat": [1, 4, 16, 64],
+        "ivf_pq": [1, 4, 16, 64],
+        "hnsw": [16, 32, 64, 128],
+    }
+
+    ground_truth = None
+    print(f"\n=== Índices FAISS ({num_vectors} vetores, {dimension} dimensões, "
+          f"{num_queries} consultas, recall@{k}) ===")
+    print(f"{'tipo':<10} {'parâmetro':<14} {'construção':>12} {'tamanho':>10} {'latência':>14} {'recall':>8}")
+    for index_type, values in sweeps.items():
+        start = time.perf_counter()
+        index = FaissIndex(dimension, index_type=index_type)
+        index.add(vectors, ids)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index.index).nbytes / (1024 * 1024)
+
+        for value in values:
+            if index_type == "hnsw":
+                index.set_search_params(ef_search=value)
+                label = f"efSearch={value}"
+            elif value is not None:
+                index.set_search_params(nprobe=value)
+                label = f"nprobe={value}"
+            else:
+                label = "exato"
+            start = time.perf_counter()
+            for query in queries:
+                _, labels = index.search(query, k)
+            latency_ms = (time.perf_counter() - start) * 1000 / num_queries
+            _, labels = index.search(queries, k)
+            if ground_truth is None:
+                ground_truth = labels
+            print(f"{index_type:<10} {label:<14} {build_seconds:>10.2f} s {size_mb:>7.1f} MB "
+                  f"{latency_ms:>11.3f} ms {_recall_at_k(labels, ground_truth):>8.3f}")
+
+def benchmark_quantization(num_vectors: int, dimension: int, num_queries: int = 1000, k: int = 10):
+    """
+    Compara as codificações de vetores do índice em bytes por vetor, latência por consulta e
+    recall@k em relação à busca exata, sem e com reordenação pelos vetores completos em disco.
+
+    Args:
+        num_vectors: Número de vetores indexados
+        dimension: Dimensão dos vetores
+        num_queries: Número de consultas
+        k: Número de vizinhos por consulta
+    """
+    vectors = _clustered_vectors(num_vectors + num_queries, dimension)
+    vectors, queries = vectors[:num_vectors], vectors[num_vectors:]
+    ids = np.arange(num_vectors, dtype=np.int64)
+    _, ground_truth = faiss.knn(queries, vectors, k)
+
+    print(f"\n=== Codificação de vetores ({num_vectors} vetores, {dimension} dimensões, "
+          f"{num_queries} consultas, recall@{k}) ===")
+    print(f"{'codificação':<12} {'índice':<10} {'bytes/vetor':>12} {'reordenação':>12} {'latência':>14} {'recall':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for quantization in QUANTIZATIONS:
+            index = FaissIndex(dimension, index_type="flat", quantization=quantization,
+                               vectors_path=os.path.join(tmp_dir, f"{quantization}.f32"))
+            index.add(vectors, ids)
+            for rerank_factor in (0, 4):
+                if rerank_factor and quantization == "none":
+                    continue
+                index.rerank_factor = rerank_factor
+                start = time.perf_counter()
+                for query in queries:
+                    index.search(query, k)
+                latency_ms = (time.perf_counter() - start) * 1000 / num_queries
+                _, labels = index.search(queries, k)
+                print(f"{quantization:<12} {index.kind:<10} {index.code_size:>12} "
+                      f"{f'{rerank_factor}x' if rerank_factor else '-':>12} {latency_ms:>11.3f} ms "
+                      f"{_recall_at_k(labels, ground_truth):>8.3f}")
+
+def _private_memory_mb() -> float:
+    """Memória residente não compartilhada do processo, em MB (0 se /proc não estiver disponível)."""
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared = map(int, f.read().split()[:3])
+        return (resident - shared) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return 0.0
+
+def _load_and_query(kb_dir: str, dimension: int, mmap: bool, num_queries: int) -> Dict[str, float]:
+    """
+    Carrega o índice (executado em um processo novo) e mede tempo, memória e latência.
+
+    No carregamento completo, todos os chunks são lidos para a memória; no mapeado, o texto
+    é lido do banco apenas para os resultados de cada consulta.
+    """
+    queries = _clustered_vectors(num_queries, dimension, seed=1)
+    memory_before = _private_memory_mb()
+    start = time.perf_counter()
+    index = FaissIndex.load(os.path.join(kb_dir, "index.faiss"), vectors_path=os.path.join(kb_dir, "vectors.f32"), mmap=mmap)
+    docstore = DocStore(os.path.join(kb_dir, "docstore.sqlite"), read_only=True)
+    chunks = None if mmap else docstore.get_chunks(range(index.ntotal))
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        _, labels = index.search(query, 3)
+        ids = labels[0][labels[0] >= 0].tolist()
+        found = docstore.get_chunks(ids) if mmap else chunks
+        [found[i]["content"] for i in ids]
+    query_ms = (time.perf_counter() - start) * 1000 / num_queries
+    return {"load_seconds": load_seconds, "query_ms": query_ms,
+            "private_mb": _private_memory_mb() - memory_before}
+
+def benchmark_load(num_vectors: int, dimension: int, num_queries: int = 100):
+    """
+    Compara o carregamento completo do índice e dos chunks com o carregamento mapeado em memória
+    e a leitura do texto sob demanda no banco (modo somente leitura), cada um em um processo novo:
+    tempo de abertura, memória privada do processo e latência das primeiras consultas.
+
+    Args:
+        num_vectors: Número de vetores (e chunks) da base
+        dimension: Dimensão dos vetores
+        num_queries: Número de consultas após o carregamento
+    """
+    with tempfile.TemporaryDirectory() as kb_dir:
+        index = FaissIndex(dimension, index_type="flat", vectors_path=os.path.join(kb_dir, "vectors.f32"))
+        index.add(_clustered_vectors(num_vectors, dimension), np.arange(num_vectors, dtype=np.int64))
+        index.save(os.path.join(kb_dir, "index.faiss"))
+        docstore = DocStore(os.path.join(kb_dir, "docstore.sqlite"))
+        docstore.put_chunks([(i, TEST_TEXT[:1000], {"chunk_id": i % 100, "doc_id": str(i // 100)})
+                             for i in range(num_vectors)])
+        docstore.commit()
+        docstore.close()
+        del index
+
+        print(f"\n=== Carregamento da base ({num_vectors} vetores, {dimension} dimensões) ===")
+        print(f"{'modo':<26} {'abertura':>12} {'memória privada':>18} {'consulta':>14}")
+        for name, mmap in (("leitura completa", False), ("mapeado (somente leitura)", True)):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(_load_and_query, kb_dir, dimension, mmap, num_queries).result()
+            print(f"{name:<26} {result['load_seconds'] * 1000:>9.1f} ms {result['private_mb']:>15.1f} MB "
+                  f"{result['query_ms']:>11.3f} ms")
+
+def _saved_bytes(path: str) -> int:
+    """Tamanho dos arquivos gravados por FaissIndex.save (índice e IDs)."""
+    return sum(os.path.getsize(f"{path}{suffix}") for suffix in ("", ".ids.npy"))
+
+def benchmark_ingest(num_documents: int, dimension: int, chunks_per_document: int = 20):
+    """
+    Compara a ingestão documento a documento salvando o índice inteiro a cada documento
+    com a ingestão em segmentos (cada save grava só os vetores novos e os segmentos são
+    fundidos por níveis): tempo total e bytes gravados por vetor.
+
+    Args:
+        num_documents: Número de documentos adicionados, um save por documento
+        dimension: Dimensão dos vetores
+        chunks_per_document: Vetores por documento
+    """
+    vectors = _clustered_vectors(num_documents * chunks_per_document, dimension)
+    print(f"\n=== Ingestão ({num_documents} documentos x {chunks_per_document} vetores, {dimension} dimensões) ===")
+    print(f"{'modo':<22} {'tempo':>10} {'bytes gravados':>16} {'bytes/vetor':>13} {'segmentos':>10}")
+    for name in ("índice único", "segmentos"):
+        with tempfile.TemporaryDirectory() as kb_dir:
+            vectors_path = os.path.join(kb_dir, "vectors.f32")
+            if name == "índice único":
+                index = FaissIndex(dimension, index_type="flat", vectors_path=vectors_path)
+            else:
+                index = SegmentedIndex(dimension, index_type="flat", vectors_path=vectors_path, background_merge=False)
+            index_path = os.path.join(kb_dir, "index")
+            bytes_written = 0
+            start = time.perf_counter()
+            for doc in range(num_documents):
+                ids = np.arange(doc * chunks_per_document, (doc + 1) * chunks_per_document, dtype=np.int64)
+                index.add(vectors[ids], ids)
+                index.save(index_path)
+                if name == "índice único":
+                    bytes_written += _saved_bytes(index_path)
+            elapsed = time.perf_counter() - start
+            segments = 1
+            if name == "segmentos":
+                bytes_written, segments = index.bytes_written, index.num_segments
+            print(f"{name:<22} {elapsed:>8.2f} s {bytes_written / (1024 * 1024):>13.1f} MB "
+                  f"{bytes_written / len(vectors):>13.0f} {segments:>10}")
+
+def benchmark_shards(num_vectors: int, dimension: int, num_queries: int = 200, k: int = 10,
+                     chunks_per_document: int = 20):
+    """
+    Mede a busca em índices com 1, 2, 4 e 8 shards (consultas individuais, com os shards
+    consultados em paralelo) e a fração de vetores movidos ao incluir mais um shard.
+
+    Args:
+        num_vectors: Número de vetores indexados
+        dimension: Dimensão dos vetores
+        num_queries: Número de consultas
+        k: Número de vizinhos por consulta
+        chunks_per_document: Vetores por documento (cada documento fica inteiro em um shard)
+    """
+    vectors = _clustered_vectors(num_vectors + num_queries, dimension)
+    data, queries = vectors[:num_vectors], vectors[num_vectors:]
+    ids = np.arange(num_vectors, dtype=np.int64)
+    keys = [f"doc-{i // chunks_per_document}" for i in range(num_vectors)]
+    assignments = [(f"doc-{doc}", ids[doc * chunks_per_document:(doc + 1) * chunks_per_document])
+                   for doc in range((num_vectors + chunks_per_document - 1) // chunks_per_document)]
+    ground_truth = None
+    print(f"\n=== Shards ({num_vectors} vetores, {dimension} dimensões, {faiss.omp_get_max_threads()} threads FAISS) ===")
+    print(f"{'shards':>6} {'latência/consulta':>18} {'recall@' + str(k):>10} {'movidos (+1 shard)':>20}")
+    for num_shards in (1, 2, 4, 8):
+        with tempfile.TemporaryDirectory() as kb_dir:
+            index = ShardedIndex(dimension, shard_names(num_shards), index_type="flat",
+                                 vectors_path=os.path.join(kb_dir, "vectors.f32"), background_merge=False)
+            index.add(data, ids, keys)
+            index.save(kb_dir)
+            start = time.perf_counter()
+            labels = np.vstack([index.search(query, k)[1] for query in queries])
+            latency_ms = (time.perf_counter() - start) * 1000 / num_queries
+            if ground_truth is None:
+                ground_truth = labels
+            moved = index.set_shards(shard_names(num_shards + 1), assignments)
+            print(f"{num_shards:>6} {latency_ms:>15.2f} ms {_recall_at_k(labels, ground_truth):>10.3f} "
+                  f"{moved / num_vectors:>19.1%}")
+
+def benchmark_batch_search(num_documents: int, dimension: int, num_queries: int = 100, k: int = 5,
+                           chunks_per_document: int = 20, latency: float = 0.05):
+    """
+    Compara consultas individuais (similarity_search em laço) com a busca em lote
+    (batch_similarity_search, um único pedido de embeddings e uma única busca matricial),
+    usando um modelo falso com latência fixa por requisição.
+
+    Args:
+        num_documents: Número de documentos na base
+        dimension: Dimensão dos vetores
+        num_queries: Número de consultas
+        k: Número de resultados por consulta
+        chunks_per_document: Chunks por documento
+        latency: Latência simulada de cada requisição de embeddings, em segundos
+    """
+    queries = [f"consulta {i} sobre o documento {i % num_documents}" for i in range(num_queries)]
+    with tempfile.TemporaryDirectory() as kb_dir:
+        model = _SyncLatencyEmbeddings(size=dimension, latency=0.0)
+        knowledge_base = KnowledgeBase(kb_path=kb_dir, embeddings=model, index_type="flat")
+        knowledge_base.add_documents([
+            {"name": f"documento-{d}.pdf",
+             "chunks": [{"chunk_id": c, "title": f"Chunk {c}", "token_count": 20,
+                         "content": f"{TEST_TEXT} documento {d} chunk {c}"} for c in range(chunks_per_document)]}
+            for d in range(num_documents)
+        ])
+        model.latency, model.requests = latency, 0
+        knowledge_base.query_embedder.clear()
+
+        start = time.perf_counter()
+        single = [knowledge_base.similarity_search(query, k=k) for query in queries]
+        single_seconds = time.perf_counter() - start
+        single_requests, model.requests = model.requests, 0
+
+        knowledge_base.query_embedder.clear()
+        start = time.perf_counter()
+        results = knowledge_base.batch_similarity_search(queries, k=k)
+        search_seconds = time.perf_counter() - start
+        batch = results.materialize()
+        batch_seconds = time.perf_counter() - start
+
+    same = all([r["content"] for r in a] == [r["content"] for r in b] for a, b in zip(single, batch))
+    print(f"\n=== Busca em lote ({num_queries} consultas, {num_documents * chunks_per_document} chunks, "
+          f"latência {latency * 1000:.0f} ms por requisição) ===")
+    print(f"{'modo':<34} {'tempo':>10} {'consultas/s':>12} {'requisições':>12}")
+    print(f"{'similarity_search (laço)':<34} {single_seconds:>8.2f} s {num_queries / single_seconds:>12.1f} {single_requests:>12}")
+    print(f"{'batch_similarity_search (IDs)':<34} {search_seconds:>8.2f} s {num_queries / search_seconds:>12.1f} {model.requests:>12}")
+    print(f"{'batch_similarity_search + texto':<34} {batch_seconds:>8.2f} s {num_queries / batch_seconds:>12.1f} {model.requests:>12}")
+    print(f"Resultados idênticos: {'sim' if same else 'não'}")
+
+def benchmark_query_embedding(num_sessions: int = 50, queries_per_session: int = 20,
+                              distinct_queries: int = 200, latency: float = 0.2):
+    """
+    Simula sessões concorrentes fazendo perguntas (frequência decrescente por popularidade,
+    com variações de maiúsculas e espaços) e compara o embedding direto de cada consulta com
+    o QueryEmbedder (cache em memória e agrupamento de requisições).
+
+    Args:
+        num_sessions: Número de sessões (threads) concorrentes
+        queries_per_session: Consultas por sessão
+        distinct_queries: Número de perguntas distintas
+        latency: Latência simulada de cada requisição de embeddings, em segundos
+    """
+    rng = np.random.default_rng(0)
+    weights = 1.0 / np.arange(1, distinct_queries + 1)
+    picks = rng.choice(distinct_queries, size=(num_sessions, queries_per_session), p=weights / weights.sum())
+    variants = ("Qual é o assunto {}?", "qual é o  assunto {}?", "QUAL É O ASSUNTO {}? ")
+    sessions = [[variants[(i + j) % len(variants)].format(q) for j, q in enumerate(row)] for i, row in enumerate(picks)]
+
+    print(f"\n=== Embeddings de consultas ({num_sessions} sessões x {queries_per_session} consultas, "
+          f"{distinct_queries} perguntas distintas, latência {latency * 1000:.0f} ms) ===")
+    print(f"{'modo':<24} {'tempo':>10} {'requisições':>12} {'taxa de acerto':>15}")
+    for name in ("embed_query direto", "QueryEmbedder"):
+        model = _SyncLatencyEmbeddings(size=64, latency=latency)
+        embed = model.embed_query if name == "embed_query direto" else QueryEmbedder(model).embed_query
+        embedder = getattr(embed, "__self__", None)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=num_sessions) as executor:
+            list(executor.map(lambda queries: [embed(query) for query in queries], sessions))
+        elapsed = time.perf_counter() - start
+        stats = embedder.get_stats() if isinstance(embedder, QueryEmbedder) else {"hit_rate": 0.0}
+        print(f"{name:<24} {elapsed:>8.2f} s {model.requests:>12} {stats['hit_rate']:>15.1%}")
+    print(f"Tamanhos de lote (até N consultas: requisições): {stats['batch_sizes']}, "
+          f"{stats['coalesced']} consultas aproveitaram uma requisição em andamento")
+
+def _open_sessions(kb_dir: str, dimension: int, num_sessions: int, shared: bool) -> Dict[str, float]:
+    """Abre a base para várias sessões (executado em um processo novo) e mede tempo e memória."""
+    memory_before = _private_memory_mb()
+    start = time.perf_counter()
+    sessions = []
+    for _ in range(num_sessions):
+        embeddings = DeterministicFakeEmbedding(size=dimension)
+        if shared:
+            sessions.append(get_knowledge_base_service(kb_dir, embeddings=embeddings))
+        else:
+            sessions.append(KnowledgeBase(kb_path=kb_dir, embeddings=embeddings))
+    for session in sessions:
+        session.similarity_search("consulta de teste", k=3)
+    return {"seconds": time.perf_counter() - start, "private_mb": _private_memory_mb() - memory_before}
+
+def benchmark_sessions(num_documents: int, dimension: int, chunks_per_document: int = 20):
+    """
+    Compara uma KnowledgeBase por sessão com o serviço compartilhado pelo processo
+    (get_knowledge_base_service), para números crescentes de sessões, cada caso em um
+    processo novo: tempo de abertura (com uma busca por sessão) e memória privada.
+
+    Args:
+        num_documents: Número de documentos na base
+        dimension: Dimensão dos vetores
+        chunks_per_document: Chunks por documento
+    """
+    with tempfile.TemporaryDirectory() as kb_dir:
+        knowledge_base = KnowledgeBase(kb_path=kb_dir, embeddings=DeterministicFakeEmbedding(size=dimension),
+                                       index_type="flat")
+        knowledge_base.add_documents([
+            {"name": f"documento-{d}.pdf",
+             "chunks": [{"chunk_id": c, "title": f"Chunk {c}", "token_count": 20,
+                         "content": f"{TEST_TEXT[:500]} documento {d} chunk {c}"} for c in range(chunks_per_document)]}
+            for d in range(num_documents)
+        ])
+        knowledge_base.index.wait_for_merges()
+        del knowledge_base
+
+        print(f"\n=== Sessões ({num_documents * chunks_per_document} chunks, {dimension} dimensões) ===")
+        print(f"{'sessões':>8} {'modo':<22} {'abertura':>10} {'memória privada':>18}")
+        for num_sessions in (1, 10, 50):
+            for name, shared in (("uma base por sessão", False), ("serviço compartilhado", True)):
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(_open_sessions, kb_dir, dimension, num_sessions, shared).result()
+                print(f"{num_sessions:>8} {name:<22} {result['seconds']:>8.2f} s {result['private_mb']:>15.1f} MB")
+
+def _ingest_documents(kb_dir: str, dimension: int, writer: int, num_documents: int, chunks_per_document: int) -> float:
+    """Adiciona documentos à base, um save por documento, em um processo escritor; retorna o tempo."""
+    knowledge_base = KnowledgeBase(kb_path=kb_dir, embeddings=DeterministicFakeEmbedding(size=dimension),
+                                   index_type="flat")
+    start = time.perf_counter()
+    for d in range(num_documents):
+        knowledge_base.add_document(f"escritor-{writer}-documento-{d}.pdf", [
+            {"chunk_id": c, "title": f"Chunk {c}", "token_count": 20,
+             "content": f"escritor {writer} documento {d} chunk {c}"} for c in range(chunks_per_document)
+        ])
+    return time.perf_counter() - start
+
+def benchmark_writers(num_documents: int, dimension: int, chunks_per_document: int = 20):
+    """
+    Ingestão com vários processos escritores na mesma base (lock de arquivo e log de escrita):
+    tempo total, documentos por segundo e verificação da consistência final entre o banco e o
+    índice (documentos, chunks sem IDs repetidos e todos os vetores presentes no índice).
+
+    Args:
+        num_documents: Número total de documentos, divididos entre os escritores
+        dimension: Dimensão dos vetores
+        chunks_per_document: Chunks por documento
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"\n=== Escritores concorrentes ({num_documents} documentos x {chunks_per_document} chunks, {dimension} dimensões) ===")
+    print(f"{'escritores':>10} {'tempo':>10} {'documentos/s':>14} {'documentos':>12} {'vetores':>10} {'consistente':>12}")
+    for num_writers in (1, 2, 4):
+        per_writer = num_documents // num_writers
+        with tempfile.TemporaryDirectory() as kb_dir:
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=num_writers) as executor:
+                futures = [executor.submit(_ingest_documents, kb_dir, dimension, writer, per_writer, chunks_per_document)
+                           for writer in range(num_writers)]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - start
+
+            knowledge_base = KnowledgeBase(kb_path=kb_dir, embeddings=DeterministicFakeEmbedding(size=dimension),
+                                           index_type="flat")
+            chunk_ids = np.array([chunk_id for doc_id in knowledge_base.documents
+                                  for chunk_id in knowledge_base.docstore.chunk_ids(doc_id)], dtype=np.int64)
+            expected = per_writer * num_writers
+            consistent = (len(knowledge_base.documents) == expected
+                          and len(np.unique(chunk_ids)) == expected * chunks_per_document
+                          and knowledge_base.index.num_active == len(chunk_ids)
+                          and bool(knowledge_base.index.contains(chunk_ids).all()))
+            print(f"{num_writers:>10} {elapsed:>8.2f} s {expected / elapsed:>14.1f} {len(knowledge_base.documents):>12} "
+                  f"{knowledge_base.index.num_active:>10} {'sim' if consistent else 'NÃO':>12}")
+
+class _TopicEmbeddings(Embeddings):
+    """
+    Embeddings falsos com estrutura por documento: o vetor de "documento {d} ..." fica em torno
+    de um centro do documento, que por sua vez fica em torno do centro de um de poucos temas
+    (documentos do mesmo tema competem entre si, como em um corpus real).
+    """
+
+    def __init__(self, dimension: int, num_topics: int = 32):
+        rng = np.random.default_rng(0)
+        self.dimension = dimension
+        self.topics = rng.standard_normal((num_topics, dimension)).astype(np.float32)
+
+    def _noise(self, text: str, scale: float) -> np.ndarray:
+        return scale * np.random.default_rng(zlib.crc32(text.encode())).standard_normal(self.dimension)
+
+    def _embed(self, text: str) -> List[float]:
+        doc = int(re.search(r"documento (\d+)", text).group(1))
+        center = self.topics[doc % len(self.topics)] + self._noise(f"documento {doc}", 0.5)
+        vector = center + self._noise(text, 1.0)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def benchmark_routing(num_documents: int, dimension: int, chunks_per_document: int = 20,
+                      num_queries: int = 200, k: int = 5):
+    """
+    Compara a busca em todos os chunks com a busca roteada pelos centróides dos documentos,
+    para vários números de documentos por consulta: chunks comparados por consulta, tempo por
+    consulta e recall@k em relação à busca completa.
+
+    Args:
+        num_documents: Número de documentos na base
+        dimension: Dimensão dos vetores
+        chunks_per_document: Chunks por documento
+        num_queries: Número de consultas
+        k: Número de resultados por consulta
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = np.random.default_rng(1)
+    queries = [f"documento {d} consulta {q}" for q, d in enumerate(rng.integers(0, num_documents, num_queries))]
+    with tempfile.TemporaryDirectory() as kb_dir:
+        knowledge_base = KnowledgeBase(kb_path=kb_dir, embeddings=_TopicEmbeddings(dimension), index_type="flat")
+        for first in range(0, num_documents, 100):
+            knowledge_base.add_documents([
+                {"name": f"documento-{d}.pdf",
+                 "chunks": [{"chunk_id": c, "title": f"Chunk {c}", "token_count": 20,
+                             "content": f"documento {d} chunk {c}"} for c in range(chunks_per_document)]}
+                for d in range(first, min(first + 100, num_documents))
+            ])
+        knowledge_base.index.wait_for_merges()
+        knowledge_base.query_embedder.embed_queries(queries)
+
+        print(f"\n=== Busca roteada ({num_documents} documentos x {chunks_per_document} chunks, "
+              f"{dimension} dimensões, {num_queries} consultas, k={k}) ===")
+        print(f"{'modo':<22} {'chunks/consulta':>16} {'ms/consulta':>12} {f'recall@{k}':>10}")
+        full = None
+        for route_documents in (0, 50, 20, 10, 5):
+            start = time.perf_counter()
+            ids = np.vstack([knowledge_base.batch_similarity_search([query], k=k, route_documents=route_documents).ids
+                             for query in queries])
+            elapsed = time.perf_counter() - start
+            if full is None:
+                full = ids
+            recall = np.mean([len(set(row) & set(full_row)) / k for row, full_row in zip(ids.tolist(), full.tolist())])
+            name = "todos os chunks" if not route_documents else f"roteada ({route_documents} documentos)"
+            chunks = knowledge_base.index.num_active if not route_documents else route_documents * chunks_per_document
+            print(f"{name:<22} {chunks:>16} {elapsed / num_queries * 1000:>12.2f} {recall:>10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks da aplicação RAG")
+    parser.add_argument("benchmark", choices=["extraction", "parallel", "chunking", "embedding", "index", "quantization", "load", "ingest", "shards", "batch", "queries", "sessions", "writers", "routing"], help="Benchmark a executar")
+    parser.add_argument("--pages", type=int, default=2000, help="Número de páginas do PDF de teste")
+    parser.add_argument("--documents", type=int, default=500, help="Número de documentos (benchmarks embedding, ingest, batch, sessions, writers e routing)")
+    parser.add_argument("--vectors", type=int, default=100000, help="Número de vetores (benchmarks index, quantization, load e shards)")
+    parser.add_argument("--dim", type=int, default=256, help="Dimensão dos vetores (benchmarks index, quantization, load, ingest, shards, batch, sessions, writers e routing)")
+    parser.add_argument("--repeat", type=int, default=3, help="Número de repetições")
+    args = parser.parse_args()
+
+    if args.benchmark == "extraction":
+        benchmark_extraction(args.pages, args.repeat)
+    elif args.benchmark == "parallel":
+        benchmark_parallel_extraction(args.pages, args.repeat)
+    elif args.benchmark == "chunking":
+        benchmark_chunking(args.pages, args.repeat)
+    elif args.benchmark == "embedding":
+        benchmark_embedding(args.documents, args.repeat)
+    elif args.benchmark == "index":
+        benchmark_index(args.vectors, args.dim)
+    elif args.benchmark == "quantization":
+        benchmark_quantization(args.vectors, args.dim)
+    elif args.benchmark == "load":
+        benchmark_load(args.vectors, args.dim)
+    elif args.benchmark == "ingest":
+        benchmark_ingest(args.documents, args.dim)
+    elif args.benchmark == "shards":
+        benchmark_shards(args.vectors, args.dim)
+    elif args.benchmark == "batch":
+        benchmark_batch_search(args.documents, args.dim)
+    elif args.benchmark == "queries":
+        benchmark_query_embedding()
+    elif args.benchmark == "sessions":
+        benchmark_sessions(args.documents, args.dim)
+    elif args.benchmark == "writers":
+        benchmark_writers(args.documents, args.dim)
+    elif args.benchmark == "routing":
+        benchmark_routing(args.documents, args.dim)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import os
+import json
+import mmap
+import logging
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Formato do arquivo: cabeçalho (assinatura, próximo ID, número de chunks, posição da tabela),
+# registros JSON em UTF-8 e, no fim, a tabela (ID, posição, tamanho) ordenada por ID
+MAGIC = b"KBCHUNK1"
+HEADER_SIZE = 32
+
+def save_chunks(path: str, chunks: Dict[int, Dict[str, Any]], next_id: int):
+    """
+    Grava os chunks em um único arquivo, substituído atomicamente.
+
+    Args:
+        path: Caminho do arquivo
+        chunks: Conteúdo e metadados de cada chunk, pelo ID
+        next_id: Próximo ID de chunk a atribuir
+    """
+    ids = sorted(chunks)
+    table = np.empty((len(ids), 3), dtype=np.int64)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(bytes(HEADER_SIZE))
+        offset = HEADER_SIZE
+        for row, chunk_id in enumerate(ids):
+            record = json.dumps(chunks[chunk_id], ensure_ascii=False).encode("utf-8")
+            f.write(record)
+            table[row] = (chunk_id, offset, len(record))
+            offset += len(record)
+        f.write(table.tobytes())
+        f.seek(0)
+        f.write(MAGIC + np.array([next_id, len(ids), offset], dtype=np.int64).tobytes())
+    os.replace(tmp_path, path)
+
+class MappedChunks(Mapping):
+    """
+    Chunks de um arquivo gravado por save_chunks, lidos por mapeamento em memória.
+
+    Abrir o arquivo não lê os registros: cada acesso decodifica apenas o chunk pedido, e
+    processos que abrem o mesmo arquivo compartilham as páginas do cache do sistema.
+    Somente leitura.
+    """
+
+    def __init__(self, path: str):
+        """
+        Abre o arquivo de chunks.
+
+        Args:
+            path: Caminho do arquivo
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Arquivo de chunks inválido: {path}")
+        self.next_id, count, table_offset = np.frombuffer(self._map, dtype=np.int64, count=3, offset=len(MAGIC)).tolist()
+        self._table = np.frombuffer(self._map, dtype=np.int64, count=count * 3, offset=table_offset).reshape(count, 3)
+
+    def _row(self, chunk_id: Any) -> int:
+        """Posição do chunk na tabela, ou -1 se não existir."""
+        if not isinstance(chunk_id, (int, np.integer)):
+            return -1
+        row = int(np.searchsorted(self._table[:, 0], chunk_id))
+        return row if row < len(self._table) and self._table[row, 0] == chunk_id else -1
+
+    def __getitem__(self, chunk_id: int) -> Dict[str, Any]:
+        row = self._row(chunk_id)
+        if row < 0:
+            raise KeyError(chunk_id)
+        _, offset, length = self._table[row].tolist()
+        return json.loads(self._map[offset:offset + length].decode("utf-8"))
+
+    def __contains__(self, chunk_id: Any) -> bool:
+        return self._row(chunk_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._table[:, 0].tolist())
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+def load_chunks(path: str) -> Tuple[Dict[int, Dict[str, Any]], int]:
+    """
+    Lê todos os chunks de um arquivo gravado por save_chunks para um dicionário editável.
+
+    Args:
+        path: Caminho do arquivo
+
+    Returns:
+        Tupla (chunks pelo ID, próximo ID de chunk)
+    """
+    mapped = MappedChunks(path)
+    return dict(mapped.items()), mapped.next_id
@@ -1,19 +1,11 @@
 import os
+import sys
 import tempfile
 import logging
 from datetime import datetime
 
-# Criar um arquivo PDF simples para testes
-def create_test_pdf():
-    try:
-        import fitz  # PyMuPDF
-        
-        # Criar um novo documento PDF
-        doc = fitz.open()
-        page = doc.new_page()
-        
-        # Adicionar texto ao PDF
-        text = """
+# Texto base usado em cada página do PDF de teste
+TEST_TEXT = """
         # Documento de Teste para Aplicação RAG
         
         ## Introdução
@@ -42,13 +34,36 @@ def create_test_pdf():
         Streamlit é uma biblioteca Python que facilita a criação de aplicações web interativas. 
         É ideal para criar interfaces para aplicações de machine learning e processamento de dados.
         """
+
+# Criar um arquivo PDF simples para testes
+def create_test_pdf(output_path: str = "test.pdf", num_pages: int = 1):
+    """
+    Cria um PDF de teste.
+    
+    Args:
+        output_path: Caminho do arquivo PDF a ser criado
+        num_pages: Número de páginas (documentos grandes são úteis para benchmarks)
+    """
+    try:
+        import fitz  # PyMuPDF
+        
+        # Criar um novo documento PDF
+        doc = fitz.open()
         
-        # Inserir texto na página
-        rect = fitz.Rect(50, 50, 550, 800)
-        page.insert_text(rect.tl, text, fontsize=11)
+        for page_num in range(num_pages):
+            page = doc.new_page()
+            
+            # Adicionar texto ao PDF
+            text = TEST_TEXT
+            if num_pages > 1:
+                text = f"\n        Página {page_num + 1} de {num_pages}\n" + text
+            
+            # Inserir texto na página
+            rect = fitz.Rect(50, 50, 550, 800)
+            page.insert_text(rect.tl, text, fontsize=11)
         
         # Salvar o PDF
-        doc.save("test.pdf")
+        doc.save(output_path)
         doc.close()
         
         print("Arquivo PDF de teste criado com sucesso!")
@@ -58,4 +73,7 @@ def create_test_pdf():
         return False
 
 if __name__ == "__main__":
-    create_test_pdf()
+    # Uso: python create_test_pdf.py [arquivo_saida] [numero_de_paginas]
+    output_path = sys.argv[1] if len(sys.argv) > 1 else "test.pdf"
+    num_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    create_test_pdf(output_path, num_pages)
@@ -0,0 +1,115 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class DocumentRouter:
+    """
+    Índice dos documentos pelo centróide (média) dos vetores dos seus chunks.
+
+    Usado na primeira etapa da busca roteada: as consultas são comparadas com um vetor por
+    documento (distância L2, como no índice de chunks), e apenas os chunks dos documentos
+    mais próximos são buscados na segunda etapa. Os centróides ficam em uma matriz em
+    memória, atualizada a cada documento adicionado, substituído ou removido.
+    """
+
+    def __init__(self, dimension: Optional[int] = None):
+        """
+        Args:
+            dimension: Dimensão dos vetores (definida pelo primeiro centróide, se omitida)
+        """
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        self._doc_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._centroids = np.empty((0, dimension or 0), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._positions
+
+    def set(self, doc_id: str, centroid: np.ndarray):
+        """
+        Adiciona ou substitui o centróide de um documento.
+
+        Args:
+            doc_id: ID do documento
+            centroid: Média dos vetores dos chunks do documento
+        """
+        centroid = np.asarray(centroid, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = len(centroid)
+                self._centroids = np.empty((0, self.dimension), dtype=np.float32)
+            position = self._positions.get(doc_id)
+            if position is None:
+                position = self._positions[doc_id] = len(self._doc_ids)
+                self._doc_ids.append(doc_id)
+                if position == len(self._centroids):
+                    # Capacidade dobrada: adições em tempo amortizado constante
+                    capacity = max(2 * len(self._centroids), 16)
+                    centroids = np.empty((capacity, self.dimension), dtype=np.float32)
+                    centroids[:position] = self._centroids
+                    norms = np.empty(capacity, dtype=np.float32)
+                    norms[:position] = self._norms
+                    self._centroids, self._norms = centroids, norms
+            self._centroids[position] = centroid
+            self._norms[position] = centroid @ centroid
+
+    def remove(self, doc_id: str):
+        """Remove o centróide de um documento (a última linha ocupa a sua posição)."""
+        with self._lock:
+            position = self._positions.pop(doc_id, None)
+            if position is None:
+                return
+            last = len(self._doc_ids) - 1
+            if position != last:
+                moved = self._doc_ids[last]
+                self._doc_ids[position] = moved
+                self._positions[moved] = position
+                self._centroids[position] = self._centroids[last]
+                self._norms[position] = self._norms[last]
+            self._doc_ids.pop()
+
+    def route(self, queries: np.ndarray, num_documents: int,
+              doc_ids: Optional[Iterable[str]] = None) -> List[List[str]]:
+        """
+        Escolhe, para cada consulta, os documentos de centróide mais próximo.
+
+        Args:
+            queries: Matriz (n, dimensão) de consultas
+            num_documents: Número de documentos por consulta
+            doc_ids: Documentos candidatos (padrão: todos)
+
+        Returns:
+            Lista, por consulta, dos IDs dos documentos escolhidos, do mais próximo ao mais distante
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        with self._lock:
+            count = len(self._doc_ids)
+            if doc_ids is None:
+                positions = np.arange(count)
+            else:
+                positions = np.array([self._positions[doc_id] for doc_id in doc_ids if doc_id in self._positions],
+                                     dtype=np.int64)
+            if not len(positions):
+                return [[] for _ in range(len(queries))]
+            # |q - c|² sem o termo |q|², constante por consulta
+            distances = self._norms[positions] - 2 * (queries @ self._centroids[positions].T)
+            candidate_ids = [self._doc_ids[position] for position in positions.tolist()]
+
+        m = min(num_documents, len(positions))
+        if m < len(positions):
+            top = np.argpartition(distances, m - 1, axis=1)[:, :m]
+        else:
+            top = np.broadcast_to(np.arange(m), (len(queries), m))
+        order = np.take_along_axis(top, np.argsort(np.take_along_axis(distances, top, axis=1), axis=1), axis=1)
+        return [[candidate_ids[i] for i in row] for row in order.tolist()]
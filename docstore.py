@@ -0,0 +1,285 @@
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Limite de parâmetros por consulta SQL ao buscar vários IDs de uma vez
+_LOOKUP_BATCH_SIZE = 500
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents ("
+    "doc_id TEXT PRIMARY KEY, name TEXT NOT NULL, added_at TEXT, updated_at TEXT, info TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS chunks ("
+    "chunk_id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, position INTEGER NOT NULL, "
+    "page_start INTEGER, page_end INTEGER, hash BLOB NOT NULL, content TEXT NOT NULL, metadata TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id, position)",
+    "CREATE INDEX IF NOT EXISTS chunks_page ON chunks (doc_id, page_start, page_end)",
+    "CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (hash)",
+    "CREATE TABLE IF NOT EXISTS properties (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS centroids (doc_id TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+)
+
+def _text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).digest()
+
+class DocStore:
+    """
+    Documentos e chunks da base de conhecimento em SQLite (modo WAL).
+
+    Cada chunk é uma linha com colunas indexadas (documento, ID, páginas, hash do texto); o
+    texto só é lido quando pedido, de modo que uma busca obtém do índice apenas IDs e scores
+    e materializa o conteúdo dos resultados finais. Alterações gravam apenas as linhas
+    afetadas e ficam pendentes até commit(), que as aplica em uma única transação.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        """
+        Abre (ou cria) o banco.
+
+        Args:
+            path: Caminho do arquivo SQLite
+            read_only: Abrir o banco somente para leitura; se o arquivo não existir, o
+                armazenamento fica vazio
+        """
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._conn = None
+        if read_only:
+            if os.path.exists(path):
+                self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+        """Executa uma consulta e retorna todas as linhas (nenhuma se o banco não existe)."""
+        if self._conn is None:
+            return []
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def _write(self, sql: str, rows: List[Tuple]):
+        """Executa uma alteração para cada linha, dentro da transação pendente."""
+        if self.read_only:
+            raise RuntimeError("Armazenamento aberto em modo somente leitura")
+        if rows:
+            with self._lock:
+                self._conn.executemany(sql, rows)
+
+    def commit(self):
+        """Aplica as alterações pendentes."""
+        if self._conn is not None and not self.read_only:
+            with self._lock:
+                self._conn.commit()
+
+    def rollback(self):
+        """Descarta as alterações pendentes."""
+        if self._conn is not None and not self.read_only:
+            with self._lock:
+                self._conn.rollback()
+
+    def close(self):
+        """Fecha a conexão com o banco."""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def load_documents(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Lê os registros de todos os documentos.
+
+        Returns:
+            Dicionário com as informações de cada documento, pelo ID
+        """
+        return {doc_id: json.loads(info) for doc_id, info in self._query("SELECT doc_id, info FROM documents")}
+
+    def put_document(self, doc_id: str, doc_info: Dict[str, Any]):
+        """
+        Grava (ou substitui) o registro de um documento.
+
+        Args:
+            doc_id: ID do documento
+            doc_info: Informações do documento (nome, datas e metadados adicionais)
+        """
+        self._write(
+            "INSERT OR REPLACE INTO documents (doc_id, name, added_at, updated_at, info) VALUES (?, ?, ?, ?, ?)",
+            [(doc_id, doc_info["name"], doc_info.get("added_at"), doc_info.get("updated_at"),
+              json.dumps(doc_info, ensure_ascii=False))]
+        )
+
+    def delete_document(self, doc_id: str):
+        """
+        Remove o registro de um documento e todos os seus chunks.
+
+        Args:
+            doc_id: ID do documento
+        """
+        self._write("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,)])
+        self._write("DELETE FROM centroids WHERE doc_id = ?", [(doc_id,)])
+        self._write("DELETE FROM documents WHERE doc_id = ?", [(doc_id,)])
+
+    def put_centroid(self, doc_id: str, vector: np.ndarray):
+        """
+        Grava (ou substitui) o centróide dos vetores dos chunks de um documento.
+
+        Args:
+            doc_id: ID do documento
+            vector: Centróide (float32)
+        """
+        self._write("INSERT OR REPLACE INTO centroids (doc_id, vector) VALUES (?, ?)",
+                    [(doc_id, np.asarray(vector, dtype=np.float32).tobytes())])
+
+    def load_centroids(self) -> Dict[str, np.ndarray]:
+        """
+        Lê os centróides de todos os documentos.
+
+        Returns:
+            Centróide (float32) de cada documento, pelo ID; vazio em bancos criados antes da
+            tabela de centróides abertos somente para leitura
+        """
+        try:
+            rows = self._query("SELECT doc_id, vector FROM centroids")
+        except sqlite3.OperationalError:
+            return {}
+        return {doc_id: np.frombuffer(vector, dtype=np.float32) for doc_id, vector in rows}
+
+    def put_chunks(self, chunks: List[Tuple[int, str, Dict[str, Any]]]):
+        """
+        Grava (ou substitui) chunks.
+
+        Args:
+            chunks: Tuplas (ID do chunk, texto, metadados); o documento, a posição no documento
+                e as páginas são lidos dos metadados ("doc_id", "chunk_id", "page_start", "page_end")
+        """
+        self._write(
+            "INSERT OR REPLACE INTO chunks (chunk_id, doc_id, position, page_start, page_end, hash, content, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(chunk_id, metadata["doc_id"], metadata.get("chunk_id", 0), metadata.get("page_start"),
+              metadata.get("page_end"), _text_hash(content), content, json.dumps(metadata, ensure_ascii=False))
+             for chunk_id, content, metadata in chunks]
+        )
+
+    def update_chunk_metadata(self, chunks: List[Tuple[int, Dict[str, Any]]]):
+        """
+        Atualiza os metadados de chunks existentes, sem regravar o texto.
+
+        Args:
+            chunks: Tuplas (ID do chunk, novos metadados)
+        """
+        self._write(
+            "UPDATE chunks SET position = ?, page_start = ?, page_end = ?, metadata = ? WHERE chunk_id = ?",
+            [(metadata.get("chunk_id", 0), metadata.get("page_start"), metadata.get("page_end"),
+              json.dumps(metadata, ensure_ascii=False), chunk_id) for chunk_id, metadata in chunks]
+        )
+
+    def delete_chunks(self, chunk_ids: List[int]):
+        """
+        Remove chunks pelos IDs.
+
+        Args:
+            chunk_ids: IDs dos chunks
+        """
+        self._write("DELETE FROM chunks WHERE chunk_id = ?", [(int(chunk_id),) for chunk_id in chunk_ids])
+
+    def _page_clause(self, pages: Optional[Tuple[Optional[int], Optional[int]]]) -> Tuple[str, List[Any]]:
+        """Condição SQL para chunks que tocam um intervalo de páginas (mínimo, máximo)."""
+        if pages is None:
+            return "", []
+        low, high = pages
+        clause, params = " AND page_start IS NOT NULL", []
+        if high is not None:
+            clause += " AND page_start <= ?"
+            params.append(high)
+        if low is not None:
+            clause += " AND page_end >= ?"
+            params.append(low)
+        return clause, params
+
+    def chunk_ids(self, doc_id: str, pages: Optional[Tuple[Optional[int], Optional[int]]] = None) -> List[int]:
+        """
+        Retorna os IDs dos chunks de um documento, na ordem do texto.
+
+        Args:
+            doc_id: ID do documento
+            pages: Intervalo (mínimo, máximo) de páginas que os chunks devem tocar, com None
+                para limite aberto (opcional)
+
+        Returns:
+            Lista de IDs
+        """
+        clause, params = self._page_clause(pages)
+        rows = self._query(f"SELECT chunk_id FROM chunks WHERE doc_id = ?{clause} ORDER BY position",
+                           [doc_id, *params])
+        return [chunk_id for chunk_id, in rows]
+
+    def chunk_metadata(self, doc_id: str,
+                       pages: Optional[Tuple[Optional[int], Optional[int]]] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Retorna os metadados dos chunks de um documento (sem o texto), na ordem do texto.
+
+        Args:
+            doc_id: ID do documento
+            pages: Intervalo de páginas que os chunks devem tocar (ver chunk_ids)
+
+        Returns:
+            Lista de tuplas (ID do chunk, metadados)
+        """
+        clause, params = self._page_clause(pages)
+        rows = self._query(f"SELECT chunk_id, metadata FROM chunks WHERE doc_id = ?{clause} ORDER BY position",
+                           [doc_id, *params])
+        return [(chunk_id, json.loads(metadata)) for chunk_id, metadata in rows]
+
+    def get_chunks(self, chunk_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Lê o texto e os metadados de chunks pelos IDs.
+
+        Args:
+            chunk_ids: IDs dos chunks
+
+        Returns:
+            Dicionário {"content", "metadata"} pelo ID, apenas para os IDs existentes
+        """
+        found = {}
+        unique = list(dict.fromkeys(int(chunk_id) for chunk_id in chunk_ids))
+        for i in range(0, len(unique), _LOOKUP_BATCH_SIZE):
+            batch = unique[i:i + _LOOKUP_BATCH_SIZE]
+            rows = self._query(
+                f"SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for chunk_id, content, metadata in rows:
+                found[chunk_id] = {"content": content, "metadata": json.loads(metadata)}
+        return found
+
+    def count_chunks(self) -> int:
+        """Número de chunks armazenados."""
+        rows = self._query("SELECT COUNT(*) FROM chunks")
+        return rows[0][0] if rows else 0
+
+    def all_chunk_ids(self) -> List[int]:
+        """IDs de todos os chunks armazenados, em ordem crescente."""
+        return [chunk_id for chunk_id, in self._query("SELECT chunk_id FROM chunks ORDER BY chunk_id")]
+
+    def get_property(self, key: str, default: int = 0) -> int:
+        """Lê uma propriedade inteira da base (ex.: próximo ID de chunk)."""
+        rows = self._query("SELECT value FROM properties WHERE key = ?", [key])
+        return rows[0][0] if rows else default
+
+    def set_property(self, key: str, value: int):
+        """Grava uma propriedade inteira da base, dentro da transação pendente."""
+        self._write("INSERT OR REPLACE INTO properties (key, value) VALUES (?, ?)", [(key, int(value))])
@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Caminho padrão do cache para quem não tem um diretório próprio (ex.: VectorStore)
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+
+# Limite de parâmetros por consulta SQL ao buscar vários hashes de uma vez
+_LOOKUP_BATCH_SIZE = 500
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings com cache persistente em SQLite, na frente de outro modelo de embeddings.
+
+    Cada vetor é armazenado como blob float32 com a chave (modelo, dimensões, SHA-256 do
+    texto), de modo que um texto já processado nunca é enviado novamente à API, inclusive
+    em reenvios de documentos e reconstruções do índice.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_path: str = DEFAULT_CACHE_PATH,
+                 model_name: Optional[str] = None, dimensions: Optional[int] = None):
+        """
+        Inicializa o cache de embeddings.
+
+        Args:
+            embeddings: Modelo de embeddings usado para os textos fora do cache
+            cache_path: Caminho do arquivo SQLite do cache
+            model_name: Nome do modelo na chave (padrão: atributo "model" do modelo)
+            dimensions: Dimensões na chave (padrão: atributo "dimensions" do modelo; 0 = padrão do modelo)
+        """
+        self.embeddings = embeddings
+        self.cache_path = cache_path
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.dimensions = dimensions if dimensions is not None else (getattr(embeddings, "dimensions", None) or 0)
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, dimensions INTEGER NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, dimensions, text_hash)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+        self.api_calls_saved = 0
+        logger.info(f"CachedEmbeddings inicializado em {cache_path} para o modelo {self.model_name}")
+
+    @property
+    def model(self) -> str:
+        """Nome do modelo de embeddings encapsulado."""
+        return self.model_name
+
+    @staticmethod
+    def _hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).digest()
+
+    def _lookup(self, hashes: List[bytes]) -> Dict[bytes, List[float]]:
+        """Busca no cache os vetores de uma lista de hashes."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique), _LOOKUP_BATCH_SIZE):
+                batch = unique[i:i + _LOOKUP_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND dimensions = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [self.model_name, self.dimensions, *batch]
+                )
+                for text_hash, vector in rows:
+                    found[text_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, items: List[Tuple[bytes, List[float]]]):
+        """Grava vetores no cache como blobs float32."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dimensions, text_hash, vector) VALUES (?, ?, ?, ?)",
+                [(self.model_name, self.dimensions, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                 for text_hash, vector in items]
+            )
+            self._conn.commit()
+
+    def _split(self, texts: List[str]) -> Tuple[List[bytes], Dict[bytes, List[float]], List[str], List[bytes]]:
+        """Separa os textos em acertos do cache e textos únicos que precisam de embedding."""
+        hashes = [self._hash(text) for text in texts]
+        found = self._lookup(hashes)
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+            if missing:
+                self.api_calls += 1
+            elif texts:
+                self.api_calls_saved += 1
+        return hashes, found, list(missing.values()), list(missing.keys())
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera embeddings para uma lista de textos, enviando à API apenas os que não estão no cache.
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Lista de vetores, na mesma ordem dos textos
+        """
+        hashes, found, missing_texts, missing_hashes = self._split(texts)
+        if missing_texts:
+            vectors = self.embeddings.embed_documents(missing_texts)
+            self._store(list(zip(missing_hashes, vectors)))
+            found.update(zip(missing_hashes, vectors))
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Gera o embedding de uma consulta pelo modelo encapsulado, sem o cache: o cache guarda
+        vetores de documentos, e um modelo pode gerar vetores diferentes para consultas (as
+        consultas têm cache próprio, em query_embedding.py).
+
+        Args:
+            text: Texto da consulta
+
+        Returns:
+            Vetor da consulta
+        """
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings de várias consultas pelo modelo encapsulado (ver embed_query), em
+        uma requisição se o modelo agrupar consultas.
+
+        Args:
+            texts: Textos das consultas
+
+        Returns:
+            Lista de vetores, na mesma ordem dos textos
+        """
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(texts)
+        return [self.embeddings.embed_query(text) for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Versão assíncrona de embed_documents."""
+        hashes, found, missing_texts, missing_hashes = self._split(texts)
+        if missing_texts:
+            vectors = await self.embeddings.aembed_documents(missing_texts)
+            self._store(list(zip(missing_hashes, vectors)))
+            found.update(zip(missing_hashes, vectors))
+        return [found[text_hash] for text_hash in hashes]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Versão assíncrona de embed_query."""
+        return await self.embeddings.aembed_query(text)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna as estatísticas do cache.
+
+        Returns:
+            Dicionário com acertos, erros, taxa de acerto, chamadas à API feitas e evitadas,
+            entradas e bytes armazenados
+        """
+        with self._lock:
+            entries, bytes_stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? AND dimensions = ?",
+                (self.model_name, self.dimensions)
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "api_calls": self.api_calls,
+                "api_calls_saved": self.api_calls_saved,
+                "entries": entries,
+                "bytes_stored": bytes_stored
+            }
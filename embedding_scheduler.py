@@ -0,0 +1,235 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from tokenizer_service import get_tokenizer
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Limites padrão das requisições de embedding
+DEFAULT_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "1000"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+
+class _RateLimiter:
+    """
+    Limite de uso por janela deslizante de um minuto.
+
+    O estado é protegido por um lock de thread (e não do asyncio), de modo que o mesmo
+    limite vale para todas as chamadas do agendador, mesmo em loops de eventos diferentes.
+    """
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._window = deque()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    async def acquire(self, amount: int = 1) -> float:
+        """
+        Aguarda até que a quantidade caiba na janela do último minuto.
+
+        Returns:
+            Tempo de espera, em segundos
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        # Uma requisição maior que o limite inteiro espera a janela esvaziar
+        amount = min(amount, self.per_minute)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and self._window[0][0] <= now - 60:
+                    self._used -= self._window.popleft()[1]
+                if self._used + amount <= self.per_minute:
+                    self._window.append((now, amount))
+                    self._used += amount
+                    return waited
+                delay = self._window[0][0] + 60 - now
+            await asyncio.sleep(delay)
+            waited += delay
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Agendador assíncrono de requisições de embedding.
+
+    Os textos recebidos (de um ou de vários documentos) são agrupados em lotes limitados
+    por número de tokens e de textos; os lotes são enviados com um número configurável de
+    requisições simultâneas, respeitando os limites de requisições e de tokens por minuto.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_tokens: int = DEFAULT_BATCH_TOKENS,
+                 max_batch_size: int = DEFAULT_BATCH_SIZE, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE,
+                 encoding_name: str = "cl100k_base", queries_as_documents: bool = False):
+        """
+        Inicializa o agendador.
+
+        Args:
+            embeddings: Modelo de embeddings que atende as requisições
+            max_batch_tokens: Número máximo de tokens por requisição
+            max_batch_size: Número máximo de textos por requisição
+            max_concurrency: Número máximo de requisições simultâneas
+            requests_per_minute: Limite de requisições por minuto (0 = sem limite)
+            tokens_per_minute: Limite de tokens por minuto (0 = sem limite)
+            encoding_name: Encoding do tiktoken usado para contar os tokens dos textos
+            queries_as_documents: O modelo gera o mesmo vetor para uma consulta e para um
+                documento com o mesmo texto, de modo que várias consultas podem ser enviadas
+                em lotes, como documentos
+        """
+        self.embeddings = embeddings
+        self.queries_as_documents = queries_as_documents
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.encoding_name = encoding_name
+
+        self._request_limiter = _RateLimiter(requests_per_minute)
+        self._token_limiter = _RateLimiter(tokens_per_minute)
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "tokens": 0, "seconds": 0.0, "rate_limit_wait_seconds": 0.0}
+
+    @property
+    def model(self) -> Optional[str]:
+        """Nome do modelo de embeddings encapsulado (usado na chave do cache de embeddings)."""
+        return getattr(self.embeddings, "model", None)
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        """Dimensões do modelo de embeddings encapsulado."""
+        return getattr(self.embeddings, "dimensions", None)
+
+    def make_batches(self, token_counts: List[int]) -> List[List[int]]:
+        """
+        Agrupa textos, na ordem recebida, em lotes limitados por tokens e por número de textos.
+
+        Args:
+            token_counts: Número de tokens de cada texto
+
+        Returns:
+            Lista de lotes, cada um com os índices dos textos que o compõem
+        """
+        batches = []
+        batch, batch_tokens = [], 0
+        for i, count in enumerate(token_counts):
+            if batch and (batch_tokens + count > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += count
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _embed_batch(self, texts: List[str], tokens: int, semaphore: asyncio.Semaphore) -> List[List[float]]:
+        """Envia um lote depois de obter uma vaga de concorrência e cota nos limites por minuto."""
+        async with semaphore:
+            waited = await self._request_limiter.acquire(1)
+            waited += await self._token_limiter.acquire(tokens)
+            start = time.perf_counter()
+            vectors = await self.embeddings.aembed_documents(texts)
+            elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["texts"] += len(texts)
+            self._stats["tokens"] += tokens
+            self._stats["seconds"] += elapsed
+            self._stats["rate_limit_wait_seconds"] += waited
+        logger.debug(f"Lote de embeddings: {len(texts)} textos, {tokens} tokens em {elapsed * 1000:.1f} ms")
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera embeddings para uma lista de textos, enviando os lotes de forma concorrente.
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Lista de vetores, na mesma ordem dos textos
+        """
+        if not texts:
+            return []
+        token_counts = get_tokenizer(self.encoding_name).count_tokens_batch(texts)
+        batches = self.make_batches(token_counts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            self._embed_batch([texts[i] for i in batch], sum(token_counts[i] for i in batch), semaphore)
+            for batch in batches
+        ])
+        logger.info(f"Embeddings gerados para {len(texts)} textos em {len(batches)} requisições "
+                    f"({time.perf_counter() - start:.2f} s)")
+
+        vectors = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Versão síncrona de aembed_documents.
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Lista de vetores, na mesma ordem dos textos
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed_documents(texts))
+        # Chamado de dentro de um loop de eventos: executar o agendador em outra thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aembed_documents(texts)).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Gera o embedding de uma consulta (sem passar pelos lotes)."""
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Versão assíncrona de embed_query."""
+        return await self.embeddings.aembed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings de várias consultas: em lotes, se o modelo trata consultas como
+        documentos (queries_as_documents), ou uma a uma pelo embed_query do modelo.
+
+        Args:
+            texts: Textos das consultas
+
+        Returns:
+            Lista de vetores, na mesma ordem dos textos
+        """
+        if self.queries_as_documents:
+            return self.embed_documents(texts)
+        return [self.embeddings.embed_query(text) for text in texts]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna as estatísticas do agendador.
+
+        Returns:
+            Dicionário com requisições, textos e tokens enviados, tempo de requisição e
+            tempo de espera pelos limites por minuto
+        """
+        with self._stats_lock:
+            return dict(self._stats)
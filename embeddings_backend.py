@@ -0,0 +1,138 @@
+import os
+import re
+import zlib
+import logging
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from embedding_cache import CachedEmbeddings, DEFAULT_CACHE_PATH
+from embedding_scheduler import EmbeddingScheduler
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Backend de embeddings padrão ("openai" ou "hashing")
+DEFAULT_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+# Mesma dimensionalidade do text-embedding-3-small
+DEFAULT_DIMENSIONS = 1536
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings locais e determinísticos por feature hashing, sem acesso à rede.
+
+    Cada texto é representado pelas suas palavras e pares de palavras consecutivas; cada
+    feature é mapeada por CRC32 para uma dimensão e um sinal, e o vetor resultante é
+    normalizado. Textos com vocabulário em comum ficam próximos, o que basta para testes,
+    benchmarks e ambientes sem acesso à API, mas não substitui um modelo semântico.
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS):
+        """
+        Inicializa o embedder local.
+
+        Args:
+            dimensions: Número de dimensões dos vetores
+        """
+        self.dimensions = dimensions
+        self.model = f"hashing-{dimensions}"
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD_RE.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera embeddings para uma lista de textos.
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Lista de vetores normalizados, na mesma ordem dos textos
+        """
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            rows.extend([row] * len(features))
+            hashes.extend(map(_feature_hash, features))
+
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        if hashes:
+            hashes = np.asarray(hashes, dtype=np.uint32)
+            # Bit mais alto define o sinal; o restante, a dimensão
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            cells = np.asarray(rows, dtype=np.int64) * self.dimensions + (hashes & 0x7FFFFFFF) % self.dimensions
+            vectors += np.bincount(cells, weights=signs, minlength=vectors.size).reshape(vectors.shape)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Gera o embedding de uma consulta.
+
+        Args:
+            text: Texto da consulta
+
+        Returns:
+            Vetor normalizado da consulta
+        """
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings de várias consultas (iguais aos de documentos com o mesmo texto).
+
+        Args:
+            texts: Textos das consultas
+
+        Returns:
+            Lista de vetores normalizados, na mesma ordem dos textos
+        """
+        return self.embed_documents(texts)
+
+@lru_cache(maxsize=1 << 18)
+def _feature_hash(feature: str) -> int:
+    """Hash estável (independente de PYTHONHASHSEED) de uma feature."""
+    return zlib.crc32(feature.encode("utf-8"))
+
+def create_embeddings(backend: Optional[str] = None, openai_api_key: Optional[str] = None,
+                      cache_path: str = DEFAULT_CACHE_PATH) -> Embeddings:
+    """
+    Cria o backend de embeddings configurado.
+
+    Args:
+        backend: "openai" (text-embedding-3-small com agendador e cache em disco) ou
+            "hashing" (local, sem rede); padrão: variável de ambiente EMBEDDING_BACKEND
+        openai_api_key: Chave de API da OpenAI (usada apenas pelo backend "openai")
+        cache_path: Caminho do cache de embeddings do backend "openai"
+
+    Returns:
+        Instância de Embeddings
+    """
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend == "hashing":
+        logger.info(f"Backend de embeddings local (feature hashing, {DEFAULT_DIMENSIONS} dimensões)")
+        return HashingEmbeddings()
+    if backend != "openai":
+        raise ValueError(f"Backend de embeddings desconhecido: {backend}")
+
+    # Chunks já vistos não são enviados novamente à API; os demais são agrupados
+    # em lotes concorrentes pelo agendador. Os modelos de embeddings da OpenAI geram o
+    # mesmo vetor para consultas e documentos, então consultas também podem ir em lotes
+    return CachedEmbeddings(
+        EmbeddingScheduler(OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            openai_api_key=openai_api_key
+        ), queries_as_documents=True),
+        cache_path=cache_path
+    )
@@ -0,0 +1,1068 @@
+import os
+import math
+import logging
+import threading
+from typing import Callable, Iterable, Optional, Tuple, Union
+
+import numpy as np
+import faiss
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Até este número de IDs selecionados, a busca filtrada compara a consulta diretamente com os
+# vetores selecionados, em tempo proporcional à seleção
+BRUTE_FORCE_MAX_IDS = int(os.getenv("SEARCH_BRUTE_FORCE_MAX_IDS", "20000"))
+
+# Tipo de índice: "flat", "ivf_flat", "ivf_pq", "hnsw" ou "auto" (escolhido pelo número de vetores)
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+DEFAULT_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+
+# Parâmetros de busca dos índices aproximados
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+# Limites do modo "auto": abaixo do primeiro, busca exata; a partir do segundo, vetores comprimidos (PQ)
+AUTO_IVF_MIN_VECTORS = int(os.getenv("FAISS_AUTO_IVF_MIN_VECTORS", "50000"))
+AUTO_PQ_MIN_VECTORS = int(os.getenv("FAISS_AUTO_PQ_MIN_VECTORS", "1000000"))
+
+# Número mínimo de vetores para treinar cada tipo; até lá, o índice permanece exato
+MIN_TRAINING_VECTORS = {"flat": 0, "hnsw": 0, "ivf_flat": 1000, "ivf_pq": 10000}
+
+# Codificação dos vetores no índice: "none" (float32), "fp16" (2 bytes por dimensão),
+# "sq8" (1 byte por dimensão) ou "pq" (product quantization, dimensão / 16 bytes por vetor)
+QUANTIZATIONS = ("none", "fp16", "sq8", "pq")
+DEFAULT_QUANTIZATION = os.getenv("FAISS_QUANTIZATION", "none")
+
+# Número mínimo de vetores para treinar cada codificação
+MIN_QUANTIZATION_VECTORS = {"none": 0, "fp16": 0, "sq8": 1000, "pq": 10000}
+
+# Com codificação com perdas, buscar k * fator candidatos e reordená-los pelas distâncias
+# exatas calculadas com os vetores completos em disco (0 = sem reordenação)
+DEFAULT_RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", "4"))
+
+_SCALAR_QUANTIZERS = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+# Ordem de migração entre tipos: o índice só migra para tipos de posição igual ou maior
+_KIND_RANK = {"flat": 0, "hnsw": 1, "ivf_flat": 1, "ivf_pq": 2}
+
+# Número de vizinhos por nó do HNSW e tamanho dos lotes na reconstrução de um índice
+HNSW_M = 32
+REBUILD_BATCH_SIZE = 65536
+
+# Linhas do arquivo de vetores comparadas por vez na busca exata sobre o arquivo mapeado
+MAPPED_SEARCH_BLOCK_ROWS = 8192
+
+# Cabeçalho do arquivo de vetores compactado: marcador (um NaN em float32, que não ocorre nos
+# vetores dos arquivos não compactados), versão, limite da compactação e número de IDs compactados
+_VECTOR_FILE_MAGIC = b"VF\xc0\x7f" + (1).to_bytes(4, "little")
+_VECTOR_FILE_HEADER_BYTES = len(_VECTOR_FILE_MAGIC) + 16
+
+def choose_index_type(num_vectors: int) -> str:
+    """
+    Escolhe o tipo de índice para um número de vetores (modo "auto").
+
+    Args:
+        num_vectors: Número de vetores do índice
+
+    Returns:
+        "flat", "ivf_flat" ou "ivf_pq"
+    """
+    if num_vectors >= AUTO_PQ_MIN_VECTORS:
+        return "ivf_pq"
+    if num_vectors >= AUTO_IVF_MIN_VECTORS:
+        return "ivf_flat"
+    return "flat"
+
+def _ivf_nlist(num_vectors: int) -> int:
+    """Número de listas do IVF: cerca de 4 * sqrt(n), com ao menos 39 vetores de treino por lista."""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+def _pq_m(dimension: int) -> int:
+    """Número de subquantizadores do PQ: o maior divisor da dimensão que não passa de dimensão / 16."""
+    target = max(1, dimension // 16)
+    return max(m for m in range(1, target + 1) if dimension % m == 0)
+
+def _codec_quantization(codec: faiss.Index) -> str:
+    """Codificação dos vetores de um índice sem estrutura de busca (flat, SQ ou PQ)."""
+    codec = faiss.downcast_index(codec)
+    if isinstance(codec, faiss.IndexScalarQuantizer):
+        return "fp16" if codec.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "pq" if isinstance(codec, faiss.IndexPQ) else "none"
+
+def index_layout(index: faiss.Index) -> Tuple[str, str]:
+    """
+    Identifica o tipo e a codificação de um índice FAISS criado por build_index.
+
+    Args:
+        index: Índice FAISS
+
+    Returns:
+        Tupla (um dos valores de INDEX_TYPES, um dos valores de QUANTIZATIONS)
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf = faiss.downcast_index(ivf)
+        if isinstance(ivf, faiss.IndexIVFPQ):
+            return "ivf_pq", "pq"
+        if isinstance(ivf, faiss.IndexIVFScalarQuantizer):
+            return "ivf_flat", "fp16" if ivf.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+        return "ivf_flat", "none"
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw", _codec_quantization(inner.storage)
+    return "flat", _codec_quantization(inner)
+
+def index_kind(index: faiss.Index) -> str:
+    """
+    Identifica o tipo de um índice FAISS criado por build_index.
+
+    Args:
+        index: Índice FAISS
+
+    Returns:
+        Um dos valores de INDEX_TYPES
+    """
+    return index_layout(index)[0]
+
+def _peek_index_file(path: str) -> Tuple[int, str]:
+    """
+    Lê a dimensão e o tipo de um índice salvo apenas pelo cabeçalho do arquivo.
+
+    Returns:
+        Tupla (dimensão, "flat", "hnsw" ou "ivf")
+    """
+    with open(path, "rb") as f:
+        header = f.read(41)
+    dimension = int.from_bytes(header[4:8], "little")
+    if header[:4] != b"IxM2":
+        return dimension, "ivf"
+    # IndexIDMap2: o índice interno começa após a assinatura e o cabeçalho de 33 bytes
+    return dimension, "hnsw" if header[37:40] == b"IHN" else "flat"
+
+def _knn_subset(queries: np.ndarray, vectors: Optional[np.ndarray], ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Busca exata entre os vetores informados, com resultados no formato de Index.search."""
+    distances = np.full((len(queries), k), np.finfo(np.float32).max, dtype=np.float32)
+    labels = np.full((len(queries), k), -1, dtype=np.int64)
+    if vectors is not None and len(ids):
+        found = min(k, len(ids))
+        subset_distances, positions = faiss.knn(queries, vectors, found)
+        distances[:, :found] = subset_distances
+        labels[:, :found] = ids[positions]
+    return distances, labels
+
+def build_index(index_type: str, dimension: int, training_vectors: Optional[np.ndarray] = None,
+                quantization: str = "none") -> faiss.Index:
+    """
+    Cria um índice FAISS vazio (e treinado, se o tipo exigir) que aceita IDs próprios.
+
+    Args:
+        index_type: Um dos valores de INDEX_TYPES
+        dimension: Dimensão dos vetores
+        training_vectors: Amostra de vetores para treinar os tipos IVF e as codificações
+        quantization: Codificação dos vetores (um dos valores de QUANTIZATIONS); o tipo
+            "ivf_pq" sempre usa "pq", e o tipo "flat" não aceita "pq"
+
+    Returns:
+        Índice FAISS
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Codificação desconhecida: {quantization}")
+    if index_type in ("flat", "hnsw"):
+        if index_type == "flat" and quantization == "pq":
+            # O IndexPQ do FAISS não aceita seletores de IDs: usar o tipo "ivf_pq"
+            raise ValueError("O tipo \"flat\" não aceita a codificação \"pq\"; use \"ivf_pq\"")
+        if quantization == "none":
+            index = faiss.IndexFlatL2(dimension) if index_type == "flat" else faiss.IndexHNSWFlat(dimension, HNSW_M)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dimension, _pq_m(dimension), HNSW_M)
+        elif index_type == "flat":
+            index = faiss.IndexScalarQuantizer(dimension, _SCALAR_QUANTIZERS[quantization])
+        else:
+            index = faiss.IndexHNSWSQ(dimension, _SCALAR_QUANTIZERS[quantization], HNSW_M)
+        if not index.is_trained:
+            index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+        return faiss.IndexIDMap2(index)
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        raise ValueError(f"Tipo de índice desconhecido: {index_type}")
+
+    nlist = _ivf_nlist(len(training_vectors))
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_pq" or quantization == "pq":
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_m(dimension), 8)
+    elif quantization == "none":
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    else:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, _SCALAR_QUANTIZERS[quantization])
+    index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+    # Tabela de IDs para reconstruir e remover vetores pelo ID
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+class VectorFile:
+    """
+    Vetores completos (float32) em disco, em linhas endereçadas pelo ID.
+    
+    A leitura usa mapeamento em memória: apenas as páginas das linhas lidas são carregadas,
+    de modo que o índice em memória pode usar uma codificação compacta e recorrer aos vetores
+    completos só para os candidatos de cada busca.
+    
+    Até a primeira compactação, cada vetor fica na linha de número igual ao seu ID. A
+    compactação regrava o arquivo apenas com os IDs ainda em uso: eles ocupam as primeiras
+    linhas, em ordem de ID, com a tabela dos seus IDs no cabeçalho, e os IDs gravados depois
+    (a partir do limite da compactação) continuam em linhas contíguas. O arquivo é substituído
+    atomicamente; as instâncias abertas passam a ler a nova versão na próxima operação.
+    """
+    
+    def __init__(self, path: str, dimension: int):
+        """
+        Inicializa o arquivo de vetores.
+        
+        Args:
+            path: Caminho do arquivo
+            dimension: Dimensão dos vetores
+        """
+        self.path = path
+        self.dimension = dimension
+        self._row_bytes = dimension * np.dtype(np.float32).itemsize
+        self._stat = None
+        self._map = None
+        self._compacted_ids = np.empty(0, dtype=np.int64)
+        self._base = 0
+        self._offset = 0
+        self._num_rows = 0
+        self._lock = threading.RLock()  # Buscas concorrentes releem o mesmo mapeamento
+    
+    def _refresh(self):
+        """Relê o cabeçalho e o mapeamento se o arquivo cresceu ou foi substituído (compactação)."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        identity = (stat.st_ino, stat.st_size) if stat else None
+        if identity == self._stat:
+            return
+        
+        self._stat, self._map = None, None
+        self._compacted_ids, self._base, self._offset, self._num_rows = np.empty(0, dtype=np.int64), 0, 0, 0
+        if stat is None:
+            return
+        # Cabeçalho e mapeamento lidos do mesmo arquivo, mesmo que ele seja substituído no meio
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            header = f.read(_VECTOR_FILE_HEADER_BYTES)
+            if header[:len(_VECTOR_FILE_MAGIC)] == _VECTOR_FILE_MAGIC:
+                self._base, count = np.frombuffer(header, dtype=np.int64, count=2, offset=8).tolist()
+                self._compacted_ids = np.fromfile(f, dtype=np.int64, count=count)
+                self._offset = _VECTOR_FILE_HEADER_BYTES + count * np.dtype(np.int64).itemsize
+            self._num_rows = max(stat.st_size - self._offset, 0) // self._row_bytes
+            if self._num_rows:
+                self._map = np.memmap(f, dtype=np.float32, mode="r", offset=self._offset,
+                                      shape=(self._num_rows, self.dimension))
+        self._stat = (stat.st_ino, stat.st_size)
+    
+    def _rows(self, ids: np.ndarray) -> np.ndarray:
+        """Linhas dos IDs (-1 para IDs removidos na compactação), inclusive além do fim do arquivo."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = ids - self._base + len(self._compacted_ids)
+        compacted = ids < self._base
+        if compacted.any():
+            positions = np.searchsorted(self._compacted_ids, ids[compacted])
+            clipped = np.minimum(positions, max(len(self._compacted_ids) - 1, 0))
+            found = (positions < len(self._compacted_ids)) & (self._compacted_ids[clipped] == ids[compacted]) \
+                if len(self._compacted_ids) else np.zeros(len(positions), dtype=bool)
+            rows[compacted] = np.where(found, positions, -1)
+        return rows
+    
+    @property
+    def num_rows(self) -> int:
+        """Número de linhas do arquivo (incluindo as de IDs excluídos ainda não compactados)."""
+        with self._lock:
+            self._refresh()
+            return self._num_rows
+    
+    @property
+    def id_limit(self) -> int:
+        """Limite dos IDs gravados (maior ID gravado + 1)."""
+        with self._lock:
+            self._refresh()
+            return self._base + self._num_rows - len(self._compacted_ids)
+    
+    def write(self, vectors: np.ndarray, ids: np.ndarray):
+        """
+        Grava vetores nas linhas dos seus IDs.
+        
+        Args:
+            vectors: Matriz (n, dimensão) de vetores
+            ids: IDs inteiros dos vetores
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        with self._lock:
+            self._refresh()
+            rows = self._rows(ids)
+            if (rows < 0).any():
+                raise ValueError(f"IDs removidos na compactação do arquivo de vetores: {ids[rows < 0][:10].tolist()}")
+            order = np.argsort(rows, kind="stable")
+            rows = rows[order]
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)[order]
+            
+            # Trechos de linhas consecutivas são gravados de uma vez
+            breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+            with open(self.path, "r+b" if os.path.exists(self.path) else "wb") as f:
+                for run_rows, run_vectors in zip(np.split(rows, breaks), np.split(vectors, breaks)):
+                    f.seek(self._offset + int(run_rows[0]) * self._row_bytes)
+                    f.write(run_vectors.tobytes())
+            self._stat = None
+    
+    def mapped(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Todas as linhas do arquivo e os IDs de cada linha, da mesma versão do arquivo.
+        
+        Returns:
+            Tupla (matriz mapeada em memória, somente leitura; IDs das linhas, em ordem crescente)
+        """
+        with self._lock:
+            self._refresh()
+            matrix = self._map if self._map is not None else np.empty((0, self.dimension), dtype=np.float32)
+            appended = np.arange(self._base, self._base + self._num_rows - len(self._compacted_ids), dtype=np.int64)
+            return matrix, np.concatenate([self._compacted_ids, appended])
+    
+    def read(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Lê os vetores de uma lista de IDs.
+        
+        Args:
+            ids: IDs inteiros dos vetores
+        
+        Returns:
+            Matriz (n, dimensão) de vetores float32; IDs que não estão no arquivo (removidos
+            em uma compactação posterior à versão do índice) são lidos como vetores infinitos,
+            que ficam por último em qualquer ordenação por distância
+        """
+        with self._lock:
+            self._refresh()
+            rows = self._rows(ids)
+            found = (rows >= 0) & (rows < self._num_rows)
+            if found.all() and len(rows):
+                return np.asarray(self._map[rows])
+            vectors = np.full((len(rows), self.dimension), np.inf, dtype=np.float32)
+            if found.any():
+                vectors[found] = self._map[rows[found]]
+            return vectors
+    
+    def compact(self, keep_ids: np.ndarray) -> int:
+        """
+        Regrava o arquivo apenas com os vetores dos IDs informados, recuperando o espaço das
+        linhas dos demais; IDs gravados depois continuam a partir do limite atual.
+        
+        Args:
+            keep_ids: IDs dos vetores ainda em uso
+        
+        Returns:
+            Número de linhas removidas
+        """
+        with self._lock:
+            self._refresh()
+            keep = np.unique(np.asarray(keep_ids, dtype=np.int64))
+            rows = self._rows(keep)
+            keep = keep[(rows >= 0) & (rows < self._num_rows)]
+            removed = self._num_rows - len(keep)
+            if removed <= 0:
+                return 0
+            
+            header = _VECTOR_FILE_MAGIC + np.array([self.id_limit, len(keep)], dtype=np.int64).tobytes()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(header)
+                f.write(keep.tobytes())
+                for start in range(0, len(keep), REBUILD_BATCH_SIZE):
+                    f.write(self.read(keep[start:start + REBUILD_BATCH_SIZE]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._stat = None
+            logger.info(f"Arquivo de vetores compactado: {removed} linhas removidas, {len(keep)} mantidas")
+            return removed
+
+class MappedFlatIndex:
+    """
+    Índice exato somente leitura servido diretamente do arquivo de vetores completos.
+    
+    Usado no carregamento por mapeamento em memória dos índices exatos, para os quais o FAISS
+    copiaria todos os vetores para a memória do processo: aqui, apenas os IDs são lidos na
+    abertura, e as buscas percorrem o arquivo mapeado em blocos, de modo que processos que
+    abrem o mesmo índice compartilham as páginas do cache do sistema.
+    """
+    
+    read_only = True
+    kind = "flat"
+    layout = ("flat", "none")
+    
+    def __init__(self, vectors: VectorFile, ids: np.ndarray, deleted: set):
+        """
+        Inicializa o índice.
+        
+        Args:
+            vectors: Arquivo de vetores completos
+            ids: IDs de todos os vetores armazenados no índice salvo
+            deleted: IDs excluídos ainda não compactados
+        """
+        self.dimension = vectors.dimension
+        self.vectors = vectors
+        self.deleted = deleted
+        self._ntotal = len(ids)
+        active = np.asarray(ids, dtype=np.int64)
+        if deleted:
+            active = active[~np.isin(active, np.fromiter(deleted, dtype=np.int64, count=len(deleted)))]
+        # Versão do arquivo lida na abertura, mantida mesmo que o arquivo seja compactado depois
+        self._matrix, self._row_ids = vectors.mapped()
+        # Linhas do arquivo que correspondem a vetores visíveis nas buscas
+        self._mask = np.zeros(len(self._row_ids), dtype=bool)
+        self._mask[self._rows(active)] = True
+        self._num_active = len(active)
+    
+    def _rows(self, ids: np.ndarray) -> np.ndarray:
+        """Linhas do arquivo mapeado com os IDs informados (IDs ausentes são omitidos)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self._row_ids):
+            return np.empty(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._row_ids, ids), len(self._row_ids) - 1)
+        return positions[self._row_ids[positions] == ids]
+    
+    @property
+    def code_size(self) -> int:
+        """Bytes por vetor no arquivo de vetores."""
+        return self.dimension * np.dtype(np.float32).itemsize
+    
+    @property
+    def ntotal(self) -> int:
+        """Número de vetores armazenados, incluindo os excluídos ainda não compactados."""
+        return self._ntotal
+    
+    @property
+    def num_active(self) -> int:
+        """Número de vetores visíveis nas buscas."""
+        return self._num_active
+    
+    @property
+    def deleted_ratio(self) -> float:
+        """Fração dos vetores armazenados que estão excluídos."""
+        return len(self.deleted) / self._ntotal if self._ntotal else 0.0
+    
+    def search(self, queries: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca exata dos k vizinhos mais próximos, ignorando os IDs excluídos.
+        
+        Args:
+            queries: Matriz (n, dimensão) de consultas
+            k: Número de resultados por consulta
+            ids: IDs aos quais restringir a busca (opcional)
+        
+        Returns:
+            Tupla (distâncias, IDs), cada uma com forma (n, k); posições sem resultado têm ID -1
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        if ids is not None:
+            rows = self._rows(ids)
+            rows = rows[self._mask[rows]]
+            return _knn_subset(queries, np.asarray(self._matrix[rows]) if len(rows) else None, self._row_ids[rows], k)
+        
+        matrix = self._matrix
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+        best_labels = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self._mask), MAPPED_SEARCH_BLOCK_ROWS):
+            mask = self._mask[start:start + MAPPED_SEARCH_BLOCK_ROWS]
+            inactive = len(mask) - int(mask.sum())
+            if inactive == len(mask):
+                continue
+            if inactive <= k:
+                # Buscar um candidato a mais por linha inativa do bloco e descartá-las em seguida
+                distances, positions = faiss.knn(queries, matrix[start:start + len(mask)], min(len(mask), k + inactive))
+                active = mask[positions]
+                distances[~active] = np.finfo(np.float32).max
+                labels = np.where(active, self._row_ids[positions + start], -1)
+            else:
+                rows = np.flatnonzero(mask) + start
+                distances, labels = _knn_subset(queries, np.asarray(matrix[rows]), self._row_ids[rows], k)
+            best_distances = np.hstack([best_distances, distances])
+            best_labels = np.hstack([best_labels, labels])
+            if best_distances.shape[1] > k:
+                order = np.argsort(best_distances, axis=1, kind="stable")[:, :k]
+                best_distances = np.take_along_axis(best_distances, order, axis=1)
+                best_labels = np.take_along_axis(best_labels, order, axis=1)
+        
+        distances, labels = _knn_subset(queries, None, np.empty(0, dtype=np.int64), k)
+        found = best_distances.shape[1]
+        distances[:, :found] = best_distances
+        labels[:, :found] = best_labels
+        return distances, labels
+    
+    def reconstruct(self, vector_id: int) -> np.ndarray:
+        """
+        Retorna o vetor armazenado com um ID.
+        
+        Args:
+            vector_id: ID do vetor
+        
+        Returns:
+            Vetor float32
+        """
+        return self.vectors.read([int(vector_id)])[0]
+
+class FaissIndex:
+    """
+    Índice FAISS com IDs inteiros estáveis por vetor.
+    
+    A remoção marca os IDs como excluídos (tombstones), em tempo proporcional ao número de
+    IDs removidos; as buscas ignoram os IDs excluídos por meio de um seletor de IDs. O espaço
+    só é recuperado na compactação, que remove fisicamente os vetores excluídos.
+    
+    O tipo de índice (exato, IVF, IVF-PQ ou HNSW) é configurável; os tipos IVF são treinados
+    com uma amostra dos vetores quando há vetores suficientes, e no modo "auto" o índice é
+    migrado para um tipo aproximado à medida que o corpus cresce.
+    
+    Os vetores podem ser armazenados no índice com codificação compacta (fp16, int8 ou PQ).
+    Com um arquivo de vetores completos, os candidatos de cada busca são reordenados pelas
+    distâncias exatas, recuperando a maior parte do recall perdido na codificação.
+    """
+    
+    def __init__(self, dimension: int, index: Optional[faiss.Index] = None,
+                 index_type: str = DEFAULT_INDEX_TYPE, nprobe: int = DEFAULT_NPROBE,
+                 ef_search: int = DEFAULT_EF_SEARCH, quantization: str = DEFAULT_QUANTIZATION,
+                 vectors_path: Optional[str] = None, rerank_factor: int = DEFAULT_RERANK_FACTOR,
+                 read_only: bool = False):
+        """
+        Inicializa o índice.
+        
+        Args:
+            dimension: Dimensão dos vetores
+            index: Índice FAISS existente (criado por build_index)
+            index_type: Tipo desejado ("flat", "ivf_flat", "ivf_pq", "hnsw" ou "auto")
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+            quantization: Codificação desejada ("none", "fp16", "sq8" ou "pq")
+            vectors_path: Arquivo de vetores completos, usado na reordenação exata e nas
+                reconstruções do índice (opcional)
+            rerank_factor: Candidatos por resultado reordenados com os vetores completos
+            read_only: Índice somente leitura (carregado por mapeamento em memória)
+        """
+        if index_type != "auto" and index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice desconhecido: {index_type}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Codificação desconhecida: {quantization}")
+        self.dimension = dimension
+        self.index_type = index_type
+        self.quantization = quantization
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.rerank_factor = rerank_factor
+        self.read_only = read_only
+        if index is None:
+            initial_type, initial_quantization = self._target_layout(0)
+            index = build_index(initial_type, dimension, quantization=initial_quantization)
+        self.index = index
+        self.deleted = set()
+        self._lock = threading.RLock()
+        # Buscas rodam fora do lock; alterações do índice atual esperam as buscas em andamento
+        self._searches_done = threading.Condition(self._lock)
+        self._active_searches = 0
+        self._selector = None
+        self._dirty = True
+        self._migration = None  # IDs adicionados durante a migração em andamento, se houver
+        
+        self.vectors = VectorFile(vectors_path, dimension) if vectors_path else None
+        if read_only:
+            if self.vectors and not os.path.exists(vectors_path):
+                self.vectors = None
+        elif self.vectors and self.index.ntotal:
+            ids = self._all_ids()
+            if self.vectors.id_limit <= ids.max():
+                # Índice criado antes do arquivo de vetores: preenchê-lo com os vetores do índice
+                logger.info(f"Gravando {len(ids)} vetores do índice em {vectors_path}")
+                for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+                    batch = ids[start:start + REBUILD_BATCH_SIZE]
+                    self.vectors.write(self.index.reconstruct_batch(batch), batch)
+    
+    @property
+    def kind(self) -> str:
+        """Tipo do índice FAISS atual."""
+        return index_kind(self.index)
+    
+    @property
+    def layout(self) -> Tuple[str, str]:
+        """Tipo e codificação do índice FAISS atual."""
+        return index_layout(self.index)
+    
+    @property
+    def code_size(self) -> int:
+        """Bytes por vetor ocupados pela codificação no índice (sem IDs e estruturas de busca)."""
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            return ivf.code_size
+        inner = faiss.downcast_index(self.index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner = faiss.downcast_index(inner.storage)
+        return inner.code_size
+    
+    @property
+    def ntotal(self) -> int:
+        """Número de vetores armazenados, incluindo os excluídos ainda não compactados."""
+        return self.index.ntotal
+    
+    @property
+    def num_active(self) -> int:
+        """Número de vetores visíveis nas buscas."""
+        return self.index.ntotal - len(self.deleted)
+    
+    @property
+    def deleted_ratio(self) -> float:
+        """Fração dos vetores armazenados que estão excluídos."""
+        return len(self.deleted) / self.index.ntotal if self.index.ntotal else 0.0
+    
+    def _target_layout(self, num_vectors: int) -> Tuple[str, str]:
+        """Tipo e codificação adequados ao número de vetores, considerando o mínimo para treino."""
+        index_type = choose_index_type(num_vectors) if self.index_type == "auto" else self.index_type
+        quantization = self.quantization
+        if index_type == "ivf_pq" and self.index_type == "auto" and quantization in _SCALAR_QUANTIZERS:
+            # A codificação escalar escolhida é mantida nos corpora grandes
+            index_type = "ivf_flat"
+        elif index_type == "ivf_pq" or (index_type in ("flat", "ivf_flat") and quantization == "pq"):
+            index_type, quantization = "ivf_pq", "pq"
+        
+        if num_vectors < MIN_TRAINING_VECTORS[index_type]:
+            index_type = "flat"
+        if num_vectors < MIN_QUANTIZATION_VECTORS[quantization] or (index_type, quantization) == ("flat", "pq"):
+            quantization = "none"
+        return index_type, quantization
+    
+    def _all_ids(self) -> np.ndarray:
+        """Retorna os IDs de todos os vetores armazenados."""
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is None:
+            return faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        invlists = ivf.invlists
+        return np.concatenate([np.empty(0, dtype=np.int64)] + [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(ivf.nlist) if invlists.list_size(list_no)
+        ])
+    
+    def _check_writable(self):
+        """Impede alterações em um índice somente leitura."""
+        if self.read_only:
+            raise RuntimeError("Índice FAISS aberto em modo somente leitura")
+    
+    def _get_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """Vetores dos IDs informados: completos, se houver arquivo de vetores, ou reconstruídos do índice."""
+        if self.vectors is not None:
+            return self.vectors.read(ids)
+        return self.index.reconstruct_batch(ids)
+    
+    def _build(self, index_type: str, quantization: str, ids: np.ndarray,
+               get_vectors: Callable[[np.ndarray], np.ndarray]) -> faiss.Index:
+        """Constrói um índice FAISS do tipo e da codificação informados com os vetores dos IDs."""
+        training_vectors = None
+        if index_type in ("ivf_flat", "ivf_pq") or quantization != "none":
+            # Treinar com uma amostra: cerca de 64 vetores por lista do IVF
+            nlist = _ivf_nlist(len(ids)) if index_type in ("ivf_flat", "ivf_pq") else 0
+            minimum = max(MIN_TRAINING_VECTORS[index_type], MIN_QUANTIZATION_VECTORS[quantization])
+            sample_size = min(len(ids), max(64 * nlist, minimum))
+            sample = np.random.default_rng(0).choice(ids, size=sample_size, replace=False)
+            training_vectors = get_vectors(np.sort(sample))
+        
+        new_index = build_index(index_type, self.dimension, training_vectors, quantization)
+        for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+            batch = ids[start:start + REBUILD_BATCH_SIZE]
+            new_index.add_with_ids(get_vectors(batch), batch)
+        return new_index
+    
+    def _active_ids(self) -> np.ndarray:
+        """Retorna os IDs dos vetores armazenados que não estão excluídos."""
+        ids = self._all_ids()
+        if self.deleted:
+            ids = ids[~np.isin(ids, np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)))]
+        return ids
+    
+    def _rebuild(self, index_type: str, quantization: str = "none", ids: Optional[np.ndarray] = None):
+        """
+        Reconstrói o índice com outro tipo ou codificação (ou os mesmos), sem os vetores excluídos.
+        
+        Com ids, o novo índice contém esses vetores, lidos do arquivo de vetores completos.
+        """
+        if ids is None:
+            ids = self._active_ids()
+        new_index = self._build(index_type, quantization, ids, self._get_vectors)
+        
+        logger.info(f"Índice reconstruído: {'/'.join(self.layout)} -> {index_type}/{quantization} ({len(ids)} vetores)")
+        self.index = new_index
+        self.deleted.clear()
+        self._migration = None  # Uma migração em andamento partiu do índice substituído
+        self._selector = None
+        self._dirty = True
+    
+    def _migration_target(self) -> Optional[Tuple[str, str]]:
+        """
+        Tipo e codificação para os quais o índice deve migrar com o crescimento do corpus, se
+        houver (chamado com o lock).
+        
+        A migração só leva a tipos de posição igual ou maior em _KIND_RANK e não troca uma
+        codificação com perdas por outra; os índices IVF são retreinados quando o número ideal
+        de listas dobra em relação ao treino atual.
+        """
+        current, target = self.layout, self._target_layout(self.num_active)
+        if current == target:
+            if current[0] in ("ivf_flat", "ivf_pq") and \
+                    _ivf_nlist(self.num_active) >= 2 * faiss.extract_index_ivf(self.index).nlist:
+                return target
+        elif _KIND_RANK[target[0]] >= _KIND_RANK[current[0]] and current[1] in ("none", target[1]):
+            return target
+        return None
+    
+    def _read_vectors(self, index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+        """Vetores dos IDs lidos do arquivo de vetores completos ou reconstruídos de um índice FAISS."""
+        if self.vectors is not None:
+            return self.vectors.read(ids)
+        with self._lock:
+            # As alterações do índice ocorrem com o lock; leituras concorrentes com as buscas são seguras
+            return index.reconstruct_batch(ids)
+    
+    def _maybe_migrate(self):
+        """
+        Migra o índice para o tipo e a codificação adequados quando o corpus cresce.
+        
+        O treino e a construção do novo índice ocorrem fora do lock, de modo que buscas e
+        adições continuam durante a migração; apenas a troca dos índices usa o lock, quando o
+        novo índice recebe os vetores adicionados durante a construção. As exclusões feitas
+        nesse intervalo continuam marcadas. Uma reconstrução do índice atual (compactação)
+        durante a migração descarta o índice construído.
+        """
+        with self._lock:
+            target = self._migration_target() if self._migration is None else None
+            if target is None:
+                return
+            index, deleted, ids = self.index, set(self.deleted), self._active_ids()
+            migration = self._migration = []  # IDs adicionados durante a construção
+        
+        try:
+            new_index = self._build(*target, ids, lambda batch: self._read_vectors(index, batch))
+        except Exception as e:
+            logger.error(f"Erro ao migrar o índice: {str(e)}")
+            with self._lock:
+                if self._migration is migration:
+                    self._migration = None
+            return
+        
+        with self._lock:
+            if self._migration is not migration or self.index is not index:
+                return
+            self._migration = None
+            if migration:
+                added = np.concatenate(migration)
+                new_index.add_with_ids(self._read_vectors(index, added), added)
+            logger.info(f"Índice migrado: {'/'.join(self.layout)} -> {'/'.join(target)} "
+                        f"({new_index.ntotal} vetores)")
+            # As buscas em andamento continuam no índice anterior, obtido antes da troca
+            self.index = new_index
+            self.deleted -= deleted
+            self._selector = None
+            self._dirty = True
+    
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        """
+        Adiciona vetores com os IDs informados.
+        
+        Se o corpus passar do tamanho de outro tipo de índice, a migração é feita em seguida,
+        sem bloquear as buscas (ver _maybe_migrate).
+        
+        Args:
+            vectors: Matriz (n, dimensão) de vetores
+            ids: IDs inteiros dos vetores (não podem estar em uso)
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self._check_writable()
+        with self._lock:
+            self._wait_for_searches()
+            if self.vectors is not None:
+                self.vectors.write(vectors, ids)
+            self.index.add_with_ids(vectors, ids)
+            self._dirty = True
+            if self._migration is not None:
+                self._migration.append(ids)
+        self._maybe_migrate()
+    
+    @classmethod
+    def from_vectors(cls, dimension: int, ids: np.ndarray, vectors_path: str, **options) -> "FaissIndex":
+        """
+        Cria um índice com vetores já gravados no arquivo de vetores completos, sem regravá-los.
+        
+        O tipo e a codificação são escolhidos para o número de vetores, como na migração.
+        
+        Args:
+            dimension: Dimensão dos vetores
+            ids: IDs dos vetores (linhas do arquivo) que o índice deve conter
+            vectors_path: Arquivo de vetores completos
+            **options: Demais argumentos do construtor (index_type, quantization, nprobe, ...)
+        
+        Returns:
+            Instância de FaissIndex
+        """
+        instance = cls(dimension, vectors_path=vectors_path, **options)
+        ids = np.sort(np.asarray(ids, dtype=np.int64))
+        if len(ids):
+            instance._rebuild(*instance._target_layout(len(ids)), ids=ids)
+        return instance
+    
+    def remove(self, ids: Iterable[int]) -> int:
+        """
+        Marca IDs como excluídos; os vetores deixam de aparecer nas buscas imediatamente.
+        
+        Args:
+            ids: IDs a excluir
+        
+        Returns:
+            Número de IDs marcados
+        """
+        self._check_writable()
+        with self._lock:
+            before = len(self.deleted)
+            self.deleted.update(int(i) for i in ids)
+            self._selector = None
+            return len(self.deleted) - before
+    
+    def _make_params(self, selector: Optional[faiss.IDSelector]) -> faiss.SearchParameters:
+        """Cria os parâmetros de busca do tipo adequado ao índice atual."""
+        kind = self.kind
+        if kind in ("ivf_flat", "ivf_pq"):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if kind == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=selector)
+    
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """
+        Ajusta os parâmetros de busca dos índices aproximados (compromisso entre recall e latência).
+        
+        Args:
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+        """
+        with self._lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            self._selector = None
+    
+    def _wait_for_searches(self):
+        """Espera o fim das buscas em andamento antes de alterar o índice atual (chamado com o lock)."""
+        while self._active_searches:
+            self._searches_done.wait()
+    
+    def _search_params(self) -> Tuple[faiss.SearchParameters, Tuple]:
+        """
+        Parâmetros de busca que excluem os IDs removidos.
+        
+        O seletor é mantido em cache até a próxima mudança; os parâmetros são criados a cada
+        busca, pois o FAISS os altera durante a busca e não podem ser compartilhados entre
+        buscas concorrentes.
+        
+        Returns:
+            Tupla (parâmetros, seletores que devem continuar referenciados até o fim da busca)
+        """
+        if self._selector is None:
+            if self.deleted:
+                batch = faiss.IDSelectorBatch(np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)))
+                # Manter referências ao seletor interno enquanto o externo estiver em uso
+                self._selector = (batch, faiss.IDSelectorNot(batch))
+            else:
+                self._selector = (None, None)
+        return self._make_params(self._selector[1]), self._selector
+    
+    def _rerank(self, queries: np.ndarray, labels: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Reordena os candidatos de cada consulta pelas distâncias exatas e mantém os k primeiros."""
+        valid = labels >= 0
+        exact = np.full(labels.shape, np.finfo(np.float32).max, dtype=np.float32)
+        if valid.any():
+            # Cada vetor candidato é lido uma única vez, mesmo se aparecer em várias consultas
+            unique_ids, inverse = np.unique(labels[valid], return_inverse=True)
+            vectors = self.vectors.read(unique_ids)[inverse]
+            exact[valid] = ((vectors - np.repeat(queries, valid.sum(axis=1), axis=0)) ** 2).sum(axis=1)
+        order = np.argsort(exact, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(exact, order, axis=1), np.take_along_axis(labels, order, axis=1)
+    
+    def _index_search(self, index: faiss.Index, queries: np.ndarray, k: int,
+                      params: faiss.SearchParameters) -> Tuple[np.ndarray, np.ndarray]:
+        """Busca em um índice FAISS, reordenando os candidatos se a codificação tiver perdas."""
+        if self.vectors is None or self.rerank_factor <= 0 or index_layout(index)[1] == "none":
+            return index.search(queries, k, params=params)
+        _, labels = index.search(queries, k * self.rerank_factor, params=params)
+        return self._rerank(queries, labels, k)
+    
+    def search(self, queries: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca os k vizinhos mais próximos, ignorando os IDs excluídos.
+        
+        Com uma seleção de IDs, apenas esses vetores são considerados: seleções pequenas são
+        comparadas diretamente com a consulta; as maiores são passadas ao FAISS como seletor
+        de IDs. Em ambos os casos, se houver pelo menos k vetores selecionados, k resultados
+        são retornados (nos índices aproximados, a segunda forma pode retornar menos).
+        
+        Com codificação com perdas e arquivo de vetores completos, k * rerank_factor
+        candidatos são buscados e reordenados pelas distâncias exatas.
+        
+        O índice e os parâmetros são obtidos com o lock, e a busca roda fora dele: buscas
+        concorrentes não se serializam, e as alterações do índice esperam o seu término.
+        
+        Args:
+            queries: Matriz (n, dimensão) de consultas
+            k: Número de resultados por consulta
+            ids: IDs aos quais restringir a busca (opcional)
+        
+        Returns:
+            Tupla (distâncias, IDs), cada uma com forma (n, k); posições sem resultado têm ID -1
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        if ids is not None:
+            ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            if ids is not None and self.deleted:
+                ids = ids[~np.isin(ids, np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)))]
+            if ids is not None and len(ids) <= BRUTE_FORCE_MAX_IDS:
+                vectors = self._get_vectors(ids) if len(ids) else None
+            else:
+                if ids is None:
+                    params, selector = self._search_params()
+                else:
+                    selector = faiss.IDSelectorBatch(ids)
+                    params = self._make_params(selector)
+                index = self.index
+                self._active_searches += 1
+        if ids is not None and len(ids) <= BRUTE_FORCE_MAX_IDS:
+            return _knn_subset(queries, vectors, ids, k)
+        try:
+            return self._index_search(index, queries, k, params)
+        finally:
+            with self._lock:
+                self._active_searches -= 1
+                if not self._active_searches:
+                    self._searches_done.notify_all()
+    
+    def reconstruct(self, vector_id: int) -> np.ndarray:
+        """
+        Retorna o vetor armazenado com um ID (aproximado nos índices com codificação com perdas).
+        
+        Args:
+            vector_id: ID do vetor
+        
+        Returns:
+            Vetor float32
+        """
+        with self._lock:
+            return self.index.reconstruct(int(vector_id))
+    
+    def compact(self) -> int:
+        """
+        Remove fisicamente os vetores excluídos, recuperando o espaço.
+        
+        Returns:
+            Número de vetores removidos
+        """
+        self._check_writable()
+        with self._lock:
+            if not self.deleted:
+                return 0
+            self._wait_for_searches()
+            removed = len(self.deleted)
+            deleted = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+            kind, quantization = self.layout
+            if kind == "hnsw":
+                # O HNSW não permite remoção: reconstruir o grafo sem os vetores excluídos
+                self._rebuild(kind, quantization)
+            elif kind == "flat":
+                self.index.remove_ids(faiss.IDSelectorBatch(deleted))
+            else:
+                # Com a tabela de IDs do IVF, a remoção exige um IDSelectorArray
+                self.index.remove_ids(faiss.IDSelectorArray(deleted))
+            self.deleted.clear()
+            self._migration = None  # Uma migração em andamento partiu dos vetores anteriores
+            self._selector = None
+            self._dirty = True
+        logger.info(f"Índice compactado: {removed} vetores removidos, {self.ntotal} restantes")
+        return removed
+    
+    def save(self, path: str, deleted_path: Optional[str] = None):
+        """
+        Salva o índice em disco; o arquivo do índice só é regravado se os vetores mudaram.
+        
+        Args:
+            path: Caminho do arquivo do índice (os IDs excluídos ficam em "<path>.deleted.npy", e
+                os IDs de todos os vetores, usados no carregamento mapeado, em "<path>.ids.npy")
+            deleted_path: Caminho alternativo do arquivo de IDs excluídos (opcional)
+        """
+        self._check_writable()
+        with self._lock:
+            if self._dirty or not os.path.exists(path) or not os.path.exists(f"{path}.ids.npy"):
+                tmp_path = f"{path}.tmp"
+                faiss.write_index(self.index, tmp_path)
+                with open(f"{path}.ids.npy.tmp", "wb") as f:
+                    np.save(f, self._all_ids())
+                os.replace(f"{path}.ids.npy.tmp", f"{path}.ids.npy")
+                os.replace(tmp_path, path)
+                self._dirty = False
+            deleted = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+            deleted_path = deleted_path or f"{path}.deleted.npy"
+            with open(f"{deleted_path}.tmp", "wb") as f:
+                np.save(f, deleted)
+            os.replace(f"{deleted_path}.tmp", deleted_path)
+    
+    @classmethod
+    def load(cls, path: str, index_type: str = DEFAULT_INDEX_TYPE, nprobe: int = DEFAULT_NPROBE,
+             ef_search: int = DEFAULT_EF_SEARCH, quantization: str = DEFAULT_QUANTIZATION,
+             vectors_path: Optional[str] = None, rerank_factor: int = DEFAULT_RERANK_FACTOR,
+             mmap: bool = False, deleted_path: Optional[str] = None) -> Union["FaissIndex", MappedFlatIndex]:
+        """
+        Carrega um índice salvo com save.
+        
+        Com mmap, o índice é aberto somente para leitura e sem copiar os vetores para a memória
+        do processo: as listas invertidas dos índices IVF são mapeadas pelo FAISS, e os índices
+        exatos são servidos do arquivo de vetores completos (MappedFlatIndex). O HNSW não tem
+        suporte a mapeamento no FAISS e é lido para a memória.
+        
+        Args:
+            path: Caminho do arquivo do índice
+            index_type: Tipo desejado (usado nas próximas migrações)
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+            quantization: Codificação desejada (usada nas próximas migrações)
+            vectors_path: Arquivo de vetores completos (opcional)
+            rerank_factor: Candidatos por resultado reordenados com os vetores completos
+            mmap: Abrir somente para leitura, por mapeamento em memória
+            deleted_path: Caminho alternativo do arquivo de IDs excluídos (opcional)
+        
+        Returns:
+            Instância de FaissIndex (ou MappedFlatIndex, para índices exatos com mmap)
+        """
+        deleted_path = deleted_path or f"{path}.deleted.npy"
+        deleted = set(np.load(deleted_path).tolist()) if os.path.exists(deleted_path) else set()
+        
+        flags = 0
+        if mmap:
+            dimension, kind = _peek_index_file(path)
+            ids_path = f"{path}.ids.npy"
+            if kind == "flat" and vectors_path and os.path.exists(vectors_path) and os.path.exists(ids_path):
+                logger.info(f"Índice exato servido do arquivo de vetores mapeado: {vectors_path}")
+                return MappedFlatIndex(VectorFile(vectors_path, dimension), np.load(ids_path, mmap_mode="r"), deleted)
+            if kind == "hnsw":
+                logger.info("O FAISS não mapeia índices HNSW em memória; o índice será lido por completo")
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        
+        index = faiss.read_index(path, flags)
+        instance = cls(index.d, index, index_type=index_type, nprobe=nprobe, ef_search=ef_search,
+                       quantization=quantization, vectors_path=vectors_path, rerank_factor=rerank_factor,
+                       read_only=mmap)
+        instance.deleted = deleted
+        instance._dirty = False
+        return instance
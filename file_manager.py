@@ -1,13 +1,15 @@
 import os
 import tempfile
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import uuid
 from datetime import datetime
 
 import streamlit as st
 
-from pdf_processor import extract_text_from_pdf, chunk_pdf_text
+from pdf_processor import extract_pages_from_bytes, join_pages, chunk_pdf_text, normalize_pages
+from tokenizer_service import get_tokenizer
+from ingest_cache import IngestCache
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,17 +20,100 @@ class FileManager:
     Classe para gerenciar o upload e processamento de múltiplos arquivos PDF.
     """
     
-    def __init__(self, knowledge_base):
+    def __init__(self, knowledge_base, chunk_size: int = 1000, chunk_overlap: int = 200, normalize: bool = True):
         """
         Inicializa o gerenciador de arquivos.
         
         Args:
-            knowledge_base: Instância da classe KnowledgeBase para armazenar os documentos processados
+            knowledge_base: Base de conhecimento (KnowledgeBase ou o KnowledgeBaseService compartilhado)
+                para armazenar os documentos processados
+            chunk_size: Tamanho aproximado de cada chunk em tokens
+            chunk_overlap: Sobreposição entre chunks em tokens
+            normalize: Se True, remove cabeçalhos, rodapés e linhas repetidas antes do chunking
         """
         self.knowledge_base = knowledge_base
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.normalize = normalize
+        self.ingest_cache = IngestCache(os.path.join(knowledge_base.kb_path, "cache"))
         self.temp_dir = tempfile.mkdtemp()
         logger.info(f"FileManager inicializado com diretório temporário: {self.temp_dir}")
     
+    def _cache_key(self, pdf_data) -> str:
+        """Chave do cache de ingestão para o conteúdo de um PDF e os parâmetros de processamento."""
+        return IngestCache.make_key(pdf_data, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap,
+                                    normalize=self.normalize)
+    
+    def _extract_pages(self, pdf_data, file_name: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Extrai e normaliza os registros de página de um PDF em memória.
+        
+        Args:
+            pdf_data: Conteúdo do PDF
+            file_name: Nome do arquivo, para os logs
+            
+        Returns:
+            Tupla (páginas, estatísticas de normalização); lista vazia se não for possível
+            extrair texto
+        """
+        # Extrair texto do PDF diretamente da memória; o diretório temporário só é
+        # usado para PDFs grandes, e o arquivo é removido mesmo em caso de erro
+        logger.info(f"Processando PDF: {file_name}")
+        pages = extract_pages_from_bytes(pdf_data, spool_dir=self.temp_dir)
+        
+        # Remover cabeçalhos, rodapés e avisos repetidos antes do chunking
+        stats = {}
+        if self.normalize:
+            pages, stats = normalize_pages(pages)
+            logger.info(f"Tokens de boilerplate removidos de {file_name}: {stats['tokens_removed']}")
+        
+        if not any(page["text"].strip() for page in pages):
+            logger.error(f"Não foi possível extrair texto de: {file_name}")
+            return [], {}
+        return pages, stats
+    
+    def _load_pages_and_chunks(self, file, report_progress=None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Obtém os registros de página e os chunks de um upload, do cache ou por extração.
+        
+        Args:
+            file: Objeto de arquivo do Streamlit
+            report_progress: Função opcional (percentual, mensagem) para exibir o progresso
+            
+        Returns:
+            Tupla (páginas, chunks, estatísticas de normalização); listas vazias se não
+            for possível extrair texto
+        """
+        file_name = file.name
+        report_progress = report_progress or (lambda percent, message: None)
+        
+        # Acessar o conteúdo do upload sem copiá-lo (UploadedFile é um BytesIO)
+        pdf_data = file.getbuffer() if hasattr(file, "getbuffer") else file.getvalue()
+        
+        # Reenvios do mesmo PDF com os mesmos parâmetros reutilizam páginas e chunks do cache
+        cache_key = self._cache_key(pdf_data)
+        cached = self.ingest_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Usando páginas e chunks em cache para: {file_name}")
+            return cached["pages"], cached["chunks"], cached.get("stats", {})
+        
+        report_progress(30, f"Extraindo texto de: {file_name}")
+        
+        pages, stats = self._extract_pages(pdf_data, file_name)
+        if not pages:
+            return [], [], {}
+        
+        report_progress(50, f"Dividindo texto em chunks: {file_name}")
+        
+        # Dividir texto em chunks
+        tokenizer_seconds = get_tokenizer().get_stats()["total_seconds"]
+        chunks = chunk_pdf_text(join_pages(pages), chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap, pages=pages)
+        logger.info(f"Tempo de tokenização para {file_name}: "
+                    f"{(get_tokenizer().get_stats()['total_seconds'] - tokenizer_seconds) * 1000:.1f} ms")
+        
+        self.ingest_cache.put(cache_key, pages, chunks, stats)
+        return pages, chunks, stats
+    
     def process_file(self, file, display_progress=True) -> Optional[str]:
         """
         Processa um único arquivo PDF e adiciona à base de conhecimento.
@@ -42,6 +127,7 @@ class FileManager:
         """
         try:
             file_name = file.name
+            report_progress = None
             
             # Exibir progresso
             if display_progress:
@@ -49,43 +135,26 @@ class FileManager:
                 progress_bar = st.progress(0)
                 progress_text.text(f"Processando arquivo: {file_name}")
                 progress_bar.progress(10)
+                
+                def report_progress(percent, message):
+                    progress_bar.progress(percent)
+                    progress_text.text(message)
             
-            # Salvar o arquivo temporariamente
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=self.temp_dir) as tmp_file:
-                tmp_file.write(file.getvalue())
-                tmp_path = tmp_file.name
-            
-            if display_progress:
-                progress_bar.progress(30)
-                progress_text.text(f"Extraindo texto de: {file_name}")
-            
-            # Extrair texto do PDF
-            logger.info(f"Processando PDF: {file_name}")
-            text = extract_text_from_pdf(tmp_path)
+            pages, chunks, stats = self._load_pages_and_chunks(file, report_progress)
             
-            if not text:
+            if not chunks:
                 if display_progress:
                     progress_text.error(f"Não foi possível extrair texto de: {file_name}")
                     progress_bar.empty()
-                logger.error(f"Não foi possível extrair texto de: {file_name}")
                 return None
             
-            if display_progress:
-                progress_bar.progress(50)
-                progress_text.text(f"Dividindo texto em chunks: {file_name}")
-            
-            # Dividir texto em chunks
-            chunks = chunk_pdf_text(text)
-            
             if display_progress:
                 progress_bar.progress(70)
                 progress_text.text(f"Adicionando documento à base de conhecimento: {file_name}")
             
             # Adicionar à base de conhecimento
-            doc_id = self.knowledge_base.add_document(file_name, chunks)
-            
-            # Remover arquivo temporário
-            os.unlink(tmp_path)
+            doc_id = self.knowledge_base.add_document(file_name, chunks, pages=pages,
+                                                      doc_metadata={"normalization": stats} if stats else None)
             
             if display_progress:
                 progress_bar.progress(100)
@@ -105,6 +174,39 @@ class FileManager:
             logger.error(f"Erro ao processar arquivo {file.name}: {str(e)}")
             return None
     
+    def replace_file(self, doc_id: str, file) -> Optional[Dict[str, int]]:
+        """
+        Substitui um documento da base de conhecimento por uma nova revisão do PDF,
+        gerando embeddings apenas para as regiões alteradas.
+        
+        Args:
+            doc_id: ID do documento a ser substituído
+            file: Objeto de arquivo do Streamlit com a nova revisão
+            
+        Returns:
+            Estatísticas da substituição ou None se ocorrer um erro
+        """
+        try:
+            # Apenas as páginas: replace_document divide somente as regiões alteradas
+            pdf_data = file.getbuffer() if hasattr(file, "getbuffer") else file.getvalue()
+            cached = self.ingest_cache.get(self._cache_key(pdf_data))
+            if cached is not None:
+                pages, normalization = cached["pages"], cached.get("stats", {})
+            else:
+                pages, normalization = self._extract_pages(pdf_data, file.name)
+            if not pages:
+                return None
+            
+            stats = self.knowledge_base.replace_document(
+                doc_id, pages, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap, doc_name=file.name,
+                doc_metadata={"normalization": normalization} if normalization else None
+            )
+            logger.info(f"Arquivo {file.name} substituiu o documento {doc_id}: {stats}")
+            return stats
+        except Exception as e:
+            logger.error(f"Erro ao substituir documento com o arquivo {file.name}: {str(e)}")
+            return None
+    
     def process_multiple_files(self, files) -> Dict[str, str]:
         """
         Processa múltiplos arquivos PDF e adiciona à base de conhecimento.
@@ -129,21 +231,42 @@ class FileManager:
             overall_progress = st.progress(0)
             file_progress = st.empty()
             
+            # Extrair e dividir todos os arquivos antes de gerar os embeddings
+            documents = []
             for i, file in enumerate(files):
                 file_name = file.name
-                file_progress.text(f"Processando arquivo {i+1}/{len(files)}: {file_name}")
+                file_progress.text(f"Extraindo arquivo {i+1}/{len(files)}: {file_name}")
                 
-                # Processar o arquivo sem exibir progresso individual (para evitar poluição visual)
-                doc_id = self.process_file(file, display_progress=False)
+                try:
+                    pages, chunks, stats = self._load_pages_and_chunks(file)
+                except Exception as e:
+                    logger.error(f"Erro ao processar arquivo {file_name}: {str(e)}")
+                    pages, chunks, stats = [], [], {}
                 
-                if doc_id:
-                    results[file_name] = doc_id
-                    st.success(f"✅ {file_name} processado com sucesso")
+                if chunks:
+                    documents.append({
+                        "name": file_name,
+                        "chunks": chunks,
+                        "pages": pages,
+                        "metadata": {"normalization": stats} if stats else None
+                    })
                 else:
                     st.error(f"❌ Erro ao processar {file_name}")
                 
-                # Atualizar progresso geral
-                overall_progress.progress((i + 1) / len(files))
+                # Atualizar progresso geral (a extração ocupa a primeira metade)
+                overall_progress.progress((i + 1) / len(files) * 0.5)
+            
+            # Enviar os chunks de todos os arquivos juntos ao agendador de embeddings
+            if documents:
+                file_progress.text(f"Gerando embeddings de {len(documents)} arquivos...")
+                doc_ids = self.knowledge_base.add_documents(documents)
+                for document, doc_id in zip(documents, doc_ids):
+                    if doc_id:
+                        results[document["name"]] = doc_id
+                        st.success(f"✅ {document['name']} processado com sucesso")
+                    else:
+                        st.error(f"❌ Erro ao processar {document['name']}")
+            overall_progress.progress(1.0)
             
             # Limpar progresso individual ao finalizar
             file_progress.empty()
@@ -0,0 +1,171 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo padrão do cache de ingestão em disco
+DEFAULT_MAX_BYTES = int(os.getenv("INGEST_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+class IngestCache:
+    """
+    Cache em disco, endereçado por conteúdo, dos textos de página e chunks de PDFs já processados.
+
+    A chave combina o SHA-256 dos bytes do PDF com os parâmetros de chunking, de modo que
+    um reenvio do mesmo arquivo com os mesmos parâmetros não precisa de nova extração nem
+    de novo chunking. Quando o tamanho total passa do limite, as entradas usadas há mais
+    tempo são removidas.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Inicializa o cache de ingestão.
+
+        Args:
+            cache_dir: Diretório onde as entradas do cache são armazenadas
+            max_bytes: Tamanho total máximo das entradas, em bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = sum(entry["size"] for entry in self._list_entries())
+        logger.info(f"IngestCache inicializado em {self.cache_dir} ({self.total_bytes / (1024 * 1024):.1f} MB)")
+
+    @staticmethod
+    def make_key(pdf_bytes: bytes, **params: Any) -> str:
+        """
+        Calcula a chave de cache de um PDF.
+
+        Args:
+            pdf_bytes: Conteúdo do arquivo PDF
+            **params: Parâmetros que afetam o resultado (ex.: chunk_size, chunk_overlap)
+
+        Returns:
+            Chave no formato "<sha256 do PDF>-<hash dos parâmetros>"
+        """
+        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        params_hash = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        return f"{pdf_hash}-{params_hash}"
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _list_entries(self) -> List[Dict[str, Any]]:
+        """Lista as entradas do cache com tamanho e horário do último uso."""
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append({"path": path, "size": stat.st_size, "last_used": stat.st_mtime})
+        return entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca uma entrada do cache.
+
+        Args:
+            key: Chave calculada por make_key
+
+        Returns:
+            Dicionário com "pages", "chunks" e "stats", ou None se a entrada não existir
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Atualizar o horário de uso para a política de remoção
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Entrada de cache ilegível ({key}): {str(e)}")
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        logger.info(f"Cache de ingestão: acerto para {key[:12]}")
+        return value
+
+    def put(self, key: str, pages: List[Dict[str, Any]], chunks: List[Dict[str, Any]],
+            stats: Optional[Dict[str, Any]] = None):
+        """
+        Armazena os textos de página e os chunks de um PDF.
+
+        Args:
+            key: Chave calculada por make_key
+            pages: Registros de página extraídos
+            chunks: Chunks gerados a partir do texto
+            stats: Estatísticas opcionais do processamento (ex.: normalização)
+        """
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"pages": pages, "chunks": chunks, "stats": stats or {}}, f, ensure_ascii=False)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            # Substituição atômica: leitores nunca veem uma entrada parcial
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.total_bytes += os.path.getsize(path) - old_size
+        except Exception as e:
+            logger.error(f"Erro ao gravar entrada de cache ({key}): {str(e)}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+
+        self._evict()
+
+    def _evict(self):
+        """Remove as entradas usadas há mais tempo até que o tamanho total caiba no limite."""
+        with self._lock:
+            if self.total_bytes <= self.max_bytes:
+                return
+            entries = sorted(self._list_entries(), key=lambda entry: entry["last_used"])
+            self.total_bytes = sum(entry["size"] for entry in entries)
+            for entry in entries:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(entry["path"])
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= entry["size"]
+                self.evictions += 1
+                logger.info(f"Cache de ingestão: entrada removida {os.path.basename(entry['path'])}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna as estatísticas do cache.
+
+        Returns:
+            Dicionário com acertos, erros, taxa de acerto, remoções, entradas e bytes ocupados
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._list_entries()),
+                "bytes": self.total_bytes
+            }
@@ -0,0 +1,199 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Any, Optional, Tuple
+
+from embedding_cache import CachedEmbeddings
+from knowledge_base import KnowledgeBase
+from search_results import SearchResults
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class _ReadWriteLock:
+    """Lock de leitores e escritor, com preferência para o escritor (buscas não atrasam a ingestão indefinidamente)."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+class KnowledgeBaseService:
+    """
+    Base de conhecimento compartilhada pelas sessões do processo com a mesma chave de API.
+
+    Uma única KnowledgeBase (índice, banco de chunks e cache de consultas) atende essas
+    sessões, que guardam apenas uma referência ao serviço. Buscas e leituras rodam em
+    paralelo; alterações são serializadas e exclusivas. Com cache de embeddings persistente,
+    os embeddings de um documento novo são gerados antes de bloquear as buscas, de modo que a
+    parte exclusiva da ingestão se limita a gravar o índice e o banco.
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase):
+        """
+        Args:
+            knowledge_base: Base de conhecimento atendida pelo serviço
+        """
+        self.knowledge_base = knowledge_base
+        self._lock = _ReadWriteLock()
+        self._ingest_lock = threading.Lock()
+
+    @property
+    def kb_path(self) -> str:
+        return self.knowledge_base.kb_path
+
+    @property
+    def read_only(self) -> bool:
+        return self.knowledge_base.read_only
+
+    @property
+    def openai_api_key(self) -> Optional[str]:
+        return self.knowledge_base.openai_api_key
+
+    @property
+    def embeddings(self):
+        return self.knowledge_base.embeddings
+
+    @property
+    def query_embedder(self):
+        return self.knowledge_base.query_embedder
+
+    @contextmanager
+    def _write(self):
+        """
+        Exclusão das buscas para uma alteração, adquirida depois do lock de escrita da base:
+        uma fusão de segmentos em andamento (que usa esse lock) atrasa apenas a alteração, sem
+        bloquear as buscas enquanto a alteração espera.
+        """
+        with self.knowledge_base._exclusive() if not self.read_only else nullcontext(), self._lock.write():
+            yield
+
+    def _prefetch_embeddings(self, texts: List[str]):
+        """Grava no cache persistente os embeddings de textos, fora da parte exclusiva da ingestão."""
+        if texts and isinstance(self.knowledge_base.embeddings, CachedEmbeddings):
+            self.knowledge_base.embeddings.embed_documents(texts)
+
+    # Leituras (em paralelo)
+
+    def similarity_search(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        """Ver KnowledgeBase.similarity_search."""
+        with self._lock.read():
+            return self.knowledge_base.similarity_search(*args, **kwargs)
+
+    def batch_similarity_search(self, *args, **kwargs) -> SearchResults:
+        """
+        Ver KnowledgeBase.batch_similarity_search. O texto dos resultados é lido sob demanda,
+        fora do lock: chunks removidos nesse intervalo são omitidos.
+        """
+        with self._lock.read():
+            return self.knowledge_base.batch_similarity_search(*args, **kwargs)
+
+    def get_all_documents(self) -> Dict[str, Dict[str, Any]]:
+        """Cópia dos registros de todos os documentos (ver KnowledgeBase.get_all_documents)."""
+        with self._lock.read():
+            return dict(self.knowledge_base.get_all_documents())
+
+    def get_index_stats(self) -> Dict[str, Any]:
+        """Ver KnowledgeBase.get_index_stats."""
+        with self._lock.read():
+            return self.knowledge_base.get_index_stats()
+
+    # Alterações (serializadas e exclusivas)
+
+    def add_document(self, doc_name: str, chunks_with_metadata: List[Dict[str, Any]], *args, **kwargs) -> Optional[str]:
+        """Ver KnowledgeBase.add_document."""
+        with self._ingest_lock:
+            self._prefetch_embeddings([chunk["content"] for chunk in chunks_with_metadata])
+            with self._write():
+                return self.knowledge_base.add_document(doc_name, chunks_with_metadata, *args, **kwargs)
+
+    def add_documents(self, documents: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Ver KnowledgeBase.add_documents."""
+        with self._ingest_lock:
+            self._prefetch_embeddings([chunk["content"] for document in documents for chunk in document["chunks"]])
+            with self._write():
+                return self.knowledge_base.add_documents(documents)
+
+    def replace_document(self, *args, **kwargs) -> Optional[Dict[str, int]]:
+        """Ver KnowledgeBase.replace_document."""
+        with self._ingest_lock, self._write():
+            return self.knowledge_base.replace_document(*args, **kwargs)
+
+    def remove_document(self, doc_id: str) -> bool:
+        """Ver KnowledgeBase.remove_document."""
+        with self._ingest_lock, self._write():
+            return self.knowledge_base.remove_document(doc_id)
+
+    def compact(self) -> int:
+        """Ver KnowledgeBase.compact."""
+        with self._ingest_lock, self._write():
+            return self.knowledge_base.compact()
+
+    def set_num_shards(self, num_shards: int) -> int:
+        """Ver KnowledgeBase.set_num_shards."""
+        with self._ingest_lock, self._write():
+            return self.knowledge_base.set_num_shards(num_shards)
+
+_services: Dict[Tuple[str, Optional[str]], KnowledgeBaseService] = {}
+_services_lock = threading.Lock()
+
+def get_knowledge_base_service(kb_path: str = "knowledge_base", openai_api_key: Optional[str] = None,
+                               **kwargs) -> KnowledgeBaseService:
+    """
+    Retorna o serviço do processo para uma base de conhecimento, criando-o na primeira chamada.
+
+    Todas as chamadas com o mesmo diretório e a mesma chave de API recebem o mesmo serviço, de
+    modo que a base é carregada uma única vez, qualquer que seja o número de sessões. Sessões
+    com outra chave recebem um serviço próprio sobre o mesmo diretório (o lock de arquivo
+    serializa as alterações e cada serviço carrega as versões publicadas pelos demais), e as
+    requisições de embeddings de cada sessão usam sempre a sua chave.
+
+    Args:
+        kb_path: Diretório da base de conhecimento
+        openai_api_key: Chave de API da OpenAI (opcional, pode ser definida como variável de ambiente)
+        **kwargs: Demais argumentos de KnowledgeBase, usados apenas na criação
+
+    Returns:
+        Instância de KnowledgeBaseService
+    """
+    key = (os.path.abspath(kb_path), openai_api_key or os.getenv("OPENAI_API_KEY"))
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = _services[key] = KnowledgeBaseService(
+                KnowledgeBase(openai_api_key=openai_api_key, kb_path=kb_path, **kwargs)
+            )
+            logger.info(f"Serviço da base de conhecimento criado para: {key[0]}")
+        return service
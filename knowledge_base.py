@@ -1,214 +1,1100 @@
 import os
+import json
+import time
+import shutil
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
 import pickle
 import uuid
 from datetime import datetime
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import numpy as np
+import faiss
+from langchain_core.embeddings import Embeddings
+
+from pdf_processor import chunk_pdf_text, join_pages, hash_pages, map_unchanged_pages
+from embeddings_backend import create_embeddings
+from faiss_index import FaissIndex, VectorFile, DEFAULT_INDEX_TYPE, DEFAULT_QUANTIZATION
+from segmented_index import SegmentedIndex, MANIFEST_NAME
+from sharded_index import ShardedIndex, SHARDS_MANIFEST_NAME, shard_names
+from chunk_store import load_chunks
+from docstore import DocStore
+from search_results import SearchResults
+from doc_router import DocumentRouter
+from query_embedding import get_query_embedder
+from write_ahead_log import InterProcessLock, WriteAheadLog
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Fração de vetores excluídos a partir da qual o índice é compactado automaticamente
+COMPACTION_THRESHOLD = float(os.getenv("KB_COMPACTION_THRESHOLD", "0.2"))
+
+# Abrir a base somente para leitura, com o índice mapeado em memória
+READ_ONLY = os.getenv("KB_READ_ONLY", "false").lower() in ("1", "true", "yes")
+
+# Número de shards do índice (1 = índice único)
+NUM_SHARDS = int(os.getenv("KB_NUM_SHARDS", "1"))
+
+# Número de documentos consultados na busca roteada (0 = busca em todos os chunks)
+ROUTE_DOCUMENTS = int(os.getenv("KB_ROUTE_DOCUMENTS", "0"))
+
+# Intervalo mínimo, em segundos, entre as verificações de nova versão da base publicada por outro processo
+RELOAD_INTERVAL = float(os.getenv("KB_RELOAD_INTERVAL", "1"))
+
+# Arquivo com a versão publicada da base, substituído atomicamente a cada alteração salva
+CURRENT_NAME = "CURRENT"
+
+# Arquivo de lock dos escritores e registro da operação de escrita em andamento
+LOCK_NAME = "LOCK"
+WAL_NAME = "wal.json"
+
+# Campos de filtro avaliados no registro do documento (os demais, nos metadados do chunk)
+DOCUMENT_FILTER_FIELDS = ("name", "added_at", "updated_at")
+
+def _matches(value: Any, condition: Any) -> bool:
+    """
+    Verifica se um valor satisfaz uma condição de filtro.
+
+    A condição pode ser um valor (igualdade), uma tupla (mínimo, máximo) com limites
+    inclusivos e None para limite aberto, ou uma função que recebe o valor.
+    """
+    if value is None:
+        return False
+    if callable(condition):
+        return bool(condition(value))
+    if isinstance(condition, tuple):
+        low, high = condition
+        return (low is None or value >= low) and (high is None or value <= high)
+    return value == condition
+
 class KnowledgeBase:
     """
-    Classe para gerenciar uma base de conhecimento com múltiplos documentos usando FAISS e embeddings da OpenAI.
+    Classe para gerenciar uma base de conhecimento com múltiplos documentos usando FAISS e embeddings
+    (por padrão, da OpenAI).
+    
+    Cada chunk recebe um ID inteiro estável, usado como ID do seu vetor no índice FAISS
+    (IndexIDMap2); remover um documento exclui exatamente os vetores dos seus chunks, sem
+    gerar embeddings novamente. Textos e metadados dos chunks e os registros dos documentos
+    ficam em um banco SQLite (DocStore): as buscas leem o texto apenas dos resultados finais.
+    
+    Com mais de um shard, os vetores de cada documento ficam no shard escolhido pelo hash do
+    seu ID e as buscas consultam os shards em paralelo (ShardedIndex).
+    
+    Cada alteração salva publica uma nova versão da base no arquivo CURRENT, gravado depois do
+    índice e do banco. Bases abertas somente para leitura verificam esse arquivo antes das
+    buscas e, se houver versão nova, carregam o novo índice e trocam a referência, sem
+    interromper as buscas em andamento.
+    
+    Cada documento tem um centróide (média dos vetores dos seus chunks), gravado no banco com
+    o documento. Na busca roteada, as consultas são comparadas primeiro com os centróides, e
+    apenas os chunks dos documentos mais próximos são buscados.
+    
+    Alterações são exclusivas entre processos (lock de arquivo): ao adquirir o lock, o escritor
+    carrega as versões publicadas por outros processos. Cada operação é registrada em um log de
+    escrita antes de gravar o banco (ponto de confirmação) e o índice; uma operação interrompida
+    é concluída ou desfeita no próximo acesso de escrita.
     """
     
-    def __init__(self, openai_api_key: Optional[str] = None, kb_path: str = "knowledge_base"):
+    def __init__(self, openai_api_key: Optional[str] = None, kb_path: str = "knowledge_base",
+                 embeddings: Optional[Embeddings] = None, compaction_threshold: float = COMPACTION_THRESHOLD,
+                 index_type: str = DEFAULT_INDEX_TYPE, quantization: str = DEFAULT_QUANTIZATION,
+                 read_only: bool = READ_ONLY, num_shards: int = NUM_SHARDS,
+                 reload_interval: float = RELOAD_INTERVAL, route_documents: int = ROUTE_DOCUMENTS):
         """
         Inicializa a base de conhecimento.
         
         Args:
             openai_api_key: Chave de API da OpenAI (opcional, pode ser definida como variável de ambiente)
             kb_path: Caminho para armazenar a base de conhecimento
+            embeddings: Backend de embeddings (padrão: o configurado em EMBEDDING_BACKEND)
+            compaction_threshold: Fração de vetores excluídos que dispara a compactação do índice
+            index_type: Tipo do índice FAISS ("flat", "ivf_flat", "ivf_pq", "hnsw" ou "auto")
+            quantization: Codificação dos vetores no índice ("none", "fp16", "sq8" ou "pq"); os vetores
+                completos ficam em disco e são usados para reordenar os candidatos de cada busca
+            read_only: Abrir a base somente para leitura: o índice é mapeado em memória em vez
+                de lido e o banco de chunks é aberto sem escrita, o que torna a abertura rápida e
+                permite que vários processos compartilhem as mesmas páginas; alterações são recusadas
+            num_shards: Número de shards de um índice novo; uma base existente mantém o número de
+                shards gravado, que só muda com set_num_shards
+            reload_interval: Intervalo mínimo, em segundos, entre as verificações de nova versão
+                da base publicada por outros processos, feitas antes das buscas
+            route_documents: Número de documentos cujos chunks são buscados em cada consulta,
+                escolhidos pelo centróide (0 = busca em todos os chunks)
         """
         self.openai_api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
         if not self.openai_api_key:
             logger.warning("Chave de API da OpenAI não fornecida. Defina OPENAI_API_KEY como variável de ambiente.")
         
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            openai_api_key=self.openai_api_key
-        )
-        
         self.kb_path = kb_path
         os.makedirs(self.kb_path, exist_ok=True)
         
-        self.vector_store = None
+        self.embeddings = embeddings or create_embeddings(
+            openai_api_key=self.openai_api_key,
+            cache_path=os.path.join(self.kb_path, "embeddings.sqlite")
+        )
+        # Embeddings das consultas, com cache e agrupamento compartilhados pelo processo
+        self.query_embedder = get_query_embedder(self.embeddings)
+        self.compaction_threshold = compaction_threshold
+        self.index_type = index_type
+        self.quantization = quantization
+        self.read_only = read_only
+        self.num_shards = num_shards
+        self.reload_interval = reload_interval
+        self.route_documents = route_documents
+        
+        self.index = None
         self.documents = {}  # Dicionário para rastrear documentos adicionados
-        self.metadata_path = os.path.join(self.kb_path, "metadata.pkl")
+        self.router = DocumentRouter()  # Centróides dos documentos, para a busca roteada
+        self.next_chunk_id = 0
+        self.index_path = os.path.join(self.kb_path, "segments")
+        self.shards_path = os.path.join(self.kb_path, "shards")
+        self.vectors_path = os.path.join(self.kb_path, "vectors.f32")
+        self.current_path = os.path.join(self.kb_path, CURRENT_NAME)
+        self._reload_lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._write_lock = InterProcessLock(os.path.join(self.kb_path, LOCK_NAME))
+        self.wal = WriteAheadLog(os.path.join(self.kb_path, WAL_NAME))
+        self._pending_added: List[int] = []  # IDs de chunks alterados na operação em andamento
+        self._pending_removed: List[int] = []
         
-        # Carregar metadados existentes, se houver
-        self._load_metadata()
+        # Versão publicada da base, lida antes do índice para que uma versão publicada durante o
+        # carregamento seja detectada na próxima verificação
+        self.generation, self._current_stat = self._read_current()
         
-        # Carregar o índice FAISS existente, se houver
-        self._load_index()
+        # Textos e metadados dos chunks e registros dos documentos
+        self.docstore = DocStore(os.path.join(self.kb_path, "docstore.sqlite"), read_only=read_only)
+        
+        if self.read_only:
+            # Carregar metadados existentes, se houver
+            self._load_metadata()
+            
+            # Carregar o índice FAISS e os chunks existentes, se houver
+            self._load_index()
+            self._load_centroids()
+        else:
+            # Migrações, recuperação de operações interrompidas e publicação da primeira versão
+            # com o lock de escrita
+            with self._exclusive(sync=False):
+                self._load_metadata()
+                self._load_index()
+                self._recover()
+                self._load_centroids()
+                if self._current_stat is None:
+                    self._publish()
         
-        logger.info("KnowledgeBase inicializada com modelo text-embedding-3-small")
+        logger.info(f"KnowledgeBase inicializada com modelo {getattr(self.embeddings, 'model', type(self.embeddings).__name__)}")
     
     def _load_metadata(self):
-        """Carrega os metadados da base de conhecimento do disco."""
-        if os.path.exists(self.metadata_path):
-            try:
-                with open(self.metadata_path, 'rb') as f:
-                    self.documents = pickle.load(f)
-                logger.info(f"Metadados carregados: {len(self.documents)} documentos encontrados")
-            except Exception as e:
-                logger.error(f"Erro ao carregar metadados: {str(e)}")
-                self.documents = {}
+        """Carrega os registros dos documentos do banco, migrando os arquivos antigos se necessário."""
+        if os.path.exists(os.path.join(self.kb_path, "metadata.pkl")):
+            if self.read_only:
+                logger.error("Metadados no formato antigo não podem ser migrados em modo somente leitura")
+                return
+            self._migrate_legacy_metadata()
+        try:
+            self.documents = self.docstore.load_documents()
+            self.next_chunk_id = self.docstore.get_property("next_chunk_id")
+            logger.info(f"Metadados carregados: {len(self.documents)} documentos encontrados")
+        except Exception as e:
+            logger.error(f"Erro ao carregar metadados: {str(e)}")
+            self.documents = {}
     
-    def _save_metadata(self):
-        """Salva os metadados da base de conhecimento no disco."""
+    def _migrate_legacy_metadata(self):
+        """
+        Converte para o banco os metadados (metadata.pkl) e os chunks (chunks.bin ou chunks.pkl)
+        salvos pelas versões anteriores, removendo os arquivos antigos.
+        
+        Chunks de documentos que já não constam nos metadados são descartados.
+        """
+        metadata_path = os.path.join(self.kb_path, "metadata.pkl")
+        chunks_path = os.path.join(self.kb_path, "chunks.bin")
+        legacy_chunks_path = os.path.join(self.kb_path, "chunks.pkl")
         try:
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(self.documents, f)
+            with open(metadata_path, 'rb') as f:
+                documents = pickle.load(f)
+            chunks, next_chunk_id = {}, 0
+            if os.path.exists(chunks_path):
+                chunks, next_chunk_id = load_chunks(chunks_path)
+            elif os.path.exists(legacy_chunks_path):
+                with open(legacy_chunks_path, 'rb') as f:
+                    data = pickle.load(f)
+                chunks, next_chunk_id = data["chunks"], data["next_id"]
+            
+            for doc_id, doc_info in documents.items():
+                doc_info.pop("chunk_ids", None)
+                self.docstore.put_document(doc_id, doc_info)
+            self.docstore.put_chunks([
+                (chunk_id, chunk["content"], chunk["metadata"]) for chunk_id, chunk in chunks.items()
+                if chunk["metadata"].get("doc_id") in documents
+            ])
+            self.docstore.set_property("next_chunk_id", next_chunk_id)
+            self.docstore.commit()
+            
+            for path in (metadata_path, chunks_path, legacy_chunks_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info(f"Metadados antigos migrados: {len(documents)} documentos, {len(chunks)} chunks")
+        except Exception as e:
+            logger.error(f"Erro ao migrar metadados antigos: {str(e)}")
+            self.docstore.rollback()
+    
+    def _save_metadata(self) -> bool:
+        """Grava no banco as alterações pendentes dos documentos e chunks."""
+        try:
+            self.docstore.set_property("next_chunk_id", self.next_chunk_id)
+            self.docstore.commit()
             logger.info(f"Metadados salvos: {len(self.documents)} documentos")
+            return True
         except Exception as e:
             logger.error(f"Erro ao salvar metadados: {str(e)}")
+            return False
+    
+    def _index_options(self) -> Dict[str, Any]:
+        """Opções de criação e carregamento do índice FAISS."""
+        options = {"index_type": self.index_type, "quantization": self.quantization, "vectors_path": self.vectors_path}
+        if not self.read_only:
+            # Fusões de segmentos em segundo plano com o lock de escrita, publicadas como nova versão
+            options.update(merge_lock=self._write_lock, on_merge=self._publish)
+        return options
     
     def _load_index(self):
-        """Carrega o índice FAISS do disco."""
-        index_path = os.path.join(self.kb_path, "index")
-        if os.path.exists(index_path):
+        """Carrega o índice FAISS do disco, migrando os formatos antigos se necessário."""
+        legacy_path = os.path.join(self.kb_path, "index")
+        single_path = os.path.join(self.kb_path, "index.faiss")
+        sharded = os.path.exists(os.path.join(self.shards_path, SHARDS_MANIFEST_NAME))
+        segmented = os.path.exists(os.path.join(self.index_path, MANIFEST_NAME))
+        if sharded or segmented or os.path.exists(single_path):
             try:
-                self.vector_store = FAISS.load_local(
-                    folder_path=index_path,
-                    embeddings=self.embeddings
-                )
-                logger.info(f"Índice FAISS carregado de: {index_path}")
+                self.index = self._open_index()
+                logger.info(f"Índice FAISS carregado de: {self._current_index_path()} ({self.index.num_active} vetores)")
             except Exception as e:
                 logger.error(f"Erro ao carregar índice FAISS: {str(e)}")
-                self.vector_store = None
+                self.index = None
+            if self.index is not None:
+                # Abrir a base não redistribui os documentos: o número de shards gravado prevalece
+                self.num_shards = self._num_index_shards()
+        elif os.path.isdir(legacy_path):
+            if self.read_only:
+                logger.error("Índice no formato antigo não pode ser migrado em modo somente leitura")
+            else:
+                self._migrate_legacy_index(legacy_path)
+    
+    def _open_index(self):
+        """Abre o índice salvo no formato atual (com ou sem shards), ou None se não houver."""
+        single_path = os.path.join(self.kb_path, "index.faiss")
+        if os.path.exists(os.path.join(self.shards_path, SHARDS_MANIFEST_NAME)):
+            return ShardedIndex.load(self.shards_path, mmap=self.read_only, **self._index_options())
+        if os.path.exists(os.path.join(self.index_path, MANIFEST_NAME)):
+            return SegmentedIndex.load(self.index_path, mmap=self.read_only, **self._index_options())
+        if not os.path.exists(single_path):
+            return None
+        if self.read_only:
+            # Índice em arquivo único (versão anterior), servido sem conversão
+            return FaissIndex.load(single_path, mmap=True, **self._index_options())
+        return SegmentedIndex.from_index_file(single_path, self.index_path, **self._index_options())
+    
+    def _read_current(self) -> Tuple[int, Optional[Tuple[int, int]]]:
+        """Lê a versão publicada da base e a identificação (mtime, tamanho) do arquivo CURRENT."""
+        try:
+            stat = os.stat(self.current_path)
+            with open(self.current_path) as f:
+                return json.load(f)["generation"], (stat.st_mtime_ns, stat.st_size)
+        except (OSError, ValueError, KeyError):
+            return 0, None
+    
+    def _publish(self):
+        """Publica uma nova versão da base, substituindo o arquivo CURRENT atomicamente."""
+        try:
+            generation = self.generation + 1
+            with open(f"{self.current_path}.tmp", "w") as f:
+                json.dump({"generation": generation}, f)
+            os.replace(f"{self.current_path}.tmp", self.current_path)
+            self.generation = generation
+        except Exception as e:
+            logger.error(f"Erro ao publicar a versão da base: {str(e)}")
+    
+    def _maybe_reload(self):
+        """
+        Carrega a versão publicada da base se ela mudou (por outro processo ou outra instância).
+        
+        A verificação (um stat do arquivo CURRENT) é feita no máximo uma vez a cada
+        reload_interval segundos. Apenas uma thread carrega a nova versão; as demais continuam
+        buscando na versão anterior até a troca das referências. Em uma base gravável, a nova
+        versão é carregada com o lock de escrita, como no início de uma alteração, para não
+        concorrer com as escritas desta instância; as leituras não esperam o lock.
+        """
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.current_path)
+            except OSError:
+                return
+            if (stat.st_mtime_ns, stat.st_size) == self._current_stat:
+                return
+            generation, current_stat = self._read_current()
+            if generation == self.generation:
+                self._current_stat = current_stat
+                return
+            
+            if self.read_only:
+                self._reload_state()
+            elif self._write_lock.acquire(blocking=False):
+                # Com o lock de escrita, como no início de uma alteração; se uma alteração ou
+                # fusão estiver em andamento, a versão é verificada de novo no próximo intervalo
+                try:
+                    if self._write_lock.depth == 1:
+                        self._sync()
+                finally:
+                    self._write_lock.release()
+        except Exception as e:
+            logger.error(f"Erro ao carregar nova versão da base: {str(e)}")
+        finally:
+            self._reload_lock.release()
+    
+    def _reload_state(self):
+        """Carrega a versão da base gravada em disco: índice, documentos e próximo ID de chunk."""
+        generation, current_stat = self._read_current()
+        if not self.read_only and self.index is not None:
+            # Fusões pendentes do índice anterior não devem publicar sobre a versão carregada
+            self.index.stop_merges()
+        index = self._open_index()
+        docstore = self.docstore
+        if self.read_only:
+            # Nova conexão: o banco pode não existir quando a base foi aberta
+            docstore = DocStore(os.path.join(self.kb_path, "docstore.sqlite"), read_only=True)
+        documents = docstore.load_documents()
+        next_chunk_id = docstore.get_property("next_chunk_id")
+        self.index, self.docstore, self.documents, self.next_chunk_id = index, docstore, documents, next_chunk_id
+        if index is not None:
+            self.num_shards = self._num_index_shards()
+        self.generation, self._current_stat = generation, current_stat
+        self._load_centroids()
+        logger.info(f"Versão {generation} da base carregada: {len(documents)} documentos, "
+                    f"{index.num_active if index is not None else 0} vetores")
+    
+    @contextmanager
+    def _exclusive(self, sync: bool = True):
+        """
+        Lock de escrita da base, exclusivo entre threads e processos (reentrante).
+        
+        Na aquisição mais externa, carrega as alterações publicadas por outros processos e
+        recupera uma operação interrompida (sync). As fusões de segmentos iniciadas pela
+        alteração rodam depois, em segundo plano, adquirindo o mesmo lock (o índice em disco só
+        muda com o lock, sem que o escritor espere as fusões).
+        """
+        with self._write_lock:
+            if self._write_lock.depth == 1:
+                self._pending_added, self._pending_removed = [], []
+                if sync:
+                    self._sync()
+            yield
+    
+    def _sync(self):
+        """Atualiza a base com as versões publicadas por outros escritores e recupera operações interrompidas."""
+        generation, _ = self._read_current()
+        if generation != self.generation:
+            logger.info(f"Base alterada por outro processo (versão {generation}); recarregando")
+            self._reload_state()
+        self._recover()
+    
+    def _recover(self):
+        """
+        Conclui ou desfaz a operação registrada no log de escrita, se houver (interrompida por
+        uma falha do processo ou por um erro).
+        
+        O banco é gravado antes do índice, em uma transação atômica: chunks registrados que
+        estão no banco e faltam no índice são adicionados a partir do arquivo de vetores
+        completos, e os que não estão no banco são excluídos do índice. Os IDs registrados não
+        são reutilizados.
+        """
+        self._skip_unregistered_vector_ids()
+        entry = self.wal.read()
+        if entry is None:
+            return
+        try:
+            added = entry["added"]
+            ids = np.union1d(added, entry["removed"])
+            stored = self.docstore.get_chunks(ids.tolist())
+            in_store = np.isin(ids, np.fromiter(stored, dtype=np.int64, count=len(stored)))
+            active = self.index.contains(ids) if self.index is not None else np.zeros(len(ids), dtype=bool)
+            restore = ids[in_store & ~active & np.isin(ids, added)]
+            discard = ids[~in_store & active]
+            if len(restore):
+                if self.index is None:
+                    self.index = self._new_index(entry["dimension"])
+                vectors = VectorFile(self.vectors_path, self.index.dimension).read(restore)
+                self._add_vectors(vectors, restore, [stored[chunk_id]["metadata"]["doc_id"] for chunk_id in restore.tolist()])
+            if len(discard):
+                self._remove_vectors(discard.tolist())
+            if len(added):
+                self.next_chunk_id = max(self.next_chunk_id, int(added.max()) + 1)
+            self.documents = self.docstore.load_documents()
+            self._save()
+            self._load_centroids()
+            logger.warning(f"Operação interrompida recuperada: {len(restore)} vetores restaurados, "
+                           f"{len(discard)} descartados")
+        except Exception as e:
+            logger.error(f"Erro ao recuperar operação interrompida: {str(e)}")
+    
+    def _skip_unregistered_vector_ids(self):
+        """
+        Avança o próximo ID de chunk além das linhas do arquivo de vetores gravadas por uma
+        operação que falhou antes de registrar-se no log de escrita.
+        
+        Essas linhas não pertencem a nenhum chunk, e a compactação do arquivo recusa os seus IDs
+        nas gravações seguintes; por isso eles não são reutilizados.
+        """
+        if self.index is None or not os.path.exists(self.vectors_path):
+            return
+        id_limit = VectorFile(self.vectors_path, self.index.dimension).id_limit
+        if id_limit <= self.next_chunk_id:
+            return
+        logger.warning(f"IDs {self.next_chunk_id} a {id_limit - 1} gravados no arquivo de vetores por uma "
+                       f"operação que falhou; não serão reutilizados")
+        self.next_chunk_id = id_limit
+        self.docstore.set_property("next_chunk_id", id_limit)
+        self.docstore.commit()
+    
+    def _rollback(self):
+        """Descarta as alterações não gravadas de uma operação que falhou, voltando à versão em disco."""
+        self.docstore.rollback()
+        if self._pending_added or self._pending_removed or self.wal.pending():
+            try:
+                self._reload_state()
+                self._recover()
+            except Exception as e:
+                logger.error(f"Erro ao recarregar a base após falha: {str(e)}")
+        self._pending_added, self._pending_removed = [], []
+    
+    def _num_index_shards(self) -> int:
+        """Número de shards do índice carregado (1 para o índice único)."""
+        return getattr(self.index, "num_shards", 1)
+    
+    def _current_index_path(self) -> str:
+        """Diretório do índice carregado (com ou sem shards)."""
+        return self.shards_path if isinstance(self.index, ShardedIndex) else self.index_path
+    
+    def _new_index(self, dimension: int):
+        """Cria um índice vazio, dividido em shards se configurado."""
+        if self.num_shards > 1:
+            return ShardedIndex(dimension, shard_names(self.num_shards), **self._index_options())
+        return SegmentedIndex(dimension, **self._index_options())
+    
+    def _check_writable(self) -> bool:
+        """Verifica se a base pode ser alterada, registrando um erro caso contrário."""
+        if self.read_only:
+            logger.error("Base de conhecimento aberta em modo somente leitura; alteração recusada")
+        return not self.read_only
+    
+    def _migrate_legacy_index(self, legacy_path: str):
+        """
+        Converte um índice salvo pelo wrapper FAISS do LangChain (docstore com IDs UUID)
+        para o índice com IDs inteiros, reaproveitando os vetores existentes.
+        
+        Chunks de documentos que já não constam nos metadados (removidos quando a remoção
+        não afetava o índice) são descartados na migração.
+        """
+        try:
+            legacy_index = faiss.read_index(os.path.join(legacy_path, "index.faiss"))
+            with open(os.path.join(legacy_path, "index.pkl"), 'rb') as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            
+            vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+            positions, chunks = [], []
+            for position, docstore_id in sorted(index_to_docstore_id.items()):
+                doc = docstore.search(docstore_id)
+                if doc.metadata.get("doc_id") not in self.documents:
+                    continue
+                chunks.append((self.next_chunk_id, doc.page_content, doc.metadata))
+                self.next_chunk_id += 1
+                positions.append(position)
+            
+            ids = [chunk_id for chunk_id, _, _ in chunks]
+            self.index = self._new_index(legacy_index.d)
+            if ids:
+                self._add_vectors(vectors[positions], np.array(ids, dtype=np.int64),
+                                  [metadata["doc_id"] for _, _, metadata in chunks])
+            self.docstore.put_chunks(chunks)
+            
+            self._save()
+            os.replace(legacy_path, f"{legacy_path}.migrated")
+            logger.info(f"Índice antigo migrado: {len(ids)} de {legacy_index.ntotal} vetores mantidos")
+        except Exception as e:
+            logger.error(f"Erro ao migrar índice FAISS antigo: {str(e)}")
+            self.docstore.rollback()
+            self.index = None
+            self.next_chunk_id = 0
     
     def _save_index(self):
-        """Salva o índice FAISS no disco."""
-        if not self.vector_store:
+        """Salva no disco os vetores adicionados e as exclusões desde o último save (novo segmento do índice)."""
+        if not self.index:
             logger.warning("Nenhum índice FAISS para salvar")
             return False
         
         try:
-            index_path = os.path.join(self.kb_path, "index")
-            self.vector_store.save_local(index_path)
-            logger.info(f"Índice FAISS salvo em: {index_path}")
+            self.index.save(self._current_index_path())
+            logger.info(f"Índice FAISS salvo em: {self._current_index_path()}")
             return True
         except Exception as e:
             logger.error(f"Erro ao salvar índice FAISS: {str(e)}")
             return False
     
-    def add_document(self, doc_name: str, chunks_with_metadata: List[Dict[str, Any]]) -> str:
+    def _save(self):
+        """
+        Grava a operação em andamento: registra no log os IDs dos chunks alterados, grava o
+        banco (ponto de confirmação), compacta o índice se houve remoções, salva o índice e
+        publica a nova versão; o registro é apagado quando o índice foi salvo.
+        """
+        self.wal.write(self._pending_added, self._pending_removed, getattr(self.index, "dimension", None))
+        if not self._save_metadata():
+            raise RuntimeError("Falha ao gravar o banco de chunks; operação desfeita")
+        removed = self._pending_removed
+        self._pending_added, self._pending_removed = [], []
+        if removed:
+            self._maybe_compact()
+        if self.index is None or self._save_index():
+            self.wal.clear()
+        self._publish()
+    
+    def _chunk_metadata(self, chunk: Dict[str, Any], doc_id: str, doc_name: str) -> Dict[str, Any]:
+        """Monta os metadados armazenados no índice para um chunk."""
+        metadata = {
+            "chunk_id": chunk["chunk_id"],
+            "title": chunk["title"],
+            "token_count": chunk["token_count"],
+            "doc_id": doc_id,
+            "doc_name": doc_name
+        }
+        # Proveniência de página e posição no texto, quando disponíveis
+        for key in ("page_start", "page_end", "start_char", "end_char"):
+            if key in chunk:
+                metadata[key] = chunk[key]
+        return metadata
+    
+    def _document_chunk_ids(self, doc_id: str) -> List[int]:
+        """Retorna os IDs dos vetores dos chunks de um documento, na ordem do texto."""
+        return self.docstore.chunk_ids(doc_id)
+    
+    def _add_vectors(self, vectors: np.ndarray, ids: np.ndarray, doc_ids: List[str]):
+        """Adiciona vetores ao índice; com shards, cada um vai para o shard do seu documento."""
+        if isinstance(self.index, ShardedIndex):
+            self.index.add(vectors, ids, doc_ids)
+        else:
+            self.index.add(vectors, ids)
+        self._pending_added.extend(np.asarray(ids).tolist())
+    
+    def _remove_vectors(self, ids: List[int]):
+        """Exclui vetores do índice pelos IDs dos chunks."""
+        self.index.remove(ids)
+        self._pending_removed.extend(ids)
+    
+    def _load_centroids(self):
+        """
+        Carrega os centróides dos documentos do banco. Os que faltam (bases criadas antes da
+        busca roteada) são calculados a partir do arquivo de vetores completos e, se a base
+        não for somente leitura, gravados.
+        """
+        router = DocumentRouter()
+        try:
+            centroids = self.docstore.load_centroids()
+            missing = [doc_id for doc_id in self.documents if doc_id not in centroids]
+            if missing and self.index is not None:
+                centroids.update(self._compute_centroids(missing))
+                if not self.read_only:
+                    for doc_id in missing:
+                        if doc_id in centroids:
+                            self.docstore.put_centroid(doc_id, centroids[doc_id])
+                    self.docstore.commit()
+                logger.info(f"Centróides calculados para {len(missing)} documentos")
+            for doc_id in self.documents:
+                if doc_id in centroids:
+                    router.set(doc_id, centroids[doc_id])
+        except Exception as e:
+            logger.error(f"Erro ao carregar centróides dos documentos: {str(e)}")
+        self.router = router
+    
+    def _compute_centroids(self, doc_ids: List[str]) -> Dict[str, np.ndarray]:
+        """Calcula a média dos vetores completos dos chunks de cada documento (sem chunks: omitido)."""
+        vectors = VectorFile(self.vectors_path, self.index.dimension)
+        centroids = {}
+        for doc_id in doc_ids:
+            chunk_ids = self._document_chunk_ids(doc_id)
+            if chunk_ids:
+                centroids[doc_id] = vectors.read(chunk_ids).mean(axis=0)
+        return centroids
+    
+    def _update_centroids(self, doc_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Recalcula os centróides de documentos alterados e os grava na transação pendente.
+        
+        Returns:
+            Centróides, pelo ID do documento, a aplicar ao roteador depois de salvar a operação
+        """
+        centroids = self._compute_centroids(doc_ids)
+        for doc_id, centroid in centroids.items():
+            self.docstore.put_centroid(doc_id, centroid)
+        return centroids
+    
+    def _embed_and_add(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> List[int]:
+        """
+        Gera os embeddings de textos e os adiciona ao índice com novos IDs inteiros.
+        
+        Returns:
+            IDs atribuídos, na mesma ordem dos textos
+        """
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        ids = np.arange(self.next_chunk_id, self.next_chunk_id + len(texts), dtype=np.int64)
+        
+        if self.index is None:
+            self.index = self._new_index(vectors.shape[1])
+        self._add_vectors(vectors, ids, [metadata["doc_id"] for metadata in metadatas])
+        
+        self.next_chunk_id += len(texts)
+        self.docstore.put_chunks(list(zip(ids.tolist(), texts, metadatas)))
+        return ids.tolist()
+    
+    def add_document(self, doc_name: str, chunks_with_metadata: List[Dict[str, Any]],
+                     pages: Optional[List[Dict[str, Any]]] = None,
+                     doc_metadata: Optional[Dict[str, Any]] = None) -> str:
         """
         Adiciona um documento à base de conhecimento.
         
         Args:
             doc_name: Nome do documento
             chunks_with_metadata: Lista de dicionários contendo chunks com metadados
-            
+            pages: Registros de página opcionais; seus hashes permitem substituir o
+                documento depois de forma incremental (replace_document)
+            doc_metadata: Metadados adicionais do documento (ex.: estatísticas de normalização)
+        
         Returns:
             ID do documento adicionado
         """
-        if not chunks_with_metadata:
-            logger.warning(f"Nenhum chunk fornecido para o documento: {doc_name}")
-            return None
+        return self.add_documents([{
+            "name": doc_name,
+            "chunks": chunks_with_metadata,
+            "pages": pages,
+            "metadata": doc_metadata
+        }])[0]
+    
+    def add_documents(self, documents: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Adiciona vários documentos à base de conhecimento de uma só vez.
         
-        # Gerar ID único para o documento
-        doc_id = str(uuid.uuid4())
-        timestamp = datetime.now().isoformat()
+        Os chunks de todos os documentos são enviados juntos para embedding, de modo que o
+        agendador possa agrupá-los em lotes e manter várias requisições em andamento, em vez
+        de fazer uma sequência de requisições por documento.
         
-        # Adicionar informações do documento ao registro
-        self.documents[doc_id] = {
-            "name": doc_name,
-            "added_at": timestamp,
-            "chunk_count": len(chunks_with_metadata)
-        }
+        Args:
+            documents: Lista de dicionários com "name" e "chunks", e opcionalmente "pages"
+                e "metadata" (mesmo significado dos argumentos de add_document)
         
-        # Adicionar ID do documento aos metadados de cada chunk
-        for chunk in chunks_with_metadata:
-            chunk["doc_id"] = doc_id
-            chunk["doc_name"] = doc_name
-        
-        # Extrair textos e metadados
-        texts = [chunk["content"] for chunk in chunks_with_metadata]
-        metadatas = [
-            {
-                "chunk_id": chunk["chunk_id"],
-                "title": chunk["title"],
-                "token_count": chunk["token_count"],
-                "doc_id": chunk["doc_id"],
-                "doc_name": chunk["doc_name"]
-            } 
-            for chunk in chunks_with_metadata
-        ]
+        Returns:
+            Lista com o ID de cada documento adicionado (None para os que não foram adicionados),
+            na mesma ordem da entrada
+        """
+        if not self._check_writable():
+            return [None] * len(documents)
+        with self._exclusive():
+            return self._add_documents(documents)
+    
+    def _add_documents(self, documents: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Ver add_documents (chamado com o lock de escrita)."""
+        doc_ids = []
+        texts, metadatas = [], []
+        
+        for document in documents:
+            doc_name = document["name"]
+            chunks = document["chunks"]
+            if not chunks:
+                logger.warning(f"Nenhum chunk fornecido para o documento: {doc_name}")
+                doc_ids.append(None)
+                continue
+            
+            # Gerar ID único para o documento
+            doc_id = str(uuid.uuid4())
+            timestamp = datetime.now().isoformat()
+            
+            # Adicionar informações do documento ao registro
+            self.documents[doc_id] = {
+                "name": doc_name,
+                "added_at": timestamp,
+                "chunk_count": len(chunks)
+            }
+            if document.get("metadata"):
+                self.documents[doc_id].update(document["metadata"])
+            if document.get("pages"):
+                self.documents[doc_id]["page_hashes"] = hash_pages(document["pages"])
+                self.documents[doc_id]["page_starts"] = [page["start_char"] for page in document["pages"]]
+            
+            # Adicionar ID do documento aos metadados de cada chunk
+            for chunk in chunks:
+                chunk["doc_id"] = doc_id
+                chunk["doc_name"] = doc_name
+            
+            # Extrair textos e metadados
+            texts.extend(chunk["content"] for chunk in chunks)
+            metadatas.extend(self._chunk_metadata(chunk, doc_id, doc_name) for chunk in chunks)
+            doc_ids.append(doc_id)
+        
+        added_ids = [doc_id for doc_id in doc_ids if doc_id]
+        if not added_ids:
+            return doc_ids
         
         try:
-            # Se já existe um índice, adicionar a ele
-            if self.vector_store:
-                self.vector_store.add_texts(texts=texts, metadatas=metadatas)
-                logger.info(f"Adicionado documento '{doc_name}' ao índice existente")
-            # Caso contrário, criar um novo índice
-            else:
-                self.vector_store = FAISS.from_texts(
-                    texts=texts,
-                    embedding=self.embeddings,
-                    metadatas=metadatas
-                )
-                logger.info(f"Criado novo índice com documento '{doc_name}'")
+            chunk_ids = self._embed_and_add(texts, metadatas)
+            for doc_id in added_ids:
+                self.docstore.put_document(doc_id, self.documents[doc_id])
+            centroids = self._update_centroids(added_ids)
+            logger.info(f"Adicionados {len(added_ids)} documentos ao índice ({len(chunk_ids)} chunks)")
             
             # Salvar o índice e os metadados
-            self._save_index()
-            self._save_metadata()
+            self._save()
+            for doc_id, centroid in centroids.items():
+                self.router.set(doc_id, centroid)
             
-            logger.info(f"Documento '{doc_name}' adicionado à base de conhecimento com ID: {doc_id}")
-            return doc_id
+            for doc_id in added_ids:
+                logger.info(f"Documento '{self.documents[doc_id]['name']}' adicionado à base de conhecimento com ID: {doc_id}")
+            return doc_ids
         except Exception as e:
-            logger.error(f"Erro ao adicionar documento à base de conhecimento: {str(e)}")
+            logger.error(f"Erro ao adicionar documentos à base de conhecimento: {str(e)}")
+            # Desfazer o registro dos documentos que não chegaram ao índice
+            self._rollback()
+            for doc_id in added_ids:
+                self.documents.pop(doc_id, None)
+            return [None] * len(documents)
+    
+    def _remap_chunk_span(self, metadata: Dict[str, Any], page_map: Dict[int, int], old_page_starts: List[int],
+                          pages: List[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+        """
+        Calcula a posição de um chunk existente no texto da nova revisão.
+        
+        Returns:
+            Intervalo de caracteres (início, fim) no novo texto, ou None se alguma página
+            coberta pelo chunk mudou (ou se faltam dados de posição para o chunk)
+        """
+        required = ("page_start", "page_end", "start_char", "end_char")
+        if not old_page_starts or any(key not in metadata for key in required):
+            return None
+        
+        page_start, page_end = metadata["page_start"], metadata["page_end"]
+        new_page_start = page_map.get(page_start)
+        if new_page_start is None:
+            return None
+        # Todas as páginas cobertas devem estar inalteradas e continuar consecutivas
+        for page in range(page_start, page_end + 1):
+            if page_map.get(page) != new_page_start + (page - page_start):
+                return None
+        
+        start = pages[new_page_start - 1]["start_char"] + (metadata["start_char"] - old_page_starts[page_start - 1])
+        return start, start + (metadata["end_char"] - metadata["start_char"])
+    
+    def replace_document(self, doc_id: str, pages: List[Dict[str, Any]], chunk_size: int = 1000,
+                         chunk_overlap: int = 200, doc_name: Optional[str] = None,
+                         doc_metadata: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, int]]:
+        """
+        Substitui um documento por uma nova revisão, reprocessando apenas as páginas alteradas.
+        
+        As páginas das duas revisões são comparadas por hash. Chunks que cobrem apenas
+        páginas inalteradas são mantidos com seus vetores; somente as regiões do texto que
+        ficaram descobertas são divididas novamente e enviadas para embedding.
+        
+        Args:
+            doc_id: ID do documento a ser substituído (mantido na nova revisão)
+            pages: Registros de página da nova revisão
+            chunk_size: Tamanho aproximado de cada chunk em tokens
+            chunk_overlap: Sobreposição entre chunks em tokens
+            doc_name: Novo nome do documento (opcional)
+            doc_metadata: Metadados adicionais do documento (ex.: estatísticas de normalização)
+        
+        Returns:
+            Estatísticas da substituição (páginas alteradas, chunks mantidos, adicionados
+            e removidos), ou None se ocorrer um erro
+        """
+        if not self._check_writable():
+            return None
+        with self._exclusive():
+            return self._replace_document(doc_id, pages, chunk_size, chunk_overlap, doc_name, doc_metadata)
+    
+    def _replace_document(self, doc_id: str, pages: List[Dict[str, Any]], chunk_size: int, chunk_overlap: int,
+                          doc_name: Optional[str], doc_metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """Ver replace_document (chamado com o lock de escrita)."""
+        if doc_id not in self.documents:
+            logger.warning(f"Documento com ID {doc_id} não encontrado")
+            return None
+        
+        doc_info = self.documents[doc_id]
+        doc_name = doc_name or doc_info["name"]
+        text = join_pages(pages)
+        page_hashes = hash_pages(pages)
+        page_map = map_unchanged_pages(doc_info.get("page_hashes", []), page_hashes)
+        
+        try:
+            # Separar os chunks que continuam válidos dos que cobrem páginas alteradas
+            kept = []
+            removed_ids = []
+            for chunk_id, metadata in self.docstore.chunk_metadata(doc_id):
+                span = self._remap_chunk_span(metadata, page_map, doc_info.get("page_starts", []), pages)
+                if span is None:
+                    removed_ids.append(chunk_id)
+                else:
+                    kept.append((span, chunk_id, metadata))
+            
+            # Regiões do novo texto não cobertas pelos chunks mantidos
+            kept.sort(key=lambda item: item[0])
+            gaps = []
+            cursor = 0
+            for (start, end), _, _ in kept:
+                if start > cursor:
+                    gaps.append((cursor, start))
+                cursor = max(cursor, end)
+            if cursor < len(text):
+                gaps.append((cursor, len(text)))
+            gaps = [(start, end) for start, end in gaps if text[start:end].strip()]
+            
+            new_chunks = chunk_pdf_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                        pages=pages, spans=gaps) if gaps else []
+            
+            # Renumerar todos os chunks na ordem do texto
+            entries = [(span[0], "kept", (span, chunk_id, metadata)) for span, chunk_id, metadata in kept]
+            entries += [(chunk["start_char"], "new", chunk) for chunk in new_chunks]
+            entries.sort(key=lambda entry: entry[0])
+            
+            page_starts = [page["start_char"] for page in pages]
+            order = []
+            new_texts, new_metadatas = [], []
+            for i, (_, kind, item) in enumerate(entries):
+                if kind == "kept":
+                    (start, end), chunk_id, metadata = item
+                    page_delta = page_map[metadata["page_start"]] - metadata["page_start"]
+                    metadata.update({
+                        "chunk_id": i,
+                        "title": f"Chunk {i+1}",
+                        "doc_name": doc_name,
+                        "start_char": start,
+                        "end_char": end,
+                        "page_start": metadata["page_start"] + page_delta,
+                        "page_end": metadata["page_end"] + page_delta
+                    })
+                    order.append(chunk_id)
+                else:
+                    item["chunk_id"] = i
+                    item["title"] = f"Chunk {i+1}"
+                    new_texts.append(item["content"])
+                    new_metadatas.append(self._chunk_metadata(item, doc_id, doc_name))
+                    order.append(None)
+            
+            # Remover os vetores dos chunks invalidados e gerar embeddings só para os novos
+            if removed_ids:
+                self._remove_vectors(removed_ids)
+                self.docstore.delete_chunks(removed_ids)
+            self.docstore.update_chunk_metadata([(chunk_id, metadata) for _, chunk_id, metadata in kept])
+            if new_texts:
+                self._embed_and_add(new_texts, new_metadatas)
+            
+            doc_info = dict(self.documents[doc_id])
+            doc_info.update({
+                "name": doc_name,
+                "updated_at": datetime.now().isoformat(),
+                "chunk_count": len(order),
+                "page_hashes": page_hashes,
+                "page_starts": page_starts
+            })
+            if doc_metadata:
+                doc_info.update(doc_metadata)
+            self.docstore.put_document(doc_id, doc_info)
+            self.documents[doc_id] = doc_info
+            centroids = self._update_centroids([doc_id])
+            
+            self._save()
+            if doc_id in centroids:
+                self.router.set(doc_id, centroids[doc_id])
+            else:
+                self.router.remove(doc_id)
+            
+            stats = {
+                "pages_changed": len(pages) - len(page_map),
+                "chunks_kept": len(kept),
+                "chunks_added": len(new_texts),
+                "chunks_removed": len(removed_ids)
+            }
+            logger.info(f"Documento '{doc_name}' (ID: {doc_id}) substituído: {stats}")
+            return stats
+        except Exception as e:
+            logger.error(f"Erro ao substituir documento: {str(e)}")
+            self._rollback()
             return None
     
     def remove_document(self, doc_id: str) -> bool:
         """
         Remove um documento da base de conhecimento.
         
+        Os vetores dos chunks do documento são excluídos do índice pelos seus IDs, sem
+        reconstruir o índice nem gerar embeddings; o espaço é recuperado na compactação.
+        
         Args:
             doc_id: ID do documento a ser removido
-            
+        
         Returns:
             True se o documento foi removido com sucesso, False caso contrário
         """
+        if not self._check_writable():
+            return False
+        with self._exclusive():
+            return self._remove_document(doc_id)
+    
+    def _remove_document(self, doc_id: str) -> bool:
+        """Ver remove_document (chamado com o lock de escrita)."""
         if doc_id not in self.documents:
             logger.warning(f"Documento com ID {doc_id} não encontrado")
             return False
         
         try:
-            # Remover o documento do registro
+            # Remover os vetores do documento
+            chunk_ids = self._document_chunk_ids(doc_id)
+            if self.index and chunk_ids:
+                self._remove_vectors(chunk_ids)
+            
+            # Remover o documento e seus chunks do registro
             doc_name = self.documents[doc_id]["name"]
+            self.docstore.delete_document(doc_id)
             del self.documents[doc_id]
             
-            # Reconstruir o índice FAISS sem o documento removido
-            # Nota: FAISS não suporta remoção direta, então precisamos reconstruir o índice
-            self._rebuild_index()
+            self._save()
+            self.router.remove(doc_id)
             
-            logger.info(f"Documento '{doc_name}' (ID: {doc_id}) removido da base de conhecimento")
+            logger.info(f"Documento '{doc_name}' (ID: {doc_id}) removido da base de conhecimento "
+                        f"({len(chunk_ids)} vetores excluídos)")
             return True
         except Exception as e:
             logger.error(f"Erro ao remover documento: {str(e)}")
+            self._rollback()
             return False
     
-    def _rebuild_index(self):
-        """Reconstrói o índice FAISS com base nos documentos atuais."""
-        # Esta é uma implementação simplificada
-        # Em uma aplicação real, você precisaria armazenar os chunks originais
-        # ou implementar uma estratégia mais eficiente
+    def _maybe_compact(self):
+        """Compacta o índice e o arquivo de vetores completos se a fração de vetores excluídos passou do limite."""
+        if self.index and self.index.deleted_ratio >= self.compaction_threshold:
+            self.index.compact()
+        self._compact_vectors()
+    
+    def _compact_vectors(self, force: bool = False) -> int:
+        """
+        Regrava o arquivo de vetores completos apenas com os vetores dos chunks do banco, se a
+        fração de linhas sem chunk passou do limite de compactação (ou sempre, com force).
+        
+        Chamado com o lock de escrita e depois de gravar o banco: os chunks gravados são
+        exatamente os que o índice (ou a recuperação de uma operação interrompida) pode ler.
+        
+        Returns:
+            Número de linhas removidas
+        """
+        if self.index is None or not os.path.exists(self.vectors_path):
+            return 0
+        vectors = VectorFile(self.vectors_path, self.index.dimension)
+        live_ids = np.asarray(self.docstore.all_chunk_ids(), dtype=np.int64)
+        unused = vectors.num_rows - len(live_ids)
+        if unused <= 0 or (not force and unused < self.compaction_threshold * vectors.num_rows):
+            return 0
+        # Nenhuma fusão lê o arquivo durante a compactação: as fusões rodam com o lock de escrita
+        return vectors.compact(live_ids)
+    
+    def compact(self) -> int:
+        """
+        Remove fisicamente do índice e do arquivo de vetores completos os vetores excluídos e
+        salva o resultado.
+        
+        Returns:
+            Número de vetores removidos do índice
+        """
+        if not self._check_writable():
+            return 0
+        with self._exclusive():
+            if not self.index:
+                return 0
+            removed = self.index.compact()
+            self._compact_vectors(force=True)
+            if self._save_index():
+                self._publish()
+            return removed
+    
+    def set_num_shards(self, num_shards: int) -> int:
+        """
+        Altera o número de shards do índice, movendo apenas os documentos que mudam de shard.
+        
+        Os vetores movidos são lidos do arquivo de vetores completos, sem gerar embeddings
+        novamente. Passar de um para vários shards converte o índice único.
         
-        # Por enquanto, apenas salvamos os metadados
-        self._save_metadata()
-        logger.warning("Reconstrução do índice não implementada completamente")
+        Args:
+            num_shards: Novo número de shards (pelo menos 1)
+            
+        Returns:
+            Número de vetores movidos
+        """
+        if num_shards < 1:
+            raise ValueError("O número de shards deve ser pelo menos 1")
+        if not self._check_writable():
+            return 0
+        with self._exclusive():
+            return self._set_num_shards(num_shards)
+    
+    def _set_num_shards(self, num_shards: int) -> int:
+        """Ver set_num_shards (chamado com o lock de escrita)."""
+        self.num_shards = num_shards
+        if self.index is None or (num_shards == 1 and not isinstance(self.index, ShardedIndex)):
+            return 0
         
-        # Em uma implementação completa, você faria algo como:
-        # 1. Consultar todos os chunks de documentos restantes
-        # 2. Criar um novo índice FAISS com esses chunks
-        # 3. Salvar o novo índice
+        try:
+            index = self.index
+            if not isinstance(index, ShardedIndex):
+                index = ShardedIndex(self.index.dimension, [], **self._index_options())
+            assignments = ((doc_id, self.docstore.chunk_ids(doc_id)) for doc_id in self.documents)
+            moved = index.set_shards(shard_names(num_shards), assignments)
+            index.save(self.shards_path)
+            if index is not self.index:
+                self.index.stop_merges()
+                self.index = index
+                shutil.rmtree(self.index_path, ignore_errors=True)
+            self._publish()
+            logger.info(f"Índice redistribuído em {num_shards} shards: {moved} vetores movidos")
+            return moved
+        except Exception as e:
+            logger.error(f"Erro ao redistribuir o índice em shards: {str(e)}")
+            return 0
+    
+    def get_index_stats(self) -> Dict[str, Any]:
+        """
+        Retorna o estado do índice.
+        
+        Returns:
+            Dicionário com o tipo e a codificação do índice (do maior segmento), os bytes por
+            vetor da codificação, os vetores ativos, os excluídos aguardando compactação, a
+            fração excluída, o número de segmentos em disco, o número de shards e a versão
+            publicada da base
+        """
+        self._maybe_reload()
+        if not self.index:
+            return {"type": None, "quantization": None, "bytes_per_vector": 0, "vectors": 0,
+                    "deleted": 0, "deleted_ratio": 0.0, "segments": 0, "shards": 0,
+                    "generation": self.generation}
+        index_type, quantization = self.index.layout
+        return {
+            "type": index_type,
+            "quantization": quantization,
+            "bytes_per_vector": self.index.code_size,
+            "vectors": self.index.num_active,
+            "deleted": len(self.index.deleted),
+            "deleted_ratio": self.index.deleted_ratio,
+            "segments": getattr(self.index, "num_segments", 1),
+            "shards": self._num_index_shards(),
+            "generation": self.generation
+        }
     
     def get_all_documents(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -217,56 +1103,187 @@ class KnowledgeBase:
         Returns:
             Dicionário com informações sobre os documentos
         """
+        self._maybe_reload()
         return self.documents
     
-    def similarity_search(self, query: str, k: int = 3, filter_doc_ids: List[str] = None) -> List[Dict[str, Any]]:
+    def _select_chunk_ids(self, filter_doc_ids: Optional[List[str]] = None,
+                          where: Optional[Dict[str, Any]] = None) -> Optional[np.ndarray]:
+        """
+        Calcula os IDs dos chunks que satisfazem os filtros de uma busca.
+        
+        Os filtros de documento e de páginas são resolvidos pelas colunas indexadas do banco de
+        chunks, de modo que o custo é proporcional aos documentos e chunks selecionados, e não ao
+        índice; os metadados dos chunks só são lidos quando há condições sobre eles.
+        
+        Args:
+            filter_doc_ids: IDs de documentos aos quais restringir a busca
+            where: Condições por campo (ver similarity_search)
+        
+        Returns:
+            Array com os IDs selecionados, ou None se não houver filtro
+        """
+        if not filter_doc_ids and not where:
+            return None
+        
+        where = dict(where or {})
+        doc_conditions = {field: where.pop(field) for field in DOCUMENT_FILTER_FIELDS if field in where}
+        page_range = where.pop("pages", None)
+        
+        doc_ids = filter_doc_ids if filter_doc_ids else list(self.documents)
+        selected = []
+        for doc_id in doc_ids:
+            doc_info = self.documents.get(doc_id)
+            if doc_info is None:
+                continue
+            if not all(_matches(doc_info.get(field), condition) for field, condition in doc_conditions.items()):
+                continue
+            if not where:
+                selected.extend(self.docstore.chunk_ids(doc_id, pages=page_range))
+                continue
+            for chunk_id, metadata in self.docstore.chunk_metadata(doc_id, pages=page_range):
+                if all(_matches(metadata.get(field), condition) for field, condition in where.items()):
+                    selected.append(chunk_id)
+        return np.array(selected, dtype=np.int64)
+    
+    def _fetch_results(self, chunk_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Lê do banco os chunks de resultados de busca, no formato de similarity_search (sem o score)."""
+        return {
+            chunk_id: {
+                "content": chunk["content"],
+                "metadata": chunk["metadata"],
+                "doc_name": chunk["metadata"].get("doc_name", "Desconhecido")
+            }
+            for chunk_id, chunk in self.docstore.get_chunks(chunk_ids).items()
+        }
+    
+    def _search_vectors(self, queries: List[str], query_vectors: np.ndarray, k: int,
+                        filter_doc_ids: Optional[List[str]] = None,
+                        where: Optional[Dict[str, Any]] = None,
+                        route_documents: Optional[int] = None) -> SearchResults:
+        """
+        Busca os vetores de consultas no índice, em uma única busca matricial (ou, no modo
+        roteado, nos chunks dos documentos escolhidos para cada consulta).
+        
+        Returns:
+            Resultados com IDs e scores; o texto é lido apenas quando acessado
+        """
+        route_documents = self.route_documents if route_documents is None else route_documents
+        if route_documents > 0 and len(self.router) > route_documents:
+            return self._routed_search(queries, query_vectors, k, route_documents, filter_doc_ids, where)
+        
+        # Se houver filtros, restringir a busca aos chunks selecionados
+        selected_ids = self._select_chunk_ids(filter_doc_ids, where)
+        if selected_ids is not None and not len(selected_ids):
+            logger.info("Nenhum chunk satisfaz os filtros da busca")
+            return SearchResults.empty(queries)
+        
+        distances, ids = self.index.search(query_vectors, k, ids=selected_ids)
+        return SearchResults(queries, ids, distances, self._fetch_results)
+    
+    def _routed_search(self, queries: List[str], query_vectors: np.ndarray, k: int, route_documents: int,
+                       filter_doc_ids: Optional[List[str]] = None,
+                       where: Optional[Dict[str, Any]] = None) -> SearchResults:
+        """
+        Busca em duas etapas: escolhe os route_documents documentos de centróide mais próximo
+        de cada consulta (entre os de filter_doc_ids, se informado) e busca apenas os chunks
+        deles que satisfazem os filtros.
+        
+        As consultas roteadas para o mesmo conjunto de documentos são buscadas juntas, em uma
+        única busca matricial, e os chunks de cada conjunto são selecionados uma única vez.
+        
+        Returns:
+            Resultados com IDs e scores; o texto é lido apenas quando acessado
+        """
+        routes = self.router.route(query_vectors, route_documents, doc_ids=filter_doc_ids or None)
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for row, doc_ids in enumerate(routes):
+            if doc_ids:
+                groups.setdefault(tuple(sorted(doc_ids)), []).append(row)
+        
+        distances = np.full((len(queries), k), np.finfo(np.float32).max, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for doc_ids, rows in groups.items():
+            selected_ids = self._select_chunk_ids(list(doc_ids), where)
+            if not len(selected_ids):
+                continue
+            distances[rows], ids[rows] = self.index.search(query_vectors[rows], k, ids=selected_ids)
+        return SearchResults(queries, ids, distances, self._fetch_results)
+    
+    def similarity_search(self, query: str, k: int = 3, filter_doc_ids: List[str] = None,
+                          where: Optional[Dict[str, Any]] = None,
+                          route_documents: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Realiza uma busca por similaridade na base de conhecimento.
         
+        Os filtros são aplicados dentro da busca (e não sobre os resultados), de modo que k
+        resultados são retornados sempre que houver pelo menos k chunks que os satisfaçam.
+        
         Args:
             query: Consulta para buscar
             k: Número de resultados a retornar
             filter_doc_ids: Lista opcional de IDs de documentos para filtrar a busca
-            
+            where: Condições opcionais sobre os chunks, por campo: um valor (igualdade), uma
+                tupla (mínimo, máximo) com None para limite aberto, ou uma função. Campos:
+                "pages" (intervalo de páginas que o chunk deve tocar), "name", "added_at" e
+                "updated_at" (do documento) e qualquer metadado do chunk (ex.: "token_count")
+            route_documents: Busca roteada: número de documentos, escolhidos pelo centróide, cujos
+                chunks são buscados (padrão: o da base; 0 = busca em todos os chunks)
+        
         Returns:
             Lista de documentos similares com seus metadados
         """
-        if not self.vector_store:
+        self._maybe_reload()
+        if not self.index or not self.index.num_active:
             logger.warning("Nenhum índice FAISS para buscar")
             return []
         
         try:
             logger.info(f"Realizando busca por similaridade para: '{query}' (k={k})")
+            query_vector = np.array([self.query_embedder.embed_query(query)], dtype=np.float32)
             
-            # Se houver filtro de documentos, aplicá-lo
-            if filter_doc_ids:
-                # Implementação simplificada - em uma aplicação real,
-                # você usaria o mecanismo de filtragem do FAISS
-                results = self.vector_store.similarity_search_with_score(query, k=k*2)  # Buscar mais resultados para filtrar depois
-                
-                # Filtrar resultados
-                filtered_results = []
-                for doc, score in results:
-                    if doc.metadata.get("doc_id") in filter_doc_ids:
-                        filtered_results.append((doc, score))
-                
-                # Limitar ao número k
-                results = filtered_results[:k]
-            else:
-                results = self.vector_store.similarity_search_with_score(query, k=k)
-            
-            # Formatar resultados
-            formatted_results = []
-            for doc, score in results:
-                formatted_results.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "score": float(score),
-                    "doc_name": doc.metadata.get("doc_name", "Desconhecido")
-                })
+            # Ler do banco apenas o texto dos resultados finais
+            formatted_results = self._search_vectors([query], query_vector, k, filter_doc_ids, where,
+                                                     route_documents)[0]
             
             logger.info(f"Busca concluída. {len(formatted_results)} resultados encontrados")
             return formatted_results
         except Exception as e:
             logger.error(f"Erro na busca por similaridade: {str(e)}")
             return []
+    
+    def batch_similarity_search(self, queries: List[str], k: int = 3, filter_doc_ids: List[str] = None,
+                                where: Optional[Dict[str, Any]] = None,
+                                route_documents: Optional[int] = None) -> SearchResults:
+        """
+        Realiza buscas por similaridade para várias consultas de uma vez.
+        
+        Os embeddings das consultas fora do cache são gerados em uma única requisição e o índice
+        é consultado com uma única busca matricial; o texto dos resultados só é lido do banco
+        quando acessado.
+        
+        Args:
+            queries: Consultas para buscar
+            k: Número de resultados por consulta
+            filter_doc_ids: Lista opcional de IDs de documentos para filtrar as buscas
+            where: Condições opcionais sobre os chunks (ver similarity_search)
+            route_documents: Número de documentos da busca roteada (ver similarity_search)
+        
+        Returns:
+            Resultados com as matrizes ids e scores (uma linha por consulta); results[i] retorna
+            os resultados da consulta i no formato de similarity_search
+        """
+        self._maybe_reload()
+        if not queries or not self.index or not self.index.num_active:
+            if queries:
+                logger.warning("Nenhum índice FAISS para buscar")
+            return SearchResults.empty(queries)
+        
+        try:
+            logger.info(f"Realizando busca por similaridade para {len(queries)} consultas (k={k})")
+            query_vectors = self.query_embedder.embed_queries(queries)
+            results = self._search_vectors(queries, query_vectors, k, filter_doc_ids, where, route_documents)
+            logger.info(f"Busca concluída para {len(queries)} consultas")
+            return results
+        except Exception as e:
+            logger.error(f"Erro na busca por similaridade: {str(e)}")
+            return SearchResults.empty(queries)
@@ -1,20 +1,385 @@
 import fitz  # PyMuPDF
 import os
+import bisect
+import difflib
+import hashlib
 import logging
-from typing import List, Dict, Any
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import tiktoken
+import re
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
+
+from tokenizer_service import get_tokenizer
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+# Extração paralela: PDFs com pelo menos PDF_PARALLEL_MIN_PAGES páginas são divididos em
+# intervalos de páginas processados por PDF_PARALLEL_WORKERS processos (0 = número de CPUs)
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "500"))
+PARALLEL_MAX_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", "0"))
+
+# PDFs em memória acima de PDF_SPOOL_MAX_MB são gravados em um arquivo temporário antes da extração
+SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_MB", "100")) * 1024 * 1024
+
+# Um PDF pode ser lido de um caminho ou diretamente de um buffer em memória
+PdfSource = Union[str, bytes, memoryview]
+
+# Normalização: linhas repetidas em pelo menos BOILERPLATE_MIN_RATIO das páginas são tratadas
+# como cabeçalho, rodapé ou aviso legal; linhas que só se repetem com números diferentes
+# (ex.: "Página 3 de 10") são removidas apenas nas BOILERPLATE_EDGE_LINES bordas da página
+BOILERPLATE_MIN_RATIO = 0.5
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_EDGE_LINES = 2
+_DIGITS_RE = re.compile(r"\d+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_HYPHENATION_RE = re.compile(r"(\w)-\n[ \t]*(\w)")
+
+# Separadores preferidos para os limites dos chunks, em ordem de prioridade
+CHUNK_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+def _open_pdf(source: PdfSource) -> fitz.Document:
+    """Abre um PDF a partir de um caminho ou de um buffer em memória (sem cópia para bytes/memoryview)."""
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+def iter_pdf_pages(source: PdfSource) -> Iterator[Dict[str, Any]]:
+    """
+    Percorre um arquivo PDF página a página, sem acumular o texto completo.
+    
+    Args:
+        source: Caminho para o arquivo PDF ou conteúdo do PDF em memória
+        
+    Yields:
+        Dicionários com o número da página (base 1), o texto da página e os
+        deslocamentos de caracteres (start_char, end_char) no texto completo
+    """
+    with _open_pdf(source) as doc:
+        yield from _iter_document_pages(doc)
+
+def _iter_document_pages(doc: fitz.Document) -> Iterator[Dict[str, Any]]:
+    """Percorre as páginas de um documento já aberto (ver iter_pdf_pages)."""
+    offset = 0
+    total_pages = len(doc)
+    for page_num, page in enumerate(doc):
+        page_text = page.get_text()
+        logger.debug(f"Processando página {page_num + 1}/{total_pages}")
+        yield {
+            "page_number": page_num + 1,
+            "text": page_text,
+            "start_char": offset,
+            "end_char": offset + len(page_text)
+        }
+        offset += len(page_text)
+
+def join_pages(pages: Iterable[Dict[str, Any]]) -> str:
+    """
+    Monta o texto completo a partir dos registros de página em uma única passada.
+    
+    Args:
+        pages: Registros de página gerados por iter_pdf_pages
+        
+    Returns:
+        Texto completo do documento
+    """
+    return "".join(page["text"] for page in pages)
+
+def hash_pages(pages: List[Dict[str, Any]]) -> List[str]:
+    """
+    Calcula o SHA-256 do texto de cada página, usado para detectar páginas alteradas entre revisões.
+    
+    Args:
+        pages: Registros de página gerados por iter_pdf_pages
+        
+    Returns:
+        Lista de hashes hexadecimais, na ordem das páginas
+    """
+    return [hashlib.sha256(page["text"].encode("utf-8", errors="surrogatepass")).hexdigest() for page in pages]
+
+def map_unchanged_pages(old_hashes: List[str], new_hashes: List[str]) -> Dict[int, int]:
+    """
+    Associa as páginas inalteradas de uma revisão anterior às páginas da nova revisão.
+    
+    A comparação é feita sobre as sequências de hashes, de modo que páginas inseridas ou
+    removidas não invalidam as páginas seguintes.
+    
+    Args:
+        old_hashes: Hashes das páginas da revisão anterior
+        new_hashes: Hashes das páginas da nova revisão
+        
+    Returns:
+        Dicionário número da página antiga -> número da página nova (base 1)
+    """
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    page_map = {}
+    for old_start, new_start, size in matcher.get_matching_blocks():
+        for i in range(size):
+            page_map[old_start + i + 1] = new_start + i + 1
+    return page_map
+
+def _boilerplate_key(line: str) -> Tuple[str, bool]:
+    """Normaliza uma linha para a contagem de repetições; indica se números foram substituídos."""
+    key = _WHITESPACE_RE.sub(" ", line.strip())
+    normalized = _DIGITS_RE.sub("#", key)
+    return normalized, normalized != key
+
+def _rebuild_pages(pages: List[Dict[str, Any]], texts: List[str]) -> List[Dict[str, Any]]:
+    """Cria novos registros de página com os textos fornecidos e deslocamentos recalculados."""
+    rebuilt = []
+    offset = 0
+    for page, page_text in zip(pages, texts):
+        rebuilt.append({
+            "page_number": page["page_number"],
+            "text": page_text,
+            "start_char": offset,
+            "end_char": offset + len(page_text)
+        })
+        offset += len(page_text)
+    return rebuilt
+
+def normalize_pages(pages: List[Dict[str, Any]], min_ratio: float = BOILERPLATE_MIN_RATIO,
+                    min_pages: int = BOILERPLATE_MIN_PAGES,
+                    edge_lines: int = BOILERPLATE_EDGE_LINES) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Remove cabeçalhos, rodapés, números de página e avisos repetidos, e reúne palavras
+    hifenizadas em quebras de linha, antes do chunking.
+    
+    As linhas repetidas são encontradas pela frequência de cada linha (normalizada) entre
+    as páginas do documento.
+    
+    Args:
+        pages: Registros de página gerados por iter_pdf_pages
+        min_ratio: Fração mínima de páginas em que uma linha deve aparecer para ser removida
+        min_pages: Número mínimo de páginas do documento para a remoção de linhas repetidas
+        edge_lines: Número de linhas no início e no fim de cada página consideradas bordas
+        
+    Returns:
+        Tupla (novos registros de página, estatísticas com linhas e tokens removidos e
+        hifenizações reunidas)
+    """
+    page_lines = [page["text"].splitlines(keepends=True) for page in pages]
+    
+    # Contar em quantas páginas cada linha normalizada aparece
+    page_counts = Counter()
+    for lines in page_lines:
+        page_counts.update({_boilerplate_key(line)[0] for line in lines if line.strip()})
+    threshold = max(min_pages, int(min_ratio * len(pages) + 0.5))
+    repeated = {key for key, count in page_counts.items() if count >= threshold} if len(pages) >= min_pages else set()
+    
+    removed_lines = []
+    hyphenations = 0
+    texts = []
+    for lines in page_lines:
+        content_indexes = [i for i, line in enumerate(lines) if line.strip()]
+        edges = set(content_indexes[:edge_lines] + content_indexes[-edge_lines:])
+        kept_lines = []
+        for i, line in enumerate(lines):
+            key, has_digits = _boilerplate_key(line)
+            if key in repeated and (not has_digits or i in edges):
+                removed_lines.append(line)
+            else:
+                kept_lines.append(line)
+        page_text, joined = _HYPHENATION_RE.subn(r"\1\2", "".join(kept_lines))
+        hyphenations += joined
+        texts.append(page_text)
+    
+    stats = {
+        "boilerplate_lines": len(repeated),
+        "lines_removed": len(removed_lines),
+        # As linhas removidas se repetem, então a contagem memoizada do tokenizador é barata
+        "tokens_removed": sum(get_tokenizer().count_tokens_batch(removed_lines)) if removed_lines else 0,
+        "hyphenations_joined": hyphenations
+    }
+    logger.info(f"Normalização concluída: {stats['lines_removed']} linhas repetidas removidas "
+                f"({stats['tokens_removed']} tokens), {hyphenations} hifenizações reunidas")
+    return _rebuild_pages(pages, texts), stats
+
+def _page_range_for_span(pages: List[Dict[str, Any]], page_starts: List[int],
+                         start_char: int, end_char: int) -> Tuple[int, int]:
+    """Retorna as páginas (base 1) inicial e final cobertas por um intervalo de caracteres."""
+    first = max(bisect.bisect_right(page_starts, start_char) - 1, 0)
+    last = max(bisect.bisect_right(page_starts, max(end_char - 1, start_char)) - 1, first)
+    return pages[first]["page_number"], pages[last]["page_number"]
+
+def _extract_page_range(source: PdfSource, start: int, end: int) -> List[str]:
+    """Extrai o texto das páginas [start, end) em um processo de trabalho, que abre o documento por conta própria."""
+    with _open_pdf(source) as doc:
+        return [doc[page_num].get_text() for page_num in range(start, end)]
+
+def _count_pages(source: PdfSource) -> int:
+    """Retorna o número de páginas de um PDF."""
+    with _open_pdf(source) as doc:
+        return len(doc)
+
+def extract_pages_parallel(source: PdfSource, max_workers: Optional[int] = None,
+                           total_pages: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Extrai os registros de página distribuindo intervalos de páginas entre processos.
+    
+    Args:
+        source: Caminho para o arquivo PDF ou conteúdo do PDF em memória (cada
+            processo recebe uma cópia do conteúdo; prefira caminhos para PDFs grandes)
+        max_workers: Número de processos (padrão: PDF_PARALLEL_WORKERS ou o número de CPUs)
+        total_pages: Número de páginas, se já conhecido (evita abrir o documento para contá-las)
+        
+    Returns:
+        Lista de registros de página, na ordem do documento
+    """
+    if total_pages is None:
+        total_pages = _count_pages(source)
+    if isinstance(source, memoryview):
+        # memoryview não pode ser serializado para os processos de trabalho
+        source = source.tobytes()
+    workers = max(1, min(max_workers or PARALLEL_MAX_WORKERS or os.cpu_count() or 1, total_pages))
+    
+    # Intervalos contíguos e de tamanho equilibrado, um por processo
+    step, remainder = divmod(total_pages, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + step + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    
+    logger.info(f"Extraindo {total_pages} páginas em paralelo com {workers} processos")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_extract_page_range, source, start, end) for start, end in ranges]
+        # Remontar na ordem das páginas, independentemente da ordem de conclusão
+        page_texts = [text for future in futures for text in future.result()]
+    
+    pages = []
+    offset = 0
+    for page_num, page_text in enumerate(page_texts):
+        pages.append({
+            "page_number": page_num + 1,
+            "text": page_text,
+            "start_char": offset,
+            "end_char": offset + len(page_text)
+        })
+        offset += len(page_text)
+    return pages
+
+def _use_parallel(total_pages: int, parallel: Optional[bool], min_pages: Optional[int]) -> bool:
+    """Resolve o modo de extração: None escolhe o paralelo a partir de min_pages páginas."""
+    if parallel is None:
+        return total_pages >= (min_pages if min_pages is not None else PARALLEL_MIN_PAGES)
+    return parallel
+
+def _iter_pages(source: PdfSource, parallel: Optional[bool], max_workers: Optional[int],
+                min_pages: Optional[int], spool_dir: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Escolhe entre a extração serial e a paralela conforme o modo e o número de páginas.
+    
+    O documento é aberto uma única vez: o número de páginas é lido do documento aberto, que
+    é o mesmo usado pela extração serial. No modo paralelo, um PDF em memória é gravado em
+    um arquivo temporário, lido pelos processos de trabalho.
+    """
+    with _open_pdf(source) as doc:
+        total_pages = len(doc)
+        if not _use_parallel(total_pages, parallel, min_pages):
+            yield from _iter_document_pages(doc)
+            return
+    with _spooled_source(source, not isinstance(source, str), spool_dir) as path:
+        yield from extract_pages_parallel(path, max_workers=max_workers, total_pages=total_pages)
+
+@contextmanager
+def _spooled_source(pdf_data: PdfSource, spool: bool, spool_dir: Optional[str] = None) -> Iterator[PdfSource]:
+    """Fornece o buffer em memória ou, se spool for True, um arquivo temporário sempre removido ao final."""
+    if not spool:
+        yield pdf_data
+        return
+    
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=spool_dir) as tmp_file:
+        tmp_path = tmp_file.name
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(pdf_data)
+        yield tmp_path
+    finally:
+        os.unlink(tmp_path)
+
+def extract_pages_from_bytes(pdf_data: Union[bytes, bytearray, memoryview], parallel: Optional[bool] = None,
+                             max_workers: Optional[int] = None, min_pages: Optional[int] = None,
+                             spool_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Extrai os registros de página de um PDF em memória, sem gravá-lo em disco.
+    
+    O documento é aberto diretamente do buffer. PDFs maiores que SPOOL_MAX_BYTES, ou
+    extraídos no modo paralelo, são gravados em um arquivo temporário (removido mesmo
+    em caso de erro), para que o MuPDF e os processos de trabalho os leiam do disco.
+    
+    Args:
+        pdf_data: Conteúdo do PDF (bytes, bytearray ou memoryview)
+        parallel: True/False força o modo de extração; None decide pelo número de páginas
+        max_workers: Número de processos no modo paralelo
+        min_pages: Número mínimo de páginas para o modo paralelo automático
+        spool_dir: Diretório para o arquivo temporário (padrão: diretório temporário do sistema)
+        
+    Returns:
+        Lista de registros de página (vazia em caso de erro)
+    """
+    pdf_data = memoryview(pdf_data)
+    logger.info(f"Extraindo texto do PDF em memória ({pdf_data.nbytes} bytes)")
+    
+    if not pdf_data.nbytes:
+        logger.error("Conteúdo do PDF vazio")
+        return []
+    
+    try:
+        with _spooled_source(pdf_data, pdf_data.nbytes > SPOOL_MAX_BYTES, spool_dir) as source:
+            pages = list(_iter_pages(source, parallel, max_workers, min_pages, spool_dir))
+        total_chars = pages[-1]["end_char"] if pages else 0
+        logger.info(f"Extração concluída. Páginas: {len(pages)}, total de caracteres: {total_chars}")
+        return pages
+    except Exception as e:
+        logger.error(f"Erro ao extrair texto do PDF: {str(e)}")
+        return []
+
+def extract_pages_from_pdf(pdf_path: str, parallel: Optional[bool] = None, max_workers: Optional[int] = None,
+                           min_pages: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Extrai os registros de página de um arquivo PDF usando PyMuPDF.
+    
+    Args:
+        pdf_path: Caminho para o arquivo PDF
+        parallel: True/False força o modo de extração; None usa o modo paralelo
+            apenas quando o PDF tem pelo menos min_pages páginas
+        max_workers: Número de processos no modo paralelo
+        min_pages: Número mínimo de páginas para o modo paralelo automático
+            (padrão: PDF_PARALLEL_MIN_PAGES)
+        
+    Returns:
+        Lista de registros de página (vazia em caso de erro)
+    """
+    logger.info(f"Extraindo texto do PDF: {pdf_path}")
+    
+    if not os.path.exists(pdf_path):
+        logger.error(f"Arquivo não encontrado: {pdf_path}")
+        return []
+    
+    try:
+        pages = list(_iter_pages(pdf_path, parallel, max_workers, min_pages))
+        total_chars = pages[-1]["end_char"] if pages else 0
+        logger.info(f"Extração concluída. Páginas: {len(pages)}, total de caracteres: {total_chars}")
+        return pages
+    except Exception as e:
+        logger.error(f"Erro ao extrair texto do PDF: {str(e)}")
+        return []
+
+def extract_text_from_pdf(pdf_path: str, parallel: Optional[bool] = None, max_workers: Optional[int] = None,
+                          min_pages: Optional[int] = None) -> str:
     """
     Extrai texto de um arquivo PDF usando PyMuPDF.
     
     Args:
         pdf_path: Caminho para o arquivo PDF
+        parallel: True/False força o modo de extração; None decide pelo número de páginas
+        max_workers: Número de processos no modo paralelo
+        min_pages: Número mínimo de páginas para o modo paralelo automático
         
     Returns:
         Texto extraído do PDF
@@ -26,12 +391,8 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         return ""
     
     try:
-        text = ""
-        with fitz.open(pdf_path) as doc:
-            for page_num, page in enumerate(doc):
-                logger.info(f"Processando página {page_num + 1}/{len(doc)}")
-                text += page.get_text()
-        
+        # No modo serial, os registros de página são descartados à medida que o texto é montado
+        text = join_pages(_iter_pages(pdf_path, parallel, max_workers, min_pages))
         logger.info(f"Extração concluída. Total de caracteres: {len(text)}")
         return text
     except Exception as e:
@@ -49,11 +410,87 @@ def num_tokens_from_string(text: str, encoding_name: str = "cl100k_base") -> int
     Returns:
         Número de tokens
     """
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(text))
-    return num_tokens
+    return get_tokenizer(encoding_name).count_tokens(text)
+
+def split_text_by_tokens(text: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                         separators: Optional[List[str]] = None,
+                         encoding_name: str = "cl100k_base") -> List[Dict[str, Any]]:
+    """
+    Divide o texto em trechos de até chunk_size tokens, codificando o texto uma única vez.
+    
+    Os limites são escolhidos sobre os deslocamentos dos tokens, preferindo, nesta ordem,
+    quebras de parágrafo, de linha, de frase e de palavra dentro da janela de cada trecho.
+    
+    Args:
+        text: Texto a ser dividido
+        chunk_size: Número máximo de tokens por trecho
+        chunk_overlap: Número de tokens repetidos entre trechos consecutivos
+        separators: Separadores em ordem de preferência (padrão: CHUNK_SEPARATORS)
+        encoding_name: Nome do encoding a ser usado
+        
+    Returns:
+        Lista de dicionários com o conteúdo, a contagem de tokens e os deslocamentos
+        de caracteres (start_char, end_char) de cada trecho
+    """
+    if chunk_overlap >= chunk_size:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) deve ser menor que chunk_size ({chunk_size})")
+    
+    separators = separators if separators is not None else CHUNK_SEPARATORS
+    tokens, offsets = get_tokenizer(encoding_name).encode_with_offsets(text)
+    offsets = offsets.tolist()
+    num_tokens = len(tokens)
+    # Um limite só é aceito depois deste número de tokens, para garantir avanço e evitar trechos mínimos
+    min_tokens = max(chunk_overlap + 1, chunk_size // 4)
+    
+    def is_space(i: int) -> bool:
+        return text[offsets[i]:offsets[i + 1]].isspace()
+    
+    chunks = []
+    start = 0
+    while start < num_tokens:
+        # Trechos não começam com espaços em branco
+        while start < num_tokens and is_space(start):
+            start += 1
+        if start >= num_tokens:
+            break
+        
+        end = min(start + chunk_size, num_tokens)
+        if end < num_tokens and start + min_tokens < end:
+            window_start, window_end = offsets[start + min_tokens], offsets[end]
+            for separator in separators:
+                pos = text.rfind(separator, window_start, window_end)
+                if pos >= 0:
+                    # Quebras de linha e pontuação ficam no trecho anterior; espaços, no seguinte
+                    break_char = pos + len(separator.rstrip(" "))
+                    end = bisect.bisect_left(offsets, break_char, start + min_tokens, end)
+                    break
+        
+        # Trechos também não terminam com espaços em branco
+        last = end
+        while last > start + 1 and is_space(last - 1):
+            last -= 1
+        chunks.append({
+            "content": text[offsets[start]:offsets[last]],
+            "token_count": last - start,
+            "start_char": offsets[start],
+            "end_char": offsets[last]
+        })
+        
+        if end >= num_tokens:
+            break
+        next_start = max(end - chunk_overlap, start + 1)
+        # Começar a sobreposição no início de uma palavra, se houver um dentro dela
+        for i in range(next_start, end):
+            if offsets[i] == 0 or text[offsets[i] - 1].isspace() or text[offsets[i]:offsets[i] + 1].isspace():
+                next_start = i
+                break
+        start = next_start
+    
+    return chunks
 
-def chunk_pdf_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Dict[str, Any]]:
+def chunk_pdf_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                   pages: Optional[List[Dict[str, Any]]] = None,
+                   spans: Optional[List[Tuple[int, int]]] = None) -> List[Dict[str, Any]]:
     """
     Divide o texto em chunks com metadados.
     
@@ -61,9 +498,14 @@ def chunk_pdf_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200)
         text: Texto completo do PDF
         chunk_size: Tamanho aproximado de cada chunk em tokens
         chunk_overlap: Sobreposição entre chunks em tokens
+        pages: Registros de página opcionais; quando fornecidos, cada chunk recebe
+            as páginas inicial e final (page_start, page_end)
+        spans: Intervalos de caracteres (início, fim) a dividir, em ordem; por padrão,
+            o texto inteiro. Usado para dividir apenas as regiões alteradas de um documento
         
     Returns:
-        Lista de dicionários contendo chunks com metadados
+        Lista de dicionários contendo chunks com metadados, incluindo os deslocamentos
+        de caracteres (start_char, end_char) no texto completo
     """
     logger.info(f"Dividindo texto em chunks. Tamanho alvo: {chunk_size} tokens, Sobreposição: {chunk_overlap} tokens")
     
@@ -71,26 +513,30 @@ def chunk_pdf_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200)
         logger.warning("Texto vazio, nenhum chunk gerado")
         return []
     
-    # Usar o RecursiveCharacterTextSplitter para dividir o texto
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=lambda text: num_tokens_from_string(text),
-        separators=["\n\n", "\n", ". ", " ", ""]
-    )
-    
-    # Dividir o texto em chunks
-    chunks = text_splitter.split_text(text)
+    # Dividir o texto em chunks a partir de uma única codificação por intervalo
+    chunks = []
+    for span_start, span_end in spans if spans is not None else [(0, len(text))]:
+        for chunk in split_text_by_tokens(text[span_start:span_end], chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+            chunk["start_char"] += span_start
+            chunk["end_char"] += span_start
+            chunks.append(chunk)
     
     # Adicionar metadados aos chunks
     chunks_with_metadata = []
-    for i, chunk_text in enumerate(chunks):
+    page_starts = [page["start_char"] for page in pages] if pages else []
+    for i, chunk in enumerate(chunks):
         chunk_data = {
             "chunk_id": i,
             "title": f"Chunk {i+1}",
-            "content": chunk_text,
-            "token_count": num_tokens_from_string(chunk_text)
+            "content": chunk["content"],
+            "token_count": chunk["token_count"],
+            "start_char": chunk["start_char"],
+            "end_char": chunk["end_char"]
         }
+        if pages:
+            chunk_data["page_start"], chunk_data["page_end"] = _page_range_for_span(
+                pages, page_starts, chunk["start_char"], chunk["end_char"]
+            )
         chunks_with_metadata.append(chunk_data)
     
     logger.info(f"Gerados {len(chunks_with_metadata)} chunks")
@@ -0,0 +1,355 @@
+import os
+import time
+import queue
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Número máximo de consultas no cache em memória (0 = sem cache)
+CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+
+# Tempo de vida de cada vetor no cache, em segundos
+CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# Janela de agrupamento das consultas, em milissegundos (0 = cada consulta em uma requisição)
+BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+
+# Número máximo de consultas em uma requisição agrupada
+BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "64"))
+
+# Número máximo de requisições agrupadas em andamento ao mesmo tempo
+MAX_CONCURRENT_REQUESTS = int(os.getenv("QUERY_MAX_CONCURRENT_REQUESTS", "4"))
+
+def normalize_query(text: str) -> str:
+    """
+    Normaliza o texto de uma consulta para o cache: forma Unicode NFKC, espaços colapsados
+    e sem distinção de maiúsculas e minúsculas.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+def _embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Gera os embeddings de consultas pelo caminho de consultas do modelo: embed_queries, se o
+    modelo envia várias consultas em uma requisição, ou embed_query para cada texto.
+    """
+    batch = getattr(embeddings, "embed_queries", None)
+    if batch is None or len(texts) == 1:
+        return [embeddings.embed_query(text) for text in texts]
+    return batch(texts)
+
+def _histogram_bucket(size: int) -> int:
+    """Limite superior (potência de 2) do intervalo do histograma de tamanhos de lote."""
+    return 1 << (size - 1).bit_length()
+
+class QueryEmbedder:
+    """
+    Embeddings de consultas compartilhados pelo processo, na frente de um modelo de embeddings.
+
+    Os vetores ficam em um cache LRU com tempo de vida, pela consulta normalizada: a mesma
+    pergunta feita em sessões diferentes é enviada à API uma única vez. O modelo recebe o
+    texto original da consulta (a normalização vale apenas para o cache), pelo caminho de
+    consultas (embed_query, ou embed_queries se o modelo agrupar consultas). Consultas fora
+    do cache que chegam dentro de uma janela de poucos milissegundos são agrupadas em uma
+    única requisição por uma thread de despacho, e consultas iguais em andamento
+    compartilham o mesmo resultado.
+
+    O cache é compartilhado por todos os clientes do mesmo modelo, mas cada consulta fora do
+    cache é enviada pelo cliente de quem a fez (sua chave de API e configuração): os
+    agrupamentos e as consultas em andamento não misturam clientes diferentes.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_size: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 batch_window_ms: float = BATCH_WINDOW_MS, batch_max_size: int = BATCH_MAX_SIZE,
+                 max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS):
+        """
+        Args:
+            embeddings: Modelo de embeddings usado para as consultas fora do cache (cliente padrão)
+            cache_size: Número máximo de consultas no cache (0 = sem cache)
+            ttl: Tempo de vida de cada vetor no cache, em segundos
+            batch_window_ms: Janela de agrupamento das consultas, em milissegundos (0 = sem agrupamento)
+            batch_max_size: Número máximo de consultas por requisição agrupada
+            max_concurrent_requests: Número máximo de requisições agrupadas em andamento
+        """
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None) \
+            or type(embeddings).__name__
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.batch_window = batch_window_ms / 1000
+        self.batch_max_size = max(batch_max_size, 1)
+        self.max_concurrent_requests = max(max_concurrent_requests, 1)
+
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._pending: Dict[Tuple[int, str], Future] = {}  # Pelo cliente e pela chave normalizada
+        self._queue: "queue.Queue[Tuple[Embeddings, str, str]]" = queue.Queue()
+        self._dispatcher = None
+        self._executor = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.coalesced = 0
+        self.requests = 0
+        self.batch_sizes: Dict[int, int] = {}
+
+    def _get_cached(self, key: str):
+        """Vetor em cache de uma consulta normalizada, ou None (chamado com o lock)."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        vector, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._cache[key]
+            self.expired += 1
+            return None
+        self._cache.move_to_end(key)
+        return vector
+
+    def _store(self, keys: List[str], vectors: np.ndarray):
+        """Guarda vetores no cache, descartando os menos usados recentemente."""
+        if not self.cache_size:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                vector.setflags(write=False)
+                self._cache[key] = (vector, expires_at)
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _request(self, embeddings: Embeddings, keys: List[str], texts: List[str]) -> np.ndarray:
+        """Envia consultas ao modelo, por um cliente, em uma única requisição e guarda os vetores pelas chaves normalizadas."""
+        vectors = np.asarray(_embed_queries(embeddings, texts), dtype=np.float32)
+        with self._lock:
+            self.requests += 1
+            bucket = _histogram_bucket(len(keys))
+            self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+        self._store(keys, vectors)
+        return vectors
+
+    def _resolve(self, embeddings: Embeddings, items: List[Tuple[str, str]]):
+        """Envia uma requisição agrupada de um cliente e entrega o vetor de cada consulta a quem a aguarda."""
+        keys = [key for key, _ in items]
+        try:
+            vectors = self._request(embeddings, keys, [text for _, text in items])
+            results = [(key, vector, None) for key, vector in zip(keys, vectors)]
+        except Exception as e:
+            logger.error(f"Erro ao gerar embeddings de {len(keys)} consultas: {str(e)}")
+            results = [(key, None, e) for key in keys]
+        with self._lock:
+            futures = [self._pending.pop((id(embeddings), key)) for key in keys]
+        for future, (_, vector, error) in zip(futures, results):
+            if error is None:
+                future.set_result(vector)
+            else:
+                future.set_exception(error)
+
+    def _dispatch(self):
+        """
+        Thread de despacho: agrupa as consultas que chegam dentro da janela e envia cada
+        grupo (uma requisição por cliente) sem esperar o término das requisições anteriores.
+        """
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(items) < self.batch_max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            groups = {}
+            for embeddings, key, text in items:
+                groups.setdefault(id(embeddings), (embeddings, []))[1].append((key, text))
+            for embeddings, group in groups.values():
+                self._executor.submit(self._resolve, embeddings, group)
+
+    def _submit(self, embeddings: Embeddings, key: str, text: str) -> Future:
+        """Enfileira uma consulta (chave normalizada e texto original) para a próxima requisição agrupada (chamado com o lock)."""
+        future = self._pending.get((id(embeddings), key))
+        if future is not None:
+            self.coalesced += 1
+            return future
+        future = self._pending[(id(embeddings), key)] = Future()
+        if self._dispatcher is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_requests,
+                                                thread_name_prefix="query-embedding-request")
+            self._dispatcher = threading.Thread(target=self._dispatch, name="query-embedding", daemon=True)
+            self._dispatcher.start()
+        self._queue.put((embeddings, key, text))
+        return future
+
+    def embed_query(self, text: str, embeddings: Optional[Embeddings] = None) -> np.ndarray:
+        """
+        Gera o embedding de uma consulta, usando o cache e agrupando as consultas concorrentes.
+
+        Args:
+            text: Texto da consulta
+            embeddings: Cliente do modelo que envia a consulta, se não estiver no cache
+                (padrão: o do QueryEmbedder)
+
+        Returns:
+            Vetor float32 da consulta normalizada (somente leitura)
+        """
+        embeddings = embeddings or self.embeddings
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._get_cached(key)
+            if vector is not None:
+                self.hits += 1
+                return vector
+            self.misses += 1
+            if self.batch_window > 0:
+                future = self._submit(embeddings, key, text)
+        if self.batch_window <= 0:
+            return self._request(embeddings, [key], [text])[0]
+        return future.result()
+
+    def embed_queries(self, texts: List[str], embeddings: Optional[Embeddings] = None) -> np.ndarray:
+        """
+        Gera os embeddings de várias consultas, enviando as que não estão no cache em uma
+        única requisição (consultas com a mesma chave normalizada são enviadas uma vez).
+
+        Args:
+            texts: Textos das consultas
+            embeddings: Cliente do modelo que envia as consultas fora do cache (padrão: o do
+                QueryEmbedder)
+
+        Returns:
+            Matriz (consultas, dimensão) float32, na mesma ordem dos textos
+        """
+        embeddings = embeddings or self.embeddings
+        keys = [normalize_query(text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._get_cached(key)
+                if vector is not None:
+                    found[key] = vector
+            self.hits += sum(key in found for key in keys)
+            self.misses += sum(key not in found for key in keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            found.update(zip(missing, self._request(embeddings, list(missing), list(missing.values()))))
+        return np.vstack([found[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    def clear(self):
+        """Esvazia o cache."""
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna as estatísticas do cache e do agrupamento.
+
+        Returns:
+            Dicionário com acertos, erros, taxa de acerto, entradas expiradas, consultas no
+            cache, consultas que aproveitaram uma requisição em andamento, requisições enviadas
+            e o histograma de tamanhos de lote (limite superior do intervalo: requisições)
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "expired": self.expired,
+                "entries": len(self._cache),
+                "coalesced": self.coalesced,
+                "requests": self.requests,
+                "batch_sizes": dict(sorted(self.batch_sizes.items()))
+            }
+
+class ClientQueryEmbedder:
+    """
+    QueryEmbedder do modelo de um cliente de embeddings: o cache e as estatísticas são os do
+    modelo, compartilhados pelo processo, e as consultas fora do cache são enviadas por este
+    cliente.
+    """
+
+    def __init__(self, shared: QueryEmbedder, embeddings: Embeddings):
+        """
+        Args:
+            shared: QueryEmbedder compartilhado do modelo
+            embeddings: Cliente do modelo usado para as consultas fora do cache
+        """
+        self.shared = shared
+        self.embeddings = embeddings
+
+    @property
+    def model_name(self) -> str:
+        return self.shared.model_name
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Ver QueryEmbedder.embed_query."""
+        return self.shared.embed_query(text, self.embeddings)
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Ver QueryEmbedder.embed_queries."""
+        return self.shared.embed_queries(texts, self.embeddings)
+
+    def clear(self):
+        """Esvazia o cache do modelo."""
+        self.shared.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas do modelo (ver QueryEmbedder.get_stats)."""
+        return self.shared.get_stats()
+
+_embedders: Dict[Any, QueryEmbedder] = {}
+_embedders_lock = threading.Lock()
+
+def _model_key(embeddings: Embeddings) -> Any:
+    """Chave do modelo: nome e dimensões quando conhecidos, senão a própria instância."""
+    name = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None)
+    if not isinstance(name, str):
+        return ("instance", id(embeddings))
+    return (name, getattr(embeddings, "dimensions", None) or 0)
+
+def get_query_embedder(embeddings: Embeddings) -> ClientQueryEmbedder:
+    """
+    Retorna o QueryEmbedder do processo para um modelo de embeddings, ligado ao cliente informado.
+
+    Instâncias do mesmo modelo (ex.: uma por sessão) compartilham o mesmo cache; as consultas
+    fora do cache são enviadas por cada instância, com as suas credenciais.
+
+    Args:
+        embeddings: Modelo de embeddings (cliente)
+
+    Returns:
+        Instância de ClientQueryEmbedder
+    """
+    key = _model_key(embeddings)
+    with _embedders_lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            embedder = _embedders[key] = QueryEmbedder(embeddings)
+    return ClientQueryEmbedder(embedder, embeddings)
+
+def get_query_embedding_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Retorna as estatísticas de todos os QueryEmbedder do processo.
+
+    Returns:
+        Estatísticas (ver QueryEmbedder.get_stats) pelo nome do modelo
+    """
+    with _embedders_lock:
+        embedders = list(_embedders.values())
+    return {embedder.model_name: embedder.get_stats() for embedder in embedders}
@@ -5,21 +5,28 @@ from typing import List, Dict, Any, Optional
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 
+from tokenizer_service import get_tokenizer
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Preços do GPT-4 (USD por 1.000 tokens) usados na estimativa de custo
+PROMPT_COST_PER_1K_TOKENS = 0.03
+COMPLETION_COST_PER_1K_TOKENS = 0.06
+
 class ResponseGenerator:
     """
     Classe para gerar respostas usando o modelo GPT-4 da OpenAI com base em chunks recuperados.
     """
     
-    def __init__(self, openai_api_key: Optional[str] = None):
+    def __init__(self, openai_api_key: Optional[str] = None, max_context_tokens: int = 6000):
         """
         Inicializa o gerador de respostas.
         
         Args:
             openai_api_key: Chave de API da OpenAI (opcional, pode ser definida como variável de ambiente)
+            max_context_tokens: Orçamento de tokens para os trechos de contexto no prompt
         """
         self.openai_api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
         if not self.openai_api_key:
@@ -30,6 +37,8 @@ class ResponseGenerator:
             temperature=0.2,
             openai_api_key=self.openai_api_key
         )
+        self.max_context_tokens = max_context_tokens
+        self.tokenizer = get_tokenizer()
         logger.info("ResponseGenerator inicializado com modelo GPT-4")
     
     def generate_response(self, query: str, context_chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -52,11 +61,19 @@ class ResponseGenerator:
         
         logger.info(f"Gerando resposta para: '{query}' com {len(context_chunks)} chunks de contexto")
         
-        # Preparar o contexto a partir dos chunks
+        # Preparar o contexto a partir dos chunks, respeitando o orçamento de tokens
         context_text = ""
+        context_tokens = 0
         sources = []
+        chunk_token_counts = self.tokenizer.count_tokens_batch([chunk["content"] for chunk in context_chunks])
         
         for i, chunk in enumerate(context_chunks):
+            if sources and context_tokens + chunk_token_counts[i] > self.max_context_tokens:
+                logger.warning(f"Orçamento de contexto de {self.max_context_tokens} tokens atingido; "
+                               f"{len(context_chunks) - i} chunks descartados")
+                break
+            context_tokens += chunk_token_counts[i]
+            
             # Adicionar o conteúdo do chunk ao contexto
             chunk_text = chunk["content"]
             context_text += f"\n\nTrecho {i+1}:\n{chunk_text}"
@@ -92,21 +109,39 @@ class ResponseGenerator:
             "query": query
         }
         
+        # Medir o tamanho do prompt para a contabilização de custo
+        usage = {
+            "context_tokens": context_tokens,
+            "prompt_tokens": self.tokenizer.count_tokens(prompt.format(**prompt_params), memoize=False),
+            "completion_tokens": 0
+        }
+        
         try:
             # Gerar a resposta
             chain = prompt | self.llm
             response = chain.invoke(prompt_params)
             response_text = response.content
+            usage["completion_tokens"] = self.tokenizer.count_tokens(response_text, memoize=False)
+            usage["estimated_cost"] = self._estimate_cost(usage)
             
-            logger.info("Resposta gerada com sucesso")
+            logger.info(f"Resposta gerada com sucesso. Tokens - prompt: {usage['prompt_tokens']}, "
+                        f"resposta: {usage['completion_tokens']}, custo estimado: US$ {usage['estimated_cost']:.4f}")
             
             return {
                 "response": response_text,
-                "sources": sources
+                "sources": sources,
+                "usage": usage
             }
         except Exception as e:
             logger.error(f"Erro ao gerar resposta: {str(e)}")
+            usage["estimated_cost"] = self._estimate_cost(usage)
             return {
                 "response": f"Ocorreu um erro ao gerar a resposta: {str(e)}",
-                "sources": sources
+                "sources": sources,
+                "usage": usage
             }
+    
+    def _estimate_cost(self, usage: Dict[str, int]) -> float:
+        """Estima o custo em USD de uma chamada a partir das contagens de tokens."""
+        return (usage["prompt_tokens"] * PROMPT_COST_PER_1K_TOKENS
+                + usage["completion_tokens"] * COMPLETION_COST_PER_1K_TOKENS) / 1000
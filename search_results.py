@@ -0,0 +1,87 @@
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class SearchResults:
+    """
+    Resultados de uma busca com várias consultas.
+
+    IDs e scores ficam em matrizes NumPy (uma linha por consulta, -1 nas posições sem
+    resultado); o texto e os metadados dos chunks só são lidos quando os resultados de uma
+    consulta são acessados (results[i]) ou com materialize(), que lê todos de uma vez.
+    """
+
+    def __init__(self, queries: List[str], ids: np.ndarray, scores: np.ndarray,
+                 fetch: Callable[[List[int]], Dict[int, Dict[str, Any]]]):
+        """
+        Args:
+            queries: Consultas, na ordem das linhas
+            ids: Matriz (consultas, k) de IDs dos chunks
+            scores: Matriz (consultas, k) de scores (distâncias)
+            fetch: Função que recebe IDs e retorna o resultado formatado de cada um (sem o
+                score), pelo ID; IDs ausentes são omitidos dos resultados
+        """
+        self.queries = queries
+        self.ids = ids
+        self.scores = scores
+        self._fetch = fetch
+        self._chunks: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def empty(cls, queries: List[str]) -> "SearchResults":
+        """Resultados vazios (nenhum chunk) para as consultas."""
+        return cls(queries, np.empty((len(queries), 0), dtype=np.int64),
+                   np.empty((len(queries), 0), dtype=np.float32), lambda ids: {})
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def _load(self, ids: Iterable[int]):
+        """Lê os chunks ainda não carregados."""
+        missing = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id >= 0 and chunk_id not in self._chunks]
+        if missing:
+            self._chunks.update(self._fetch(missing))
+
+    def _format(self, row: int) -> List[Dict[str, Any]]:
+        results = []
+        for chunk_id, score in zip(self.ids[row].tolist(), self.scores[row].tolist()):
+            chunk = self._chunks.get(chunk_id)
+            if chunk is not None:
+                results.append(dict(chunk, score=float(score)))
+        return results
+
+    def __getitem__(self, row: int) -> List[Dict[str, Any]]:
+        """
+        Resultados de uma consulta, no formato de similarity_search.
+
+        Args:
+            row: Posição da consulta
+
+        Returns:
+            Lista de resultados com conteúdo, metadados e score
+        """
+        self._load(self.ids[row].tolist())
+        return self._format(row)
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def materialize(self, rows: Optional[List[int]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Lê de uma vez os chunks de várias consultas e retorna os seus resultados.
+
+        Args:
+            rows: Posições das consultas (padrão: todas)
+
+        Returns:
+            Lista com os resultados de cada consulta, no formato de similarity_search
+        """
+        rows = range(len(self)) if rows is None else rows
+        self._load(self.ids[list(rows)].ravel().tolist())
+        return [self._format(row) for row in rows]
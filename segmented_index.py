@@ -0,0 +1,695 @@
+import os
+import re
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from faiss_index import (FaissIndex, DEFAULT_INDEX_TYPE, DEFAULT_NPROBE, DEFAULT_EF_SEARCH,
+                         DEFAULT_QUANTIZATION, DEFAULT_RERANK_FACTOR)
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Número de segmentos de tamanho semelhante que são fundidos em um segmento maior
+MERGE_FACTOR = int(os.getenv("FAISS_SEGMENT_MERGE_FACTOR", "8"))
+
+# Fundir os segmentos em uma thread em segundo plano (se falso, a fusão ocorre durante o save)
+BACKGROUND_MERGE = os.getenv("FAISS_BACKGROUND_MERGE", "true").lower() in ("1", "true", "yes")
+
+# Arquivo com a lista de segmentos do índice, substituído atomicamente a cada alteração
+MANIFEST_NAME = "manifest.json"
+
+# Versões anteriores do manifesto mantidas, com os arquivos que elas referenciam, para leitores
+# que ainda estejam carregando uma versão antiga
+SNAPSHOTS_KEPT = int(os.getenv("FAISS_SNAPSHOTS_KEPT", "3"))
+
+_SNAPSHOT_RE = re.compile(r"manifest-(\d+)\.json")
+
+# Tentativas de carregamento quando um arquivo some durante a leitura (versão substituída)
+_LOAD_ATTEMPTS = 3
+
+def _merge_results(results: List[Tuple[np.ndarray, np.ndarray]], num_queries: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Combina os k melhores resultados de cada parte do índice nos k melhores de todas."""
+    distances = np.full((num_queries, k), np.finfo(np.float32).max, dtype=np.float32)
+    labels = np.full((num_queries, k), -1, dtype=np.int64)
+    if results:
+        all_labels = np.hstack([part_labels for _, part_labels in results])
+        all_distances = np.where(all_labels >= 0, np.hstack([part_distances for part_distances, _ in results]),
+                                 np.finfo(np.float32).max)
+        order = np.argsort(all_distances, axis=1, kind="stable")[:, :k]
+        found = order.shape[1]
+        distances[:, :found] = np.take_along_axis(all_distances, order, axis=1)
+        labels[:, :found] = np.take_along_axis(all_labels, order, axis=1)
+    return distances, labels
+
+class _Segment:
+    """Segmento imutável do índice: o índice FAISS salvo e os IDs (ordenados) dos seus vetores."""
+
+    def __init__(self, name: str, index: FaissIndex, ids: np.ndarray):
+        self.name = name
+        self.index = index
+        self.ids = np.sort(np.asarray(ids, dtype=np.int64))
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Máscara dos IDs que pertencem ao segmento."""
+        if not len(self.ids):
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return self.ids[positions] == ids
+
+class SegmentedIndex:
+    """
+    Índice FAISS formado por segmentos imutáveis em disco e uma cauda em memória.
+
+    Os vetores adicionados entram na cauda (um índice exato em memória; os vetores completos
+    já são gravados no arquivo de vetores na adição); cada save grava a cauda como um novo
+    segmento pequeno e atualiza o manifesto, sem regravar os segmentos existentes. Remoções
+    marcam os IDs no segmento que os contém, e o save grava uma nova versão da lista de
+    excluídos desses segmentos.
+
+    Cada alteração do manifesto é uma nova versão (geração) imutável, publicada pela troca
+    atômica de manifest.json: nenhum arquivo referenciado por uma versão é alterado, e os
+    arquivos só são apagados quando deixam de ser referenciados pelas últimas SNAPSHOTS_KEPT
+    versões, de modo que leitores em outros processos nunca veem um estado parcial.
+
+    Como em uma árvore LSM, quando há MERGE_FACTOR segmentos de tamanho semelhante eles são
+    fundidos em segundo plano em um segmento maior, reconstruído a partir do arquivo de vetores
+    com o tipo e a codificação adequados ao seu tamanho e sem os vetores excluídos. Cada vetor
+    é gravado no arquivo de vetores uma vez e regravado nos segmentos apenas O(log n) vezes.
+    As buscas consultam todos os segmentos e a cauda e combinam os k melhores resultados.
+
+    Com merge_lock, cada fusão em segundo plano ocorre com esse lock (o lock de escrita da
+    base, entre processos), sem atrasar o save que a iniciou; uma fusão só é feita se o
+    manifesto em disco ainda for a versão deste índice.
+    """
+
+    def __init__(self, dimension: int, index_type: str = DEFAULT_INDEX_TYPE, nprobe: int = DEFAULT_NPROBE,
+                 ef_search: int = DEFAULT_EF_SEARCH, quantization: str = DEFAULT_QUANTIZATION,
+                 vectors_path: Optional[str] = None, rerank_factor: int = DEFAULT_RERANK_FACTOR,
+                 merge_factor: int = MERGE_FACTOR, background_merge: bool = BACKGROUND_MERGE,
+                 snapshots_kept: int = SNAPSHOTS_KEPT, read_only: bool = False,
+                 merge_lock: Optional[ContextManager[Any]] = None, on_merge: Optional[Callable[[], None]] = None):
+        """
+        Inicializa um índice segmentado vazio.
+
+        Args:
+            dimension: Dimensão dos vetores
+            index_type: Tipo dos segmentos fundidos ("flat", "ivf_flat", "ivf_pq", "hnsw" ou "auto")
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+            quantization: Codificação dos segmentos fundidos ("none", "fp16", "sq8" ou "pq")
+            vectors_path: Arquivo de vetores completos, de onde os segmentos fundidos são
+                reconstruídos (obrigatório para alterações)
+            rerank_factor: Candidatos por resultado reordenados com os vetores completos
+            merge_factor: Número de segmentos de tamanho semelhante que são fundidos
+            background_merge: Fundir os segmentos em uma thread em segundo plano
+            snapshots_kept: Versões anteriores do manifesto mantidas para leitores em andamento
+            read_only: Índice somente leitura (carregado por mapeamento em memória)
+            merge_lock: Lock adquirido durante cada fusão, exclusivo com os demais escritores
+                do índice (opcional)
+            on_merge: Função chamada, com merge_lock, depois de publicar o resultado de uma fusão
+                (opcional)
+        """
+        if not read_only and not vectors_path:
+            raise ValueError("O índice segmentado precisa de um arquivo de vetores completos")
+        self.dimension = dimension
+        self.vectors_path = vectors_path
+        self.merge_factor = merge_factor
+        self.background_merge = background_merge
+        self.snapshots_kept = max(snapshots_kept, 0)
+        self.read_only = read_only
+        self.merge_lock = merge_lock
+        self.on_merge = on_merge
+        self._options = {"index_type": index_type, "nprobe": nprobe, "ef_search": ef_search,
+                         "quantization": quantization, "rerank_factor": rerank_factor}
+
+        self.path = None
+        self.segments: List[_Segment] = []
+        self.bytes_written = 0
+        self.generation = 0
+        self._next_segment = 0
+        self._changed = set()  # Segmentos com exclusões ainda não salvas
+        self._tombstones: Dict[str, str] = {}  # Arquivo da versão atual das exclusões de cada segmento
+        self._building = set()  # Segmentos em construção (fusões), ainda fora do manifesto
+        self._lock = threading.RLock()
+        self._merge_thread = None
+        self._stopped = False  # Índice substituído: as fusões pendentes são descartadas
+        self._new_tail()
+
+    def _new_tail(self):
+        """Cria uma cauda vazia (índice exato em memória)."""
+        self._tail = None
+        self._tail_ids = []
+        if not self.read_only:
+            options = dict(self._options, index_type="flat", quantization="none")
+            self._tail = FaissIndex(self.dimension, vectors_path=self.vectors_path, **options)
+
+    def _parts(self) -> List[Tuple[object, Optional[_Segment]]]:
+        """Índices consultados nas buscas: os segmentos e, se não estiver vazia, a cauda."""
+        parts = [(segment.index, segment) for segment in self.segments]
+        if self._tail is not None and self._tail.ntotal:
+            parts.append((self._tail, None))
+        return parts
+
+    @property
+    def num_segments(self) -> int:
+        """Número de segmentos em disco."""
+        return len(self.segments)
+
+    @property
+    def ntotal(self) -> int:
+        """Número de vetores armazenados, incluindo os excluídos ainda não compactados."""
+        return sum(index.ntotal for index, _ in self._parts())
+
+    @property
+    def num_active(self) -> int:
+        """Número de vetores visíveis nas buscas."""
+        return sum(index.num_active for index, _ in self._parts())
+
+    @property
+    def deleted(self) -> set:
+        """IDs excluídos ainda não compactados, de todos os segmentos."""
+        return set().union(*(index.deleted for index, _ in self._parts()))
+
+    @property
+    def deleted_ratio(self) -> float:
+        """Fração dos vetores armazenados que estão excluídos."""
+        ntotal = self.ntotal
+        return len(self.deleted) / ntotal if ntotal else 0.0
+
+    def _largest(self):
+        """Maior parte do índice, que determina o tipo e a codificação informados."""
+        parts = self._parts()
+        return max(parts, key=lambda part: part[0].ntotal)[0] if parts else self._tail
+
+    @property
+    def layout(self) -> Tuple[str, str]:
+        """Tipo e codificação do maior segmento."""
+        largest = self._largest()
+        return largest.layout if largest is not None else ("flat", "none")
+
+    @property
+    def kind(self) -> str:
+        """Tipo do maior segmento."""
+        return self.layout[0]
+
+    @property
+    def code_size(self) -> int:
+        """Bytes por vetor ocupados pela codificação do maior segmento."""
+        largest = self._largest()
+        return largest.code_size if largest is not None else self.dimension * np.dtype(np.float32).itemsize
+
+    def _check_writable(self):
+        """Impede alterações em um índice somente leitura."""
+        if self.read_only:
+            raise RuntimeError("Índice FAISS aberto em modo somente leitura")
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.faiss")
+
+    def _reserve_name(self) -> str:
+        """Reserva o nome do próximo segmento."""
+        name = f"seg-{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    def _write_segment(self, segment: _Segment):
+        """Grava um segmento em disco (o índice só é gravado se ainda não foi)."""
+        path = self._segment_path(segment.name)
+        self._write_tombstones(segment)
+        self.bytes_written += sum(os.path.getsize(f"{path}{suffix}") for suffix in ("", ".ids.npy"))
+
+    def _write_tombstones(self, segment: _Segment):
+        """Grava as exclusões de um segmento em um arquivo da próxima versão do manifesto."""
+        file_name = f"{segment.name}.deleted-{self.generation + 1:06d}.npy"
+        segment.index.save(self._segment_path(segment.name), deleted_path=os.path.join(self.path, file_name))
+        self._tombstones[segment.name] = file_name
+
+    def _remove_segment_files(self, name: str):
+        """Remove os arquivos de um segmento que nunca entrou no manifesto."""
+        for file_name in os.listdir(self.path):
+            if file_name.split(".")[0] == name:
+                os.remove(os.path.join(self.path, file_name))
+
+    def _write_manifest(self):
+        """
+        Publica uma nova versão do manifesto: grava a versão imutável manifest-<geração>.json
+        e substitui manifest.json atomicamente; em seguida, apaga os arquivos que nenhuma das
+        versões mantidas referencia.
+        """
+        self.generation += 1
+        manifest = {
+            "dimension": self.dimension,
+            "generation": self.generation,
+            "next_segment": self._next_segment,
+            "segments": [segment.name for segment in self.segments],
+            "deleted": {segment.name: self._tombstones.get(segment.name) for segment in self.segments}
+        }
+        for file_name in (f"manifest-{self.generation:06d}.json", MANIFEST_NAME):
+            manifest_path = os.path.join(self.path, file_name)
+            with open(f"{manifest_path}.tmp", "w") as f:
+                json.dump(manifest, f)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        """
+        Apaga as versões do manifesto além das SNAPSHOTS_KEPT anteriores e os arquivos de
+        segmentos não referenciados pelas versões mantidas (nem em construção).
+        """
+        snapshots = sorted((int(match.group(1)), file_name) for file_name in os.listdir(self.path)
+                           if (match := _SNAPSHOT_RE.fullmatch(file_name)))
+        kept = [file_name for _, file_name in snapshots[-(self.snapshots_kept + 1):]]
+        for _, file_name in snapshots[:-(self.snapshots_kept + 1)]:
+            os.remove(os.path.join(self.path, file_name))
+
+        referenced = set()
+        for file_name in kept + [MANIFEST_NAME]:
+            try:
+                with open(os.path.join(self.path, file_name)) as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                continue
+            deleted = manifest.get("deleted") or {}
+            for name in manifest["segments"]:
+                referenced.update((f"{name}.faiss", f"{name}.faiss.ids.npy"))
+                # Manifestos anteriores ao versionamento usam o arquivo de exclusões padrão
+                referenced.add(deleted.get(name) or f"{name}.faiss.deleted.npy")
+        for file_name in os.listdir(self.path):
+            if file_name.startswith("seg-") and file_name not in referenced \
+                    and file_name.split(".")[0] not in self._building:
+                os.remove(os.path.join(self.path, file_name))
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        """
+        Adiciona vetores à cauda em memória; eles passam a um segmento no próximo save.
+
+        Args:
+            vectors: Matriz (n, dimensão) de vetores
+            ids: IDs inteiros dos vetores (não podem estar em uso)
+        """
+        self._check_writable()
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        with self._lock:
+            self._tail.add(vectors, ids)
+            self._tail_ids.append(ids)
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """
+        Marca IDs como excluídos nos segmentos (ou na cauda) que os contêm.
+
+        Args:
+            ids: IDs a excluir
+
+        Returns:
+            Número de IDs marcados
+        """
+        self._check_writable()
+        ids = np.unique(np.fromiter((int(i) for i in ids), dtype=np.int64))
+        removed = 0
+        with self._lock:
+            for segment in self.segments:
+                mask = segment.contains(ids)
+                if mask.any():
+                    removed += segment.index.remove(ids[mask].tolist())
+                    self._changed.add(segment.name)
+                    ids = ids[~mask]
+            if len(ids) and self._tail_ids:
+                in_tail = ids[np.isin(ids, np.concatenate(self._tail_ids))]
+                removed += self._tail.remove(in_tail.tolist())
+        return removed
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Verifica quais IDs estão no índice e não foram excluídos.
+
+        Args:
+            ids: IDs a verificar
+
+        Returns:
+            Máscara booleana, na ordem dos IDs
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+        with self._lock:
+            parts = [(segment.index, segment.contains(ids)) for segment in self.segments]
+            if self._tail_ids:
+                parts.append((self._tail, np.isin(ids, np.concatenate(self._tail_ids))))
+            for index, mask in parts:
+                if index.deleted:
+                    deleted = np.fromiter(index.deleted, dtype=np.int64, count=len(index.deleted))
+                    mask &= ~np.isin(ids, deleted)
+                found |= mask
+        return found
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """
+        Ajusta os parâmetros de busca dos segmentos aproximados.
+
+        Args:
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+        """
+        with self._lock:
+            if nprobe is not None:
+                self._options["nprobe"] = nprobe
+            if ef_search is not None:
+                self._options["ef_search"] = ef_search
+            for index, _ in self._parts():
+                if hasattr(index, "set_search_params"):
+                    index.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    def search(self, queries: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca os k vizinhos mais próximos em todos os segmentos e na cauda.
+
+        Args:
+            queries: Matriz (n, dimensão) de consultas
+            k: Número de resultados por consulta
+            ids: IDs aos quais restringir a busca (opcional); cada segmento recebe só os seus
+
+        Returns:
+            Tupla (distâncias, IDs), cada uma com forma (n, k); posições sem resultado têm ID -1
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        if ids is not None:
+            ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            parts = self._parts()
+            tail_ids = np.concatenate(self._tail_ids) if self._tail_ids else None
+
+        results = []
+        for index, segment in parts:
+            selected = None
+            if ids is not None:
+                selected = ids[segment.contains(ids)] if segment is not None else ids[np.isin(ids, tail_ids)]
+                if not len(selected):
+                    continue
+            results.append(index.search(queries, k, ids=selected))
+        return _merge_results(results, len(queries), k)
+
+    def reconstruct(self, vector_id: int) -> np.ndarray:
+        """
+        Retorna o vetor armazenado com um ID.
+
+        Args:
+            vector_id: ID do vetor
+
+        Returns:
+            Vetor float32
+        """
+        with self._lock:
+            for segment in self.segments:
+                if segment.contains(np.array([vector_id], dtype=np.int64))[0]:
+                    return segment.index.reconstruct(vector_id)
+            return self._tail.reconstruct(vector_id)
+
+    def save(self, path: str):
+        """
+        Grava a cauda como um novo segmento, as exclusões alteradas e o manifesto.
+
+        Os segmentos existentes não são regravados; em seguida, os segmentos de tamanho
+        semelhante são fundidos (em segundo plano, se configurado).
+
+        Args:
+            path: Diretório do índice
+        """
+        self._check_writable()
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            self.path = path
+            if self._tail.ntotal:
+                segment = _Segment(self._reserve_name(), self._tail, np.concatenate(self._tail_ids))
+                self._write_segment(segment)
+                self.segments.append(segment)
+                self._new_tail()
+            for segment in self.segments:
+                if segment.name in self._changed:
+                    self._write_tombstones(segment)
+            self._changed.clear()
+            self._write_manifest()
+
+        if self.background_merge:
+            self._start_merge_thread()
+        else:
+            self._merge_all()
+
+    def _merge_candidates(self) -> List[_Segment]:
+        """Segmentos a fundir: os primeiros merge_factor de um mesmo nível de tamanho."""
+        tiers = {}
+        for segment in self.segments:
+            tier = int(math.log(max(len(segment.ids), 1), self.merge_factor))
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        return []
+
+    def _build_segment(self, name: str, ids: np.ndarray) -> _Segment:
+        """Constrói um segmento com os vetores dos IDs, lidos do arquivo de vetores."""
+        index = FaissIndex.from_vectors(self.dimension, ids, self.vectors_path, **self._options)
+        return _Segment(name, index, ids)
+
+    def _is_current(self) -> bool:
+        """Verifica se o manifesto em disco ainda é a versão deste índice (chamado com merge_lock)."""
+        if self.path is None:
+            return True
+        try:
+            with open(os.path.join(self.path, MANIFEST_NAME)) as f:
+                return json.load(f).get("generation", 0) == self.generation
+        except (OSError, ValueError):
+            return False
+
+    def _merge_once(self) -> bool:
+        """
+        Funde um grupo de segmentos, se houver.
+
+        O novo segmento é construído e gravado fora do lock do índice; apenas a troca no
+        manifesto bloqueia as buscas e alterações. Toda a fusão ocorre com merge_lock.
+
+        Returns:
+            True se algum grupo foi fundido
+        """
+        with self.merge_lock if self.merge_lock is not None else nullcontext():
+            merged = self._merge_locked()
+            if merged and self.on_merge is not None:
+                self.on_merge()
+            return merged
+
+    def _merge_locked(self) -> bool:
+        """Ver _merge_once (chamado com merge_lock)."""
+        with self._lock:
+            if self._stopped or not self._is_current():
+                # Outro escritor alterou o índice em disco: esta versão não é mais publicada
+                return False
+            sources = self._merge_candidates()
+            if not sources:
+                return False
+            name = self._reserve_name()
+            self._building.add(name)
+            deleted = set().union(*(segment.index.deleted for segment in sources))
+
+        try:
+            ids = np.concatenate([segment.ids for segment in sources])
+            if deleted:
+                ids = ids[~np.isin(ids, np.fromiter(deleted, dtype=np.int64, count=len(deleted)))]
+            merged = self._build_segment(name, ids) if len(ids) else None
+            if merged is not None:
+                path = self._segment_path(name)
+                merged.index.save(path, deleted_path=f"{path}.deleted.tmp.npy")
+
+            with self._lock:
+                if self._stopped:
+                    self._remove_segment_files(name)
+                    return False
+                if any(segment not in self.segments for segment in sources):
+                    # Os segmentos mudaram durante a fusão (compactação): descartar o resultado
+                    self._remove_segment_files(name)
+                    return True
+                # Exclusões feitas durante a fusão
+                late = set().union(*(segment.index.deleted for segment in sources)) - deleted
+                if merged is not None:
+                    merged.index.remove(late)
+                    self._write_segment(merged)
+                position = self.segments.index(sources[0])
+                remaining = [segment for segment in self.segments if segment not in sources]
+                self.segments = remaining[:position] + ([merged] if merged is not None else []) + remaining[position:]
+                self._changed -= {segment.name for segment in sources}
+                for segment in sources:
+                    self._tombstones.pop(segment.name, None)
+                self._write_manifest()
+        finally:
+            with self._lock:
+                if os.path.exists(f"{self._segment_path(name)}.deleted.tmp.npy"):
+                    os.remove(f"{self._segment_path(name)}.deleted.tmp.npy")
+                self._building.discard(name)
+
+        logger.info(f"Segmentos fundidos: {len(sources)} -> {name} ({len(ids)} vetores, "
+                    f"{'/'.join(merged.index.layout) if merged is not None else 'vazio'})")
+        return True
+
+    def _merge_all(self):
+        """Funde segmentos enquanto houver grupos a fundir."""
+        try:
+            while self._merge_once():
+                pass
+        except Exception as e:
+            logger.error(f"Erro ao fundir segmentos do índice: {str(e)}")
+
+    def _start_merge_thread(self):
+        """Inicia a fusão em segundo plano, se ainda não houver uma em andamento."""
+        with self._lock:
+            if self._merge_thread is None or not self._merge_thread.is_alive():
+                self._merge_thread = threading.Thread(target=self._merge_all, daemon=True)
+                self._merge_thread.start()
+
+    def wait_for_merges(self):
+        """
+        Aguarda o fim da fusão em segundo plano em andamento.
+
+        Não deve ser chamado com merge_lock, que a fusão precisa adquirir.
+        """
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def stop_merges(self):
+        """Descarta as fusões em andamento e futuras deste índice (substituído por outra instância)."""
+        with self._lock:
+            self._stopped = True
+
+    def compact(self) -> int:
+        """
+        Remove fisicamente os vetores excluídos, reconstruindo apenas os segmentos que os contêm.
+
+        Returns:
+            Número de vetores removidos
+        """
+        self._check_writable()
+        with self._lock:
+            tail_deleted = np.fromiter(self._tail.deleted, dtype=np.int64, count=len(self._tail.deleted))
+            removed = self._tail.compact()
+            if removed:
+                tail_ids = np.concatenate(self._tail_ids)
+                self._tail_ids = [tail_ids[~np.isin(tail_ids, tail_deleted)]]
+            replaced = []
+            for position, segment in enumerate(self.segments):
+                deleted = segment.index.deleted
+                if not deleted:
+                    continue
+                removed += len(deleted)
+                ids = segment.ids[~np.isin(segment.ids, np.fromiter(deleted, dtype=np.int64, count=len(deleted)))]
+                new_segment = self._build_segment(self._reserve_name(), ids) if len(ids) else None
+                if new_segment is not None and self.path is not None:
+                    self._write_segment(new_segment)
+                self.segments[position] = new_segment
+                replaced.append(segment.name)
+            if replaced:
+                self.segments = [segment for segment in self.segments if segment is not None]
+                self._changed -= set(replaced)
+                for name in replaced:
+                    self._tombstones.pop(name, None)
+                if self.path is not None:
+                    self._write_manifest()
+        if removed:
+            logger.info(f"Índice compactado: {removed} vetores removidos, {self.ntotal} restantes")
+        return removed
+
+    @classmethod
+    def load(cls, path: str, index_type: str = DEFAULT_INDEX_TYPE, nprobe: int = DEFAULT_NPROBE,
+             ef_search: int = DEFAULT_EF_SEARCH, quantization: str = DEFAULT_QUANTIZATION,
+             vectors_path: Optional[str] = None, rerank_factor: int = DEFAULT_RERANK_FACTOR,
+             mmap: bool = False, **kwargs) -> "SegmentedIndex":
+        """
+        Carrega a versão atual de um índice segmentado salvo com save.
+
+        Se a versão for substituída e os seus arquivos apagados durante o carregamento (por um
+        escritor em outro processo), o carregamento é refeito com a nova versão.
+
+        Args:
+            path: Diretório do índice
+            index_type: Tipo dos próximos segmentos fundidos
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+            quantization: Codificação dos próximos segmentos fundidos
+            vectors_path: Arquivo de vetores completos
+            rerank_factor: Candidatos por resultado reordenados com os vetores completos
+            mmap: Abrir somente para leitura, com os segmentos mapeados em memória (ver FaissIndex.load)
+            **kwargs: Demais argumentos do construtor (merge_factor, background_merge, snapshots_kept)
+
+        Returns:
+            Instância de SegmentedIndex
+        """
+        for attempt in range(_LOAD_ATTEMPTS):
+            with open(os.path.join(path, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+            instance = cls(manifest["dimension"], index_type=index_type, nprobe=nprobe, ef_search=ef_search,
+                           quantization=quantization, vectors_path=vectors_path, rerank_factor=rerank_factor,
+                           read_only=mmap, **kwargs)
+            instance.path = path
+            instance.generation = manifest.get("generation", 0)
+            instance._next_segment = manifest["next_segment"]
+            deleted = manifest.get("deleted") or {}
+            try:
+                for name in manifest["segments"]:
+                    segment_path = instance._segment_path(name)
+                    deleted_path = os.path.join(path, deleted[name]) if deleted.get(name) else None
+                    if deleted_path is not None and not os.path.exists(deleted_path):
+                        raise FileNotFoundError(deleted_path)
+                    index = FaissIndex.load(segment_path, index_type=index_type, nprobe=nprobe, ef_search=ef_search,
+                                            quantization=quantization, vectors_path=vectors_path,
+                                            rerank_factor=rerank_factor, mmap=mmap, deleted_path=deleted_path)
+                    instance.segments.append(_Segment(name, index, np.load(f"{segment_path}.ids.npy")))
+                    if deleted.get(name):
+                        instance._tombstones[name] = deleted[name]
+            except FileNotFoundError:
+                if attempt == _LOAD_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"Versão {instance.generation} do índice {path} substituída durante o carregamento")
+                time.sleep(0.05)
+                continue
+            break
+        if not mmap:
+            # Remove arquivos de fusões interrompidas e de versões antigas
+            instance._collect_garbage()
+        return instance
+
+    @classmethod
+    def from_index_file(cls, index_path: str, path: str, vectors_path: str, **kwargs) -> "SegmentedIndex":
+        """
+        Converte um índice salvo por FaissIndex.save no primeiro segmento de um índice
+        segmentado, movendo os arquivos sem regravar os vetores.
+
+        Args:
+            index_path: Arquivo do índice existente
+            path: Diretório do índice segmentado
+            vectors_path: Arquivo de vetores completos
+            **kwargs: Demais argumentos de load
+
+        Returns:
+            Instância de SegmentedIndex
+        """
+        index = FaissIndex.load(index_path, vectors_path=vectors_path)
+        # Garante o arquivo de IDs, ausente em índices salvos por versões anteriores
+        index.save(index_path)
+
+        name = "seg-000000"
+        deleted = {name: f"{name}.faiss.deleted.npy"} if os.path.exists(f"{index_path}.deleted.npy") else {}
+        os.makedirs(path, exist_ok=True)
+        for suffix in (".ids.npy", ".deleted.npy", ""):
+            if os.path.exists(f"{index_path}{suffix}"):
+                os.replace(f"{index_path}{suffix}", os.path.join(path, f"{name}.faiss{suffix}"))
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        with open(f"{manifest_path}.tmp", "w") as f:
+            json.dump({"dimension": index.dimension, "generation": 0, "next_segment": 1, "segments": [name],
+                       "deleted": deleted}, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        logger.info(f"Índice {index_path} convertido no primeiro segmento de {path}")
+        return cls.load(path, vectors_path=vectors_path, **kwargs)
@@ -0,0 +1,377 @@
+import os
+import json
+import heapq
+import shutil
+import hashlib
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from faiss_index import (VectorFile, DEFAULT_INDEX_TYPE, DEFAULT_NPROBE, DEFAULT_EF_SEARCH,
+                         DEFAULT_QUANTIZATION, DEFAULT_RERANK_FACTOR)
+from segmented_index import SegmentedIndex, MANIFEST_NAME
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Threads usadas para consultar os shards em paralelo (0 = uma por shard)
+SEARCH_THREADS = int(os.getenv("KB_SHARD_SEARCH_THREADS", "0"))
+
+# Arquivo com a lista de shards do índice
+SHARDS_MANIFEST_NAME = "shards.json"
+
+def shard_names(num_shards: int) -> List[str]:
+    """
+    Nomes dos shards de um índice com num_shards shards.
+
+    Os nomes não dependem do total, de modo que aumentar ou reduzir o número de shards
+    mantém os shards existentes.
+    """
+    return [f"shard-{i:03d}" for i in range(num_shards)]
+
+def assign_shard(key: str, shards: Iterable[str]) -> Optional[str]:
+    """
+    Escolhe o shard de uma chave por rendezvous hashing (maior peso).
+
+    Ao incluir ou retirar um shard, apenas as chaves que passam a pertencer ao novo shard
+    (ou que pertenciam ao retirado) mudam de dono.
+
+    Args:
+        key: Chave (ID do documento)
+        shards: Nomes dos shards
+
+    Returns:
+        Nome do shard, ou None se não houver shards
+    """
+    def weight(shard: str) -> int:
+        return int.from_bytes(hashlib.blake2b(f"{shard}:{key}".encode("utf-8"), digest_size=8).digest(), "big")
+    return max(shards, key=weight, default=None)
+
+def _heap_merge(results: List[Tuple[np.ndarray, np.ndarray]], num_queries: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Combina os k melhores de cada shard (já ordenados) com um heap, por consulta."""
+    distances = np.full((num_queries, k), np.finfo(np.float32).max, dtype=np.float32)
+    labels = np.full((num_queries, k), -1, dtype=np.int64)
+    for row in range(num_queries):
+        merged = heapq.merge(*(zip(shard_distances[row].tolist(), shard_labels[row].tolist())
+                               for shard_distances, shard_labels in results))
+        for column, (distance, label) in enumerate(itertools.islice(
+                (pair for pair in merged if pair[1] >= 0), k)):
+            distances[row, column] = distance
+            labels[row, column] = label
+    return distances, labels
+
+class ShardedIndex:
+    """
+    Índice dividido em shards, cada um um índice segmentado em seu próprio diretório.
+
+    Os vetores de cada documento ficam no shard escolhido por rendezvous hashing do ID do
+    documento. As buscas consultam os shards em paralelo em um pool de threads (o FAISS
+    libera o GIL durante a busca) e combinam os k melhores de cada shard com um heap.
+
+    Todos os shards compartilham o arquivo de vetores completos: incluir ou retirar shards
+    move apenas os documentos que mudam de dono, lendo os vetores do arquivo, sem gerar
+    embeddings novamente.
+    """
+
+    def __init__(self, dimension: int, shards: List[str], index_type: str = DEFAULT_INDEX_TYPE,
+                 nprobe: int = DEFAULT_NPROBE, ef_search: int = DEFAULT_EF_SEARCH,
+                 quantization: str = DEFAULT_QUANTIZATION, vectors_path: Optional[str] = None,
+                 rerank_factor: int = DEFAULT_RERANK_FACTOR, search_threads: int = SEARCH_THREADS,
+                 read_only: bool = False, **kwargs):
+        """
+        Inicializa um índice com shards vazios.
+
+        Args:
+            dimension: Dimensão dos vetores
+            shards: Nomes dos shards
+            index_type: Tipo dos segmentos fundidos de cada shard
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+            quantization: Codificação dos segmentos fundidos de cada shard
+            vectors_path: Arquivo de vetores completos, compartilhado pelos shards
+            rerank_factor: Candidatos por resultado reordenados com os vetores completos
+            search_threads: Threads para consultar os shards em paralelo (0 = uma por shard)
+            read_only: Índice somente leitura (carregado por mapeamento em memória)
+            **kwargs: Demais argumentos de SegmentedIndex (merge_factor, background_merge)
+        """
+        self.dimension = dimension
+        self.vectors_path = vectors_path
+        self.search_threads = search_threads
+        self.read_only = read_only
+        self._options = dict(kwargs, index_type=index_type, nprobe=nprobe, ef_search=ef_search,
+                             quantization=quantization, vectors_path=vectors_path, rerank_factor=rerank_factor)
+        self.shards: Dict[str, SegmentedIndex] = {}
+        if not read_only:
+            self.shards = {name: SegmentedIndex(dimension, **self._options) for name in shards}
+        self.path = None
+        self._dropped = []  # Shards retirados cujos diretórios são removidos no próximo save
+        self._lock = threading.RLock()
+        self._executor = None
+
+    def _parts(self) -> List[SegmentedIndex]:
+        with self._lock:
+            return list(self.shards.values())
+
+    @property
+    def num_shards(self) -> int:
+        """Número de shards."""
+        return len(self.shards)
+
+    @property
+    def num_segments(self) -> int:
+        """Número total de segmentos em disco."""
+        return sum(shard.num_segments for shard in self._parts())
+
+    @property
+    def ntotal(self) -> int:
+        """Número de vetores armazenados, incluindo os excluídos ainda não compactados."""
+        return sum(shard.ntotal for shard in self._parts())
+
+    @property
+    def num_active(self) -> int:
+        """Número de vetores visíveis nas buscas."""
+        return sum(shard.num_active for shard in self._parts())
+
+    @property
+    def deleted(self) -> set:
+        """IDs excluídos ainda não compactados, de todos os shards."""
+        return set().union(*(shard.deleted for shard in self._parts()))
+
+    @property
+    def deleted_ratio(self) -> float:
+        """Fração dos vetores armazenados que estão excluídos."""
+        ntotal = self.ntotal
+        return len(self.deleted) / ntotal if ntotal else 0.0
+
+    def _largest(self) -> Optional[SegmentedIndex]:
+        return max(self._parts(), key=lambda shard: shard.ntotal, default=None)
+
+    @property
+    def layout(self) -> Tuple[str, str]:
+        """Tipo e codificação do maior segmento do maior shard."""
+        largest = self._largest()
+        return largest.layout if largest is not None else ("flat", "none")
+
+    @property
+    def kind(self) -> str:
+        """Tipo do maior segmento do maior shard."""
+        return self.layout[0]
+
+    @property
+    def code_size(self) -> int:
+        """Bytes por vetor ocupados pela codificação do maior segmento do maior shard."""
+        largest = self._largest()
+        return largest.code_size if largest is not None else self.dimension * np.dtype(np.float32).itemsize
+
+    def _check_writable(self):
+        """Impede alterações em um índice somente leitura."""
+        if self.read_only:
+            raise RuntimeError("Índice FAISS aberto em modo somente leitura")
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray, keys: List[str]):
+        """
+        Adiciona vetores, cada um ao shard da sua chave.
+
+        Args:
+            vectors: Matriz (n, dimensão) de vetores
+            ids: IDs inteiros dos vetores (não podem estar em uso)
+            keys: Chave de cada vetor (ID do documento)
+        """
+        self._check_writable()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        with self._lock:
+            owners = {}
+            owner_of = np.array([owners.setdefault(key, assign_shard(key, self.shards)) for key in keys])
+            for name in set(owners.values()):
+                mask = owner_of == name
+                self.shards[name].add(vectors[mask], ids[mask])
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """
+        Marca IDs como excluídos no shard que os contém.
+
+        Args:
+            ids: IDs a excluir
+
+        Returns:
+            Número de IDs marcados
+        """
+        self._check_writable()
+        ids = list(ids)
+        return sum(shard.remove(ids) for shard in self._parts())
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Máscara dos IDs que estão em algum shard e não foram excluídos (ver SegmentedIndex.contains)."""
+        found = np.zeros(len(ids), dtype=bool)
+        for shard in self._parts():
+            found |= shard.contains(ids)
+        return found
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """
+        Ajusta os parâmetros de busca dos índices aproximados de todos os shards.
+
+        Args:
+            nprobe: Número de listas visitadas por consulta nos índices IVF
+            ef_search: Tamanho da lista de candidatos por consulta no HNSW
+        """
+        for shard in self._parts():
+            shard.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """Pool de threads das buscas, criado no primeiro uso."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.search_threads or max(len(self.shards), 1),
+                                                    thread_name_prefix="shard-search")
+            return self._executor
+
+    def search(self, queries: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca os k vizinhos mais próximos em todos os shards, em paralelo.
+
+        Args:
+            queries: Matriz (n, dimensão) de consultas
+            k: Número de resultados por consulta
+            ids: IDs aos quais restringir a busca (opcional)
+
+        Returns:
+            Tupla (distâncias, IDs), cada uma com forma (n, k); posições sem resultado têm ID -1
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        shards = self._parts()
+        if len(shards) == 1:
+            results = [shards[0].search(queries, k, ids=ids)]
+        else:
+            futures = [self._pool().submit(shard.search, queries, k, ids) for shard in shards]
+            results = [future.result() for future in futures]
+        return _heap_merge(results, len(queries), k)
+
+    def reconstruct(self, vector_id: int) -> np.ndarray:
+        """
+        Retorna o vetor armazenado com um ID, lido do arquivo de vetores completos.
+
+        Args:
+            vector_id: ID do vetor
+
+        Returns:
+            Vetor float32
+        """
+        return VectorFile(self.vectors_path, self.dimension).read([int(vector_id)])[0]
+
+    def set_shards(self, shards: List[str], assignments: Iterable[Tuple[str, List[int]]]) -> int:
+        """
+        Altera o conjunto de shards, movendo apenas os documentos que mudam de dono.
+
+        Os vetores movidos são lidos do arquivo de vetores completos (nenhum embedding é gerado)
+        e excluídos do shard de origem; shards retirados têm o diretório removido no próximo save.
+
+        Args:
+            shards: Novos nomes dos shards
+            assignments: Pares (chave, IDs dos vetores da chave) de todos os documentos do índice
+
+        Returns:
+            Número de vetores movidos
+        """
+        self._check_writable()
+        if not shards:
+            raise ValueError("O índice precisa de pelo menos um shard")
+        vectors = VectorFile(self.vectors_path, self.dimension)
+        with self._lock:
+            new_shards = {name: self.shards.get(name) or SegmentedIndex(self.dimension, **self._options)
+                          for name in shards}
+            moved = 0
+            for key, ids in assignments:
+                old_owner, new_owner = assign_shard(key, self.shards), assign_shard(key, new_shards)
+                if old_owner == new_owner or not len(ids):
+                    continue
+                ids = np.asarray(ids, dtype=np.int64)
+                new_shards[new_owner].add(vectors.read(ids), ids)
+                if old_owner in new_shards:
+                    new_shards[old_owner].remove(ids.tolist())
+                moved += len(ids)
+
+            for name, shard in self.shards.items():
+                if name not in new_shards:
+                    shard.stop_merges()
+                    self._dropped.append(name)
+            self.shards = new_shards
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        logger.info(f"Shards do índice: {', '.join(shards)} ({moved} vetores movidos)")
+        return moved
+
+    def save(self, path: str):
+        """
+        Salva os shards (cada um em um subdiretório) e a lista de shards.
+
+        Args:
+            path: Diretório do índice
+        """
+        self._check_writable()
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            self.path = path
+            for name, shard in self.shards.items():
+                shard.save(os.path.join(path, name))
+            manifest_path = os.path.join(path, SHARDS_MANIFEST_NAME)
+            with open(f"{manifest_path}.tmp", "w") as f:
+                json.dump({"dimension": self.dimension, "shards": list(self.shards)}, f)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
+            for name in self._dropped:
+                shard_path = os.path.join(path, name)
+                if name not in self.shards and os.path.isdir(shard_path):
+                    shutil.rmtree(shard_path)
+            self._dropped = []
+
+    def wait_for_merges(self):
+        """Aguarda o fim das fusões de segmentos em andamento em todos os shards."""
+        for shard in self._parts():
+            shard.wait_for_merges()
+
+    def stop_merges(self):
+        """Descarta as fusões de segmentos em andamento e futuras de todos os shards."""
+        for shard in self._parts():
+            shard.stop_merges()
+
+    def compact(self) -> int:
+        """
+        Remove fisicamente os vetores excluídos de todos os shards.
+
+        Returns:
+            Número de vetores removidos
+        """
+        self._check_writable()
+        return sum(shard.compact() for shard in self._parts())
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False, **kwargs) -> "ShardedIndex":
+        """
+        Carrega um índice salvo com save.
+
+        Args:
+            path: Diretório do índice
+            mmap: Abrir somente para leitura, com os segmentos mapeados em memória
+            **kwargs: Demais argumentos do construtor (index_type, quantization, vectors_path, ...)
+
+        Returns:
+            Instância de ShardedIndex
+        """
+        with open(os.path.join(path, SHARDS_MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        instance = cls(manifest["dimension"], [], read_only=mmap, **kwargs)
+        instance.path = path
+        for name in manifest["shards"]:
+            shard_path = os.path.join(path, name)
+            if os.path.exists(os.path.join(shard_path, MANIFEST_NAME)):
+                instance.shards[name] = SegmentedIndex.load(shard_path, mmap=mmap, **instance._options)
+            elif not mmap:
+                instance.shards[name] = SegmentedIndex(manifest["dimension"], **instance._options)
+        return instance
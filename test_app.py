@@ -1,14 +1,79 @@
 import os
 import sys
+import time
+import asyncio
 import logging
-from pdf_processor import extract_text_from_pdf, chunk_pdf_text
+import tempfile
+import unittest
+import numpy as np
+import tiktoken
+from pdf_processor import (extract_text_from_pdf, extract_pages_from_pdf, join_pages, chunk_pdf_text,
+                           split_text_by_tokens, normalize_pages)
 from vector_store import VectorStore
+from knowledge_base import KnowledgeBase
+from kb_service import get_knowledge_base_service
+from embeddings_backend import HashingEmbeddings
+from embedding_scheduler import EmbeddingScheduler
+from faiss_index import FaissIndex
+from ingest_cache import IngestCache
+from tokenizer_service import TokenizerService
 from response_generator import ResponseGenerator
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Chunks usados nos testes com o backend de embeddings local
+LOCAL_TEST_CHUNKS = [
+    {
+        "chunk_id": 0,
+        "title": "Chunk de Teste 1",
+        "content": "Este é um texto de teste para o armazenamento vetorial FAISS.",
+        "token_count": 15
+    },
+    {
+        "chunk_id": 1,
+        "title": "Chunk de Teste 2",
+        "content": "LangChain é uma biblioteca para construir aplicações com modelos de linguagem.",
+        "token_count": 16
+    }
+]
+
+def require_tokenizer():
+    """
+    Ignora o teste quando a codificação de tokens não pode ser carregada (por exemplo, sem
+    acesso à rede para baixar o arquivo da codificação).
+    """
+    try:
+        tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        raise unittest.SkipTest(f"Codificação de tokens indisponível: {str(e)}")
+
+def make_pages(texts):
+    """
+    Monta registros de página, com as posições no texto unido, a partir dos textos das páginas.
+    """
+    pages = []
+    offset = 0
+    for i, page_text in enumerate(texts):
+        pages.append({"page_number": i + 1, "text": page_text, "start_char": offset, "end_char": offset + len(page_text)})
+        offset += len(page_text)
+    return pages
+
+def make_test_chunks(tag, count=4):
+    """
+    Cria chunks de teste distintos para um documento identificado por tag.
+    """
+    return [
+        {
+            "chunk_id": i,
+            "title": f"Chunk {tag} {i + 1}",
+            "content": f"Documento {tag}, parte {i}, sobre o assunto {tag}{i}.",
+            "token_count": 12
+        }
+        for i in range(count)
+    ]
+
 def test_pdf_processing():
     """
     Testa as funções de processamento de PDF.
@@ -31,9 +96,15 @@ def test_pdf_processing():
     
     logger.info(f"Texto extraído com sucesso. Tamanho: {len(text)} caracteres")
     
+    # Verificar a extração por páginas
+    pages = extract_pages_from_pdf(pdf_path)
+    if join_pages(pages) != text or pages[-1]["end_char"] != len(text):
+        logger.error("Registros de página inconsistentes com o texto extraído.")
+        return False
+    
     # Dividir texto em chunks
     logger.info("Dividindo texto em chunks")
-    chunks = chunk_pdf_text(text)
+    chunks = chunk_pdf_text(text, pages=pages)
     
     if not chunks:
         logger.error("Falha ao dividir texto em chunks.")
@@ -47,6 +118,7 @@ def test_pdf_processing():
         logger.info(f"  ID: {chunk['chunk_id']}")
         logger.info(f"  Título: {chunk['title']}")
         logger.info(f"  Tokens: {chunk['token_count']}")
+        logger.info(f"  Páginas: {chunk.get('page_start')}-{chunk.get('page_end')}")
         logger.info(f"  Conteúdo (primeiros 100 caracteres): {chunk['content'][:100]}...")
     
     logger.info("Teste de processamento de PDF concluído com sucesso!")
@@ -128,6 +200,496 @@ def test_vector_store(chunks=None):
     logger.info("Teste de armazenamento vetorial concluído com sucesso!")
     return True
 
+def test_token_chunking():
+    """
+    Testa a divisão do texto em trechos pelos limites dos tokens.
+    """
+    logger.info("=== Teste de Divisão por Tokens ===")
+    require_tokenizer()
+    
+    paragraph = "O índice FAISS armazena os vetores dos chunks. A busca compara a consulta com cada vetor."
+    text = "\n\n".join(f"Seção {i}. {paragraph}" for i in range(20))
+    chunks = split_text_by_tokens(text, chunk_size=50, chunk_overlap=10)
+    assert len(chunks) >= 2 and all(chunk["token_count"] <= 50 for chunk in chunks), \
+        "Trechos vazios ou acima do limite de tokens."
+    
+    # Cada trecho é uma fatia do texto, sem espaços no final, e os trechos se sobrepõem
+    for previous, chunk in zip([None] + chunks, chunks):
+        assert chunk["content"] == text[chunk["start_char"]:chunk["end_char"]] == chunk["content"].rstrip(), \
+            "Deslocamentos de caracteres inconsistentes com o conteúdo do trecho."
+        assert previous is None or previous["start_char"] < chunk["start_char"] < previous["end_char"], \
+            "Trechos consecutivos não avançam ou não se sobrepõem."
+    assert chunks[0]["start_char"] == 0 and chunks[-1]["end_char"] == len(text), \
+        "Os trechos não cobrem o texto inteiro."
+    
+    # Os limites preferem quebras de parágrafo e de frase a cortes no meio de palavras
+    assert all(chunk["content"].endswith(".") for chunk in chunks), "Trecho terminou fora de uma quebra de frase."
+    
+    try:
+        split_text_by_tokens(text, chunk_size=50, chunk_overlap=50)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Sobreposição maior ou igual ao tamanho do trecho foi aceita.")
+    
+    logger.info("Teste de divisão por tokens concluído com sucesso!")
+
+def test_tokenizer_service():
+    """
+    Testa o serviço de tokenização: contagem em lote e memoização das contagens.
+    """
+    logger.info("=== Teste do Serviço de Tokenização ===")
+    require_tokenizer()
+    
+    tokenizer = TokenizerService(cache_size=8)
+    texts = [f"Chunk {i} sobre a contagem de tokens dos trechos." for i in range(3)]
+    counts = tokenizer.count_tokens_batch(texts + texts[:1])
+    assert counts == [len(tokenizer.encode(text)) for text in texts + texts[:1]], \
+        "Contagem em lote difere da codificação de cada texto."
+    
+    # Um texto já contado deve vir da memoização
+    hits = tokenizer.get_stats()["cache"]["hits"]
+    assert tokenizer.count_tokens(texts[0]) == counts[0] and tokenizer.get_stats()["cache"]["hits"] == hits + 1, \
+        "Texto repetido não foi atendido pela memoização."
+    
+    # Textos que não se repetem (prompts e respostas) são contados sem ocupar a memoização
+    prompt = "Prompt montado com a pergunta e os chunks recuperados."
+    assert tokenizer.count_tokens(prompt, memoize=False) == len(tokenizer.encode(prompt)), \
+        "Contagem sem memoização incorreta."
+    stats = tokenizer.get_stats()["cache"]
+    assert stats["size"] == len(texts) and stats["hits"] == hits + 1, \
+        "Contagem sem memoização consultou ou preencheu a memoização."
+    
+    logger.info("Teste do serviço de tokenização concluído com sucesso!")
+
+def test_ingest_cache():
+    """
+    Testa o cache de ingestão: acertos e remoção das entradas usadas há mais tempo.
+    """
+    logger.info("=== Teste do Cache de Ingestão ===")
+    
+    pages = [{"page_number": 1, "text": "x" * 1000, "start_char": 0, "end_char": 1000}]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        keys = [IngestCache.make_key(f"pdf {i}".encode(), chunk_size=1000, chunk_overlap=200) for i in range(3)]
+        assert IngestCache.make_key(b"pdf 0", chunk_size=500, chunk_overlap=200) != keys[0], \
+            "Chave do cache não depende dos parâmetros de chunking."
+        
+        cache = IngestCache(cache_dir)
+        cache.put(keys[0], pages, [])
+        entry_size = cache.total_bytes
+        cache.max_bytes = 2 * entry_size + entry_size // 2
+        cache.put(keys[1], pages, [])
+        
+        # A primeira entrada é lida depois da segunda: a segunda passa a ser a mais antiga
+        for age, key in ((200, keys[0]), (100, keys[1])):
+            path = os.path.join(cache_dir, f"{key}.json")
+            os.utime(path, (time.time() - age, time.time() - age))
+        assert cache.get(keys[0]) is not None, "Entrada armazenada não foi encontrada no cache."
+        cache.put(keys[2], pages, [])
+        
+        stats = cache.get_stats()
+        assert cache.get(keys[1]) is None and cache.get(keys[0]) is not None and cache.get(keys[2]) is not None, \
+            "O cache não removeu a entrada usada há mais tempo."
+        assert stats["evictions"] == 1 and stats["entries"] == 2 and stats["bytes"] <= cache.max_bytes, \
+            f"Estatísticas do cache incorretas: {stats}"
+    
+    logger.info("Teste do cache de ingestão concluído com sucesso!")
+
+def test_replace_document():
+    """
+    Testa a substituição incremental de um documento: apenas a página alterada é dividida
+    novamente, e os chunks são renumerados na ordem do novo texto.
+    """
+    logger.info("=== Teste de Substituição de Documento ===")
+    require_tokenizer()
+    
+    texts = [f"Página {i} sobre o tema {topic}. " * 6 + "\n\n" for i, topic in
+             enumerate(["indexação vetorial", "busca aproximada", "compactação de segmentos"], 1)]
+    revised = list(texts)
+    revised[1] = "Página 2 revisada: cache de consultas e agrupamento de requisições. " * 6 + "\n\n"
+    
+    with tempfile.TemporaryDirectory() as kb_path:
+        knowledge_base = KnowledgeBase(kb_path=kb_path, embeddings=HashingEmbeddings())
+        pages = make_pages(texts)
+        chunks = chunk_pdf_text(join_pages(pages), chunk_size=40, chunk_overlap=5, pages=pages)
+        doc_id = knowledge_base.add_document("revisado.pdf", chunks, pages=pages)
+        assert doc_id, "Falha ao adicionar o documento."
+        
+        new_pages = make_pages(revised)
+        stats = knowledge_base.replace_document(doc_id, new_pages, chunk_size=40, chunk_overlap=5)
+        assert stats and stats["pages_changed"] == 1 and stats["chunks_kept"] and stats["chunks_added"] \
+            and stats["chunks_removed"], f"Substituição não reaproveitou as páginas inalteradas: {stats}"
+        
+        # Todos os chunks do documento, na ordem do novo texto
+        results = knowledge_base.similarity_search("tema", k=100)
+        results.sort(key=lambda result: result["metadata"]["start_char"])
+        metadatas = [result["metadata"] for result in results]
+        
+        # A lacuna deixada pela página alterada deve ser preenchida pelos novos chunks
+        new_text = join_pages(new_pages)
+        page_two = new_pages[1]
+        covered = [(metadata["start_char"], metadata["end_char"]) for metadata in metadatas
+                   if metadata["page_start"] <= 2 <= metadata["page_end"]]
+        assert covered and min(start for start, _ in covered) <= page_two["start_char"] \
+            and max(end for _, end in covered) >= page_two["start_char"] + len(page_two["text"].rstrip()), \
+            "A página alterada não foi coberta pelos novos chunks."
+        
+        # Chunks renumerados na ordem do texto, com posições válidas no novo texto
+        assert [metadata["chunk_id"] for metadata in metadatas] == list(range(len(metadatas))) \
+            and [metadata["title"] for metadata in metadatas] == [f"Chunk {i+1}" for i in range(len(metadatas))] \
+            and knowledge_base.get_all_documents()[doc_id]["chunk_count"] == len(metadatas), \
+            "Chunks do documento substituído não foram renumerados."
+        assert all(result["content"] == new_text[result["metadata"]["start_char"]:result["metadata"]["end_char"]]
+                   for result in results), "Posições dos chunks não correspondem ao novo texto."
+        
+        results = knowledge_base.similarity_search("cache de consultas e agrupamento de requisições", k=1)
+        assert results and "requisições" in results[0]["content"], \
+            "Conteúdo da página revisada não foi encontrado na busca."
+    
+    logger.info("Teste de substituição de documento concluído com sucesso!")
+
+def test_normalize_pages():
+    """
+    Testa a remoção de cabeçalhos e rodapés repetidos e a junção de hifenizações.
+    """
+    logger.info("=== Teste de Normalização de Páginas ===")
+    require_tokenizer()
+    
+    topics = ["índices", "consultas", "segmentos", "shards", "caches", "lotes"]
+    pages = make_pages([
+        f"Relatório Anual ACME\nCapítulo {i}: {topic}.\nO texto sobre {topic} trata do arma-\nzenamento vetorial de {topic}.\nPágina {i} de 6\n"
+        for i, topic in enumerate(topics, 1)
+    ])
+    normalized, stats = normalize_pages(pages)
+    
+    expected = [f"Capítulo {i}: {topic}.\nO texto sobre {topic} trata do armazenamento vetorial de {topic}.\n"
+                for i, topic in enumerate(topics, 1)]
+    assert [page["text"] for page in normalized] == expected, "Cabeçalho, rodapé ou hifenização não foram tratados."
+    assert stats["lines_removed"] == 12 and stats["hyphenations_joined"] == 6 and stats["tokens_removed"] > 0, \
+        f"Estatísticas de normalização incorretas: {stats}"
+    
+    # Os deslocamentos das páginas devem corresponder ao novo texto
+    assert normalized[-1]["end_char"] == len(join_pages(normalized)) \
+        and all(page["start_char"] == previous["end_char"] for previous, page in zip(normalized, normalized[1:])), \
+        "Deslocamentos das páginas normalizadas inconsistentes."
+    
+    # Documentos curtos não têm linhas removidas por repetição
+    short, short_stats = normalize_pages(pages[:2])
+    assert not short_stats["lines_removed"] and "Relatório Anual ACME" in short[0]["text"], \
+        "Linhas removidas em um documento com poucas páginas."
+    
+    logger.info("Teste de normalização de páginas concluído com sucesso!")
+
+def test_embedding_scheduler():
+    """
+    Testa os limites do agendador de embeddings: tokens e textos por lote e requisições
+    simultâneas.
+    """
+    logger.info("=== Teste do Agendador de Embeddings ===")
+    require_tokenizer()
+    
+    class SlowEmbeddings:
+        """Modelo de embeddings local com latência, que registra as requisições simultâneas."""
+        
+        def __init__(self):
+            self.active = 0
+            self.max_active = 0
+            self.batch_sizes = []
+        
+        def embed_documents(self, texts):
+            return [[float(len(text)), float(sum(map(ord, text)))] for text in texts]
+        
+        async def aembed_documents(self, texts):
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.batch_sizes.append(len(texts))
+            await asyncio.sleep(0.01)
+            self.active -= 1
+            return self.embed_documents(texts)
+    
+    model = SlowEmbeddings()
+    scheduler = EmbeddingScheduler(model, max_batch_tokens=10, max_batch_size=3, max_concurrency=2,
+                                   requests_per_minute=0, tokens_per_minute=0)
+    assert scheduler.make_batches([4, 4, 4, 1, 1, 1, 1, 20]) == [[0, 1], [2, 3, 4], [5, 6], [7]], \
+        "Lotes não respeitam os limites de tokens e de textos."
+    
+    texts = [f"texto número {i} sobre vetores" for i in range(12)]
+    vectors = scheduler.embed_documents(texts)
+    assert vectors == model.embed_documents(texts), "Vetores do agendador fora da ordem dos textos."
+    assert max(model.batch_sizes) <= 3 and model.max_active <= 2 \
+        and scheduler.get_stats()["requests"] == len(model.batch_sizes), \
+        "Requisições não respeitam os limites do agendador."
+    
+    logger.info("Teste do agendador de embeddings concluído com sucesso!")
+
+def test_local_embeddings():
+    """
+    Testa o backend de embeddings local (sem rede) com o VectorStore.
+    """
+    logger.info("=== Teste de Embeddings Locais ===")
+    
+    embeddings = HashingEmbeddings()
+    vectors = embeddings.embed_documents(["FAISS indexa vetores", "FAISS indexa vetores", ""])
+    assert len(vectors[0]) == 1536 and vectors[0] == vectors[1], \
+        "Embeddings locais não são determinísticos ou têm dimensão incorreta."
+    assert abs(sum(x * x for x in vectors[0]) - 1.0) <= 1e-4 and not any(vectors[2]), \
+        "Embeddings locais não estão normalizados."
+    
+    # VectorStore com o backend local
+    vector_store = VectorStore(embeddings=embeddings)
+    vector_store.create_vector_store([dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+    results = vector_store.similarity_search("biblioteca LangChain para modelos de linguagem", k=1)
+    assert results and results[0]["metadata"]["chunk_id"] == 1, "Busca com embeddings locais não retornou o chunk esperado."
+    
+    # A busca em lote deve retornar, por consulta, o mesmo que a busca individual
+    batch_results = vector_store.batch_similarity_search(["biblioteca LangChain para modelos de linguagem", "FAISS"], k=1)
+    assert batch_results.ids.shape == (2, 1) and batch_results[0] == results, \
+        "Busca em lote não corresponde à busca individual."
+    
+    logger.info("Teste de embeddings locais concluído com sucesso!")
+
+def test_knowledge_base():
+    """
+    Testa a KnowledgeBase com o backend local: adição, busca, reabertura, cache de
+    consultas, remoção e leitura por uma base somente leitura.
+    """
+    logger.info("=== Teste da Base de Conhecimento ===")
+    
+    embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as kb_path:
+        knowledge_base = KnowledgeBase(kb_path=kb_path, embeddings=embeddings)
+        doc_id = knowledge_base.add_document("teste.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        results = knowledge_base.similarity_search("armazenamento vetorial FAISS", k=1)
+        assert doc_id and results and results[0]["metadata"]["doc_id"] == doc_id, \
+            "Falha ao adicionar e buscar documento com embeddings locais."
+        
+        # Documentos e chunks devem ser lidos do disco ao reabrir a base
+        reopened = KnowledgeBase(kb_path=kb_path, embeddings=embeddings)
+        reopened_results = reopened.similarity_search("armazenamento vetorial FAISS", k=1)
+        assert doc_id in reopened.get_all_documents() and reopened_results \
+            and reopened_results[0]["content"] == results[0]["content"], \
+            "Base reaberta não contém o documento adicionado."
+        
+        # A mesma consulta, com outra caixa e espaços, deve vir do cache de consultas
+        hits = knowledge_base.query_embedder.get_stats()["hits"]
+        knowledge_base.similarity_search("Armazenamento  vetorial FAISS", k=1)
+        assert knowledge_base.query_embedder.get_stats()["hits"] == hits + 1, \
+            "Consulta repetida não foi atendida pelo cache de consultas."
+        
+        # Uma base somente leitura encontra o documento e recusa alterações
+        reader = KnowledgeBase(kb_path=kb_path, embeddings=embeddings, read_only=True, reload_interval=0)
+        reader_results = reader.similarity_search("armazenamento vetorial FAISS", k=1)
+        assert reader_results and reader_results[0]["content"] == results[0]["content"], \
+            "Base somente leitura não encontrou o documento."
+        assert not reader.add_document("outro.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS]) \
+            and not reader.remove_document(doc_id), "Base somente leitura aceitou uma alteração."
+        
+        # A remoção deve excluir os vetores do documento do índice
+        assert knowledge_base.remove_document(doc_id) \
+            and not knowledge_base.similarity_search("armazenamento vetorial FAISS"), \
+            "Documento removido ainda aparece nos resultados da busca."
+        
+        # A base somente leitura, aberta antes da remoção, deve carregar a nova versão publicada
+        assert not reader.similarity_search("armazenamento vetorial FAISS") and doc_id not in reader.get_all_documents(), \
+            "Base somente leitura não carregou a nova versão da base."
+    
+    logger.info("Teste da base de conhecimento concluído com sucesso!")
+
+def test_index_migration():
+    """
+    Testa a migração do índice para IVF com o crescimento do corpus: os vetores excluídos
+    antes da migração continuam excluídos, e os demais continuam sendo encontrados.
+    """
+    logger.info("=== Teste de Migração do Índice ===")
+    
+    vectors = np.random.default_rng(0).standard_normal((1500, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = FaissIndex(32, index_type="ivf_flat")
+    index.add(vectors[:500], np.arange(500))
+    assert index.kind == "flat", "Índice IVF criado sem vetores suficientes para o treino."
+    
+    removed = np.arange(0, 500, 10)
+    index.remove(removed)
+    index.add(vectors[500:], np.arange(500, 1500))
+    assert index.kind == "ivf_flat" and index.num_active == len(vectors) - len(removed), \
+        "O índice não migrou para IVF com os vetores ativos."
+    
+    # Cada vetor ativo encontra a si mesmo, e os excluídos não voltam aos resultados
+    _, labels = index.search(vectors[:100], 10)
+    assert all(labels[i, 0] == i for i in range(100) if i % 10), "Vetor ativo não encontrado após a migração."
+    assert not np.isin(labels, removed).any(), "Vetor excluído voltou aos resultados após a migração."
+    
+    logger.info("Teste de migração do índice concluído com sucesso!")
+
+def test_vector_compaction():
+    """
+    Testa a compactação da base com vetores quantizados: as linhas dos chunks removidos
+    saem do arquivo de vetores, e a base reaberta continua encontrando os demais chunks.
+    """
+    logger.info("=== Teste de Compactação dos Vetores ===")
+    
+    embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as kb_path:
+        knowledge_base = KnowledgeBase(kb_path=kb_path, embeddings=embeddings, quantization="sq8",
+                                       compaction_threshold=0.2)
+        doc_ids = [knowledge_base.add_document(f"{tag}.pdf", make_test_chunks(tag)) for tag in "ABCDE"]
+        vectors_path = os.path.join(kb_path, "vectors.f32")
+        size = os.path.getsize(vectors_path)
+        assert all(knowledge_base.remove_document(doc_id) for doc_id in doc_ids[:3]), "Falha ao remover os documentos."
+        assert os.path.getsize(vectors_path) < size, "A compactação não reduziu o arquivo de vetores."
+        
+        reopened = KnowledgeBase(kb_path=kb_path, embeddings=embeddings, quantization="sq8")
+        results = reopened.similarity_search("Documento E, parte 2, sobre o assunto E2.", k=1)
+        assert results and results[0]["metadata"]["doc_id"] == doc_ids[4] \
+            and results[0]["content"] == make_test_chunks("E")[2]["content"], \
+            "Chunk restante não encontrado após a compactação."
+    
+    logger.info("Teste de compactação dos vetores concluído com sucesso!")
+
+def test_failed_add_vector_ids():
+    """
+    Testa que os IDs de vetores gravados por uma adição que falhou não são reutilizados,
+    nem depois que a compactação descarta as linhas órfãs, nem ao reabrir a base.
+    """
+    logger.info("=== Teste de IDs de Uma Adição com Falha ===")
+    
+    embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as kb_path:
+        knowledge_base = KnowledgeBase(kb_path=kb_path, embeddings=embeddings, quantization="sq8",
+                                       compaction_threshold=0.2)
+        doc_a = knowledge_base.add_document("A.pdf", make_test_chunks("A"))
+        
+        # Metadados que não podem ser gravados fazem a adição falhar depois da gravação dos vetores
+        assert not knowledge_base.add_document("B.pdf", make_test_chunks("B"), doc_metadata={"x": object()}), \
+            "Adição com metadados inválidos não falhou."
+        
+        # A remoção de A compacta o arquivo de vetores, descartando também as linhas órfãs
+        assert knowledge_base.remove_document(doc_a), "Falha ao remover o documento."
+        doc_c = knowledge_base.add_document("C.pdf", make_test_chunks("C"))
+        assert doc_c, "Adição após a compactação reutilizou IDs das linhas órfãs."
+        
+        reopened = KnowledgeBase(kb_path=kb_path, embeddings=embeddings, quantization="sq8",
+                                 compaction_threshold=0.2)
+        doc_e = reopened.add_document("E.pdf", make_test_chunks("E"))
+        results = reopened.similarity_search("Documento C, parte 1, sobre o assunto C1.", k=1)
+        assert doc_e and results and results[0]["metadata"]["doc_id"] == doc_c, \
+            "Adição após reabrir a base reutilizou IDs das linhas órfãs."
+    
+    logger.info("Teste de IDs de uma adição com falha concluído com sucesso!")
+
+def test_sharded_knowledge_base():
+    """
+    Testa a base com o índice dividido em shards, dois escritores na mesma base e a busca
+    roteada pelos centróides dos documentos.
+    """
+    logger.info("=== Teste da Base com Shards ===")
+    
+    embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as kb_path:
+        # Com o índice dividido em shards, a busca deve retornar o chunk esperado
+        sharded = KnowledgeBase(kb_path=kb_path, embeddings=embeddings, num_shards=2)
+        sharded.add_document("teste.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        results = sharded.similarity_search("armazenamento vetorial FAISS", k=1)
+        assert sharded.get_index_stats()["shards"] == 2 and results \
+            and results[0]["content"] == LOCAL_TEST_CHUNKS[0]["content"], \
+            "Busca na base com shards não retornou o chunk esperado."
+        
+        # Ao reabrir a base sem informar o número de shards, o número gravado é mantido
+        reopened = KnowledgeBase(kb_path=kb_path, embeddings=embeddings)
+        reopened_results = reopened.similarity_search("armazenamento vetorial FAISS", k=1)
+        assert reopened.get_index_stats()["shards"] == 2 and reopened_results \
+            and reopened_results[0]["content"] == results[0]["content"], \
+            "Base reaberta não manteve o número de shards."
+        
+        # Com dois escritores na mesma base, cada alteração deve partir da versão gravada pelo outro
+        other = KnowledgeBase(kb_path=kb_path, embeddings=embeddings, num_shards=2)
+        other_doc_id = other.add_document("outro.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        sharded.add_document("terceiro.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        assert other_doc_id in sharded.get_all_documents() and len(sharded.get_all_documents()) == 3 \
+            and sharded.index.num_active == 3 * len(LOCAL_TEST_CHUNKS) and not sharded.wal.pending(), \
+            "Escritores concorrentes deixaram a base inconsistente."
+        
+        # A busca roteada deve buscar apenas os chunks do documento de centróide mais próximo
+        routed_results = sharded.similarity_search("armazenamento vetorial FAISS", k=1, route_documents=1)
+        assert len(sharded.router) == 3 and routed_results and routed_results[0]["content"] == results[0]["content"], \
+            "Busca roteada pelos centróides dos documentos não retornou o chunk esperado."
+        
+        # Na busca roteada em lote, cada consulta deve ter o mesmo resultado da busca individual
+        queries = ["armazenamento vetorial FAISS", "biblioteca LangChain para modelos de linguagem"]
+        batch_results = sharded.batch_similarity_search(queries, k=2, route_documents=1)
+        for i, query in enumerate(queries):
+            single = sharded.similarity_search(query, k=2, route_documents=1)
+            assert [(result["metadata"]["doc_id"], result["content"]) for result in batch_results[i]] \
+                == [(result["metadata"]["doc_id"], result["content"]) for result in single], \
+                "Busca roteada em lote não corresponde à busca individual."
+    
+    logger.info("Teste da base com shards concluído com sucesso!")
+
+def test_wal_recovery():
+    """
+    Testa a recuperação de uma escrita interrompida depois da gravação do banco e antes da
+    gravação do índice (falha do processo no meio da operação).
+    """
+    logger.info("=== Teste de Recuperação do Log de Escrita ===")
+    
+    embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as kb_path:
+        KnowledgeBase(kb_path=kb_path, embeddings=embeddings).add_document("base.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        
+        # O escritor "falha" depois do ponto de confirmação: o índice não chega ao disco
+        crashed = KnowledgeBase(kb_path=kb_path, embeddings=embeddings)
+        crashed._save_index = lambda: False
+        doc_id = crashed.add_document("interrompido.pdf", [{
+            "chunk_id": 0,
+            "title": "Chunk Interrompido",
+            "content": "Escrita interrompida recuperada pelo log de escrita antecipada.",
+            "token_count": 12
+        }])
+        assert doc_id and crashed.wal.pending(), "Operação interrompida não deixou registro no log de escrita."
+        
+        # Ao abrir a base, a operação é concluída com os vetores do arquivo de vetores completos
+        recovered = KnowledgeBase(kb_path=kb_path, embeddings=embeddings)
+        results = recovered.similarity_search("escrita interrompida recuperada pelo log", k=1)
+        assert not recovered.wal.pending() and doc_id in recovered.get_all_documents() \
+            and recovered.index.num_active == len(LOCAL_TEST_CHUNKS) + 1 \
+            and results and results[0]["metadata"]["doc_id"] == doc_id, \
+            "Operação interrompida não foi recuperada."
+        
+        # Os IDs registrados não são reutilizados pela próxima escrita
+        recovered.add_document("depois.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        assert recovered.next_chunk_id == 2 * len(LOCAL_TEST_CHUNKS) + 1 \
+            and KnowledgeBase(kb_path=kb_path, embeddings=embeddings).index.num_active == 2 * len(LOCAL_TEST_CHUNKS) + 1, \
+            "Escrita posterior à recuperação deixou a base inconsistente."
+    
+    logger.info("Teste de recuperação do log de escrita concluído com sucesso!")
+
+def test_knowledge_base_service():
+    """
+    Testa o serviço compartilhado: sessões com a mesma chave recebem o mesmo serviço, e
+    sessões com outra chave, um serviço próprio sobre a mesma base.
+    """
+    logger.info("=== Teste do Serviço da Base de Conhecimento ===")
+    
+    embeddings = HashingEmbeddings()
+    with tempfile.TemporaryDirectory() as kb_path:
+        service = get_knowledge_base_service(kb_path, embeddings=embeddings)
+        service.add_document("teste.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        assert get_knowledge_base_service(kb_path) is service \
+            and service.similarity_search("armazenamento vetorial FAISS", k=1), \
+            "Serviço compartilhado da base de conhecimento não foi reutilizado."
+        
+        # Sessões com outra chave de API recebem um serviço próprio sobre a mesma base
+        other = get_knowledge_base_service(kb_path, openai_api_key="outra-chave", embeddings=embeddings,
+                                           reload_interval=0)
+        assert other is not service and len(other.get_all_documents()) == 1, \
+            "Sessões com chaves de API diferentes compartilharam o serviço."
+        
+        # O outro serviço, gravável, vê as alterações publicadas depois da sua abertura
+        service.add_document("outro.pdf", [dict(chunk) for chunk in LOCAL_TEST_CHUNKS])
+        assert len(other.get_all_documents()) == 2, "Serviço gravável não carregou a nova versão da base."
+    
+    logger.info("Teste do serviço da base de conhecimento concluído com sucesso!")
+
 def test_response_generation():
     """
     Testa a geração de respostas com OpenAI.
@@ -190,28 +752,61 @@ def test_response_generation():
     logger.info("Teste de geração de respostas concluído com sucesso!")
     return True
 
+def run_test(test) -> str:
+    """
+    Executa um teste fora do pytest.
+    
+    Os testes com assert falham com AssertionError e são ignorados com SkipTest (por exemplo,
+    sem a chave de API ou sem a codificação de tokens); os demais retornam False em caso de falha.
+    
+    Args:
+        test: Função de teste
+    
+    Returns:
+        "SUCESSO", "FALHA" ou "IGNORADO"
+    """
+    try:
+        return "FALHA" if test() is False else "SUCESSO"
+    except unittest.SkipTest as e:
+        logger.warning(f"Teste ignorado: {str(e)}")
+        return "IGNORADO"
+    except AssertionError as e:
+        logger.error(f"Falha no teste: {str(e)}")
+        return "FALHA"
+
 def main():
     """
     Função principal para executar os testes.
     """
     logger.info("Iniciando testes da aplicação RAG")
     
-    # Testar processamento de PDF
-    pdf_success = test_pdf_processing()
-    
-    # Testar armazenamento vetorial
-    vector_success = test_vector_store()
-    
-    # Testar geração de respostas
-    response_success = test_response_generation()
+    tests = [
+        ("Processamento de PDF", test_pdf_processing),
+        ("Armazenamento Vetorial", test_vector_store),
+        ("Divisão por Tokens", test_token_chunking),
+        ("Serviço de Tokenização", test_tokenizer_service),
+        ("Cache de Ingestão", test_ingest_cache),
+        ("Substituição de Documento", test_replace_document),
+        ("Normalização de Páginas", test_normalize_pages),
+        ("Agendador de Embeddings", test_embedding_scheduler),
+        ("Embeddings Locais", test_local_embeddings),
+        ("Base de Conhecimento", test_knowledge_base),
+        ("Migração do Índice", test_index_migration),
+        ("Compactação dos Vetores", test_vector_compaction),
+        ("IDs de Uma Adição com Falha", test_failed_add_vector_ids),
+        ("Base com Shards", test_sharded_knowledge_base),
+        ("Recuperação do Log de Escrita", test_wal_recovery),
+        ("Serviço da Base de Conhecimento", test_knowledge_base_service),
+        ("Geração de Respostas", test_response_generation)
+    ]
+    results = [(name, run_test(test)) for name, test in tests]
     
     # Resumo dos testes
     logger.info("=== Resumo dos Testes ===")
-    logger.info(f"Processamento de PDF: {'SUCESSO' if pdf_success else 'FALHA'}")
-    logger.info(f"Armazenamento Vetorial: {'SUCESSO' if vector_success else 'FALHA'}")
-    logger.info(f"Geração de Respostas: {'SUCESSO' if response_success else 'FALHA'}")
+    for name, result in results:
+        logger.info(f"{name}: {result}")
     
-    if pdf_success and vector_success and response_success:
+    if all(result != "FALHA" for _, result in results):
         logger.info("Todos os testes foram concluídos com sucesso!")
         return 0
     else:
@@ -0,0 +1,237 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import tiktoken
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class TokenizerService:
+    """
+    Serviço de tokenização compartilhado pelo processo, com encoding em cache,
+    contagem em lote e memoização das contagens de textos repetidos.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 4096, num_threads: int = 8):
+        """
+        Inicializa o serviço de tokenização.
+
+        Args:
+            encoding_name: Nome do encoding do tiktoken
+            cache_size: Número máximo de contagens memoizadas (LRU)
+            num_threads: Número de threads usadas pelo tiktoken na contagem em lote
+        """
+        self.encoding_name = encoding_name
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.cache_size = cache_size
+        self.num_threads = num_threads
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zera as estatísticas de tempo e de cache."""
+        with self._stats_lock:
+            self._stats = {}
+            self._cache_hits = 0
+            self._cache_misses = 0
+
+    @contextmanager
+    def _timed(self, operation: str):
+        """Acumula o tempo gasto em uma operação e o número de tokens processados."""
+        counter = {"tokens": 0}
+        start = time.perf_counter()
+        try:
+            yield counter
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                stats = self._stats.setdefault(operation, {"calls": 0, "tokens": 0, "seconds": 0.0})
+                stats["calls"] += 1
+                stats["tokens"] += counter["tokens"]
+                stats["seconds"] += elapsed
+            logger.debug(f"Tokenização '{operation}': {counter['tokens']} tokens em {elapsed * 1000:.2f} ms")
+
+    def encode(self, text: str) -> List[int]:
+        """
+        Codifica um texto (tokens especiais são tratados como texto comum).
+
+        Args:
+            text: Texto a ser codificado
+
+        Returns:
+            Lista de tokens
+        """
+        with self._timed("encode") as counter:
+            tokens = self.encoding.encode_ordinary(text)
+            counter["tokens"] = len(tokens)
+        return tokens
+
+    def encode_with_offsets(self, text: str) -> Tuple[List[int], np.ndarray]:
+        """
+        Codifica um texto e calcula o deslocamento de caractere de início de cada token.
+
+        Os deslocamentos vêm dos comprimentos em bytes dos tokens, convertidos para posições de
+        caractere pela contagem de bytes iniciais de UTF-8, sem decodificar token a token.
+
+        Args:
+            text: Texto a ser codificado
+
+        Returns:
+            Tupla (tokens, deslocamentos), em que os deslocamentos têm um elemento a mais
+            que os tokens: o comprimento do texto
+        """
+        tokens = self.encode(text)
+        with self._timed("offsets") as counter:
+            counter["tokens"] = len(tokens)
+            raw = np.frombuffer(text.encode("utf-8", errors="surrogatepass"), dtype=np.uint8)
+            token_lengths = _token_byte_lengths(self.encoding_name)[np.asarray(tokens, dtype=np.int64)]
+            byte_offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+            np.cumsum(token_lengths, out=byte_offsets[1:])
+
+            if byte_offsets[-1] != len(raw):
+                # O texto não sobrevive ao ciclo codificação/decodificação; usar o cálculo do tiktoken
+                _, offsets = self.encoding.decode_with_offsets(tokens)
+                return tokens, np.array(offsets + [len(text)], dtype=np.int64)
+
+            # char_starts[b] = número de caracteres que começam antes do byte b
+            char_starts = np.zeros(len(raw) + 1, dtype=np.int32)
+            np.cumsum((raw & 0xC0) != 0x80, out=char_starts[1:])
+            return tokens, char_starts[byte_offsets]
+
+    def _cache_get(self, text: str) -> Optional[int]:
+        with self._cache_lock:
+            count = self._cache.get(text)
+            if count is not None:
+                self._cache.move_to_end(text)
+            return count
+
+    def _cache_put(self, text: str, count: int):
+        with self._cache_lock:
+            self._cache[text] = count
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def count_tokens(self, text: str, memoize: bool = True) -> int:
+        """
+        Retorna o número de tokens de um texto, usando a memoização para textos repetidos.
+
+        Args:
+            text: Texto para contar tokens
+            memoize: Se False, conta sem consultar nem preencher a memoização (textos que não
+                se repetem, como prompts e respostas, não devem deslocar os chunks memoizados)
+
+        Returns:
+            Número de tokens
+        """
+        if not memoize:
+            with self._timed("count") as counter:
+                count = len(self.encoding.encode_ordinary(text))
+                counter["tokens"] = count
+            return count
+
+        count = self._cache_get(text)
+        with self._stats_lock:
+            if count is not None:
+                self._cache_hits += 1
+            else:
+                self._cache_misses += 1
+        if count is not None:
+            return count
+
+        with self._timed("count") as counter:
+            count = len(self.encoding.encode_ordinary(text))
+            counter["tokens"] = count
+        self._cache_put(text, count)
+        return count
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """
+        Retorna o número de tokens de vários textos; os que não estão memoizados são
+        codificados juntos com a codificação em lote multithread do tiktoken.
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Lista com o número de tokens de cada texto, na mesma ordem
+        """
+        counts = [self._cache_get(text) for text in texts]
+        missing = list({text: None for text, count in zip(texts, counts) if count is None})
+        with self._stats_lock:
+            self._cache_hits += len(texts) - len(missing)
+            self._cache_misses += len(missing)
+
+        if missing:
+            with self._timed("count_batch") as counter:
+                encoded = self.encoding.encode_ordinary_batch(missing, num_threads=self.num_threads)
+                missing_counts = {text: len(tokens) for text, tokens in zip(missing, encoded)}
+                counter["tokens"] = sum(missing_counts.values())
+            for text, count in missing_counts.items():
+                self._cache_put(text, count)
+            counts = [count if count is not None else missing_counts[text] for text, count in zip(texts, counts)]
+
+        return counts
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Retorna as estatísticas de uso do serviço.
+
+        Returns:
+            Dicionário com chamadas, tokens e segundos por operação, e os acertos/erros do cache
+        """
+        with self._stats_lock:
+            operations = {name: dict(stats) for name, stats in self._stats.items()}
+            hits, misses = self._cache_hits, self._cache_misses
+        return {
+            "operations": operations,
+            "total_seconds": sum(stats["seconds"] for stats in operations.values()),
+            "cache": {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "size": len(self._cache)
+            }
+        }
+
+@lru_cache(maxsize=None)
+def _token_byte_lengths(encoding_name: str) -> np.ndarray:
+    """Retorna o comprimento em bytes de cada token do vocabulário, indexado pelo token."""
+    encoding = tiktoken.get_encoding(encoding_name)
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            # Lacunas no vocabulário
+            pass
+    return lengths
+
+_tokenizers: Dict[str, TokenizerService] = {}
+_tokenizers_lock = threading.Lock()
+
+def get_tokenizer(encoding_name: str = "cl100k_base") -> TokenizerService:
+    """
+    Retorna o serviço de tokenização compartilhado pelo processo para um encoding.
+
+    Args:
+        encoding_name: Nome do encoding do tiktoken
+
+    Returns:
+        Instância única de TokenizerService para o encoding
+    """
+    with _tokenizers_lock:
+        if encoding_name not in _tokenizers:
+            _tokenizers[encoding_name] = TokenizerService(encoding_name)
+            logger.info(f"TokenizerService inicializado com encoding {encoding_name}")
+        return _tokenizers[encoding_name]
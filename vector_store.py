@@ -3,8 +3,15 @@ import logging
 from typing import List, Dict, Any, Optional
 import pickle
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import numpy as np
+import faiss
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import DEFAULT_CACHE_PATH
+from embeddings_backend import create_embeddings
+from faiss_index import FaissIndex, DEFAULT_INDEX_TYPE
+from search_results import SearchResults
+from query_embedding import get_query_embedder
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,26 +19,35 @@ logger = logging.getLogger(__name__)
 
 class VectorStore:
     """
-    Classe para gerenciar o armazenamento vetorial com FAISS e embeddings da OpenAI.
+    Classe para gerenciar o armazenamento vetorial com FAISS e embeddings (por padrão, da OpenAI).
     """
     
-    def __init__(self, openai_api_key: Optional[str] = None):
+    def __init__(self, openai_api_key: Optional[str] = None, embedding_cache_path: str = DEFAULT_CACHE_PATH,
+                 embeddings: Optional[Embeddings] = None, index_type: str = DEFAULT_INDEX_TYPE):
         """
         Inicializa o armazenamento vetorial.
         
         Args:
             openai_api_key: Chave de API da OpenAI (opcional, pode ser definida como variável de ambiente)
+            embedding_cache_path: Caminho do cache de embeddings em disco
+            embeddings: Backend de embeddings (padrão: o configurado em EMBEDDING_BACKEND)
+            index_type: Tipo do índice FAISS ("flat", "ivf_flat", "ivf_pq", "hnsw" ou "auto")
         """
         self.openai_api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
         if not self.openai_api_key:
             logger.warning("Chave de API da OpenAI não fornecida. Defina OPENAI_API_KEY como variável de ambiente.")
         
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            openai_api_key=self.openai_api_key
+        self.embeddings = embeddings or create_embeddings(
+            openai_api_key=self.openai_api_key,
+            cache_path=embedding_cache_path
         )
+        # Embeddings das consultas, com cache e agrupamento compartilhados pelo processo
+        self.query_embedder = get_query_embedder(self.embeddings)
+        self.index_type = index_type
+        # Índice FAISS; o ID de cada vetor é a posição do chunk em self.chunks
         self.vector_store = None
-        logger.info("VectorStore inicializado com modelo text-embedding-3-small")
+        self.chunks = []
+        logger.info(f"VectorStore inicializado com modelo {getattr(self.embeddings, 'model', type(self.embeddings).__name__)}")
     
     def create_vector_store(self, chunks_with_metadata: List[Dict[str, Any]]) -> None:
         """
@@ -59,12 +75,14 @@ class VectorStore:
         
         # Criar armazenamento FAISS
         try:
-            self.vector_store = FAISS.from_texts(
-                texts=texts,
-                embedding=self.embeddings,
-                metadatas=metadatas
-            )
-            logger.info("Armazenamento vetorial FAISS criado com sucesso")
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            self.vector_store = FaissIndex(vectors.shape[1], index_type=self.index_type)
+            self.vector_store.add(vectors, np.arange(len(texts), dtype=np.int64))
+            self.chunks = [
+                {"content": text, "metadata": metadata}
+                for text, metadata in zip(texts, metadatas)
+            ]
+            logger.info(f"Armazenamento vetorial FAISS ({self.vector_store.kind}) criado com sucesso")
         except Exception as e:
             logger.error(f"Erro ao criar armazenamento vetorial: {str(e)}")
             raise
@@ -85,10 +103,14 @@ class VectorStore:
         
         try:
             # Criar diretório se não existir
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.makedirs(file_path, exist_ok=True)
             
-            # Salvar o armazenamento vetorial
-            self.vector_store.save_local(file_path)
+            # Salvar o índice e os chunks
+            self.vector_store.save(os.path.join(file_path, "index.faiss"))
+            tmp_path = os.path.join(file_path, "chunks.pkl.tmp")
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self.chunks, f)
+            os.replace(tmp_path, os.path.join(file_path, "chunks.pkl"))
             logger.info(f"Armazenamento vetorial salvo em: {file_path}")
             return True
         except Exception as e:
@@ -110,16 +132,45 @@ class VectorStore:
             return False
         
         try:
-            self.vector_store = FAISS.load_local(
-                folder_path=file_path,
-                embeddings=self.embeddings
-            )
+            index_path = os.path.join(file_path, "index.faiss")
+            if os.path.exists(os.path.join(file_path, "chunks.pkl")):
+                self.vector_store = FaissIndex.load(index_path, index_type=self.index_type)
+                with open(os.path.join(file_path, "chunks.pkl"), 'rb') as f:
+                    self.chunks = pickle.load(f)
+            else:
+                self._load_legacy_vector_store(file_path)
             logger.info(f"Armazenamento vetorial carregado de: {file_path}")
             return True
         except Exception as e:
             logger.error(f"Erro ao carregar armazenamento vetorial: {str(e)}")
             return False
     
+    def _load_legacy_vector_store(self, file_path: str):
+        """
+        Carrega um armazenamento salvo pelo wrapper FAISS do LangChain (index.faiss + index.pkl),
+        convertendo-o para o formato atual; os vetores existentes são reaproveitados.
+        """
+        legacy_index = faiss.read_index(os.path.join(file_path, "index.faiss"))
+        with open(os.path.join(file_path, "index.pkl"), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        
+        vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+        self.chunks = []
+        for position in range(legacy_index.ntotal):
+            doc = docstore.search(index_to_docstore_id[position])
+            self.chunks.append({"content": doc.page_content, "metadata": doc.metadata})
+        
+        self.vector_store = FaissIndex(legacy_index.d, index_type=self.index_type)
+        self.vector_store.add(vectors, np.arange(legacy_index.ntotal, dtype=np.int64))
+        logger.info(f"Armazenamento vetorial no formato antigo convertido ({legacy_index.ntotal} vetores)")
+    
+    def _fetch_results(self, chunk_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Retorna os chunks de resultados de busca, no formato de similarity_search (sem o score)."""
+        return {
+            chunk_id: {"content": self.chunks[chunk_id]["content"], "metadata": self.chunks[chunk_id]["metadata"]}
+            for chunk_id in chunk_ids
+        }
+    
     def similarity_search(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
         """
         Realiza uma busca por similaridade no armazenamento vetorial.
@@ -137,19 +188,42 @@ class VectorStore:
         
         try:
             logger.info(f"Realizando busca por similaridade para: '{query}' (k={k})")
-            results = self.vector_store.similarity_search_with_score(query, k=k)
-            
-            # Formatar resultados
-            formatted_results = []
-            for doc, score in results:
-                formatted_results.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "score": float(score)
-                })
+            query_vector = np.array([self.query_embedder.embed_query(query)], dtype=np.float32)
+            distances, ids = self.vector_store.search(query_vector, k)
+            formatted_results = SearchResults([query], ids, distances, self._fetch_results)[0]
             
             logger.info(f"Busca concluída. {len(formatted_results)} resultados encontrados")
             return formatted_results
         except Exception as e:
             logger.error(f"Erro na busca por similaridade: {str(e)}")
             return []
+    
+    def batch_similarity_search(self, queries: List[str], k: int = 3) -> SearchResults:
+        """
+        Realiza buscas por similaridade para várias consultas de uma vez.
+        
+        Os embeddings das consultas fora do cache são gerados em uma única requisição e o índice
+        é consultado com uma única busca matricial.
+        
+        Args:
+            queries: Consultas para buscar
+            k: Número de resultados por consulta
+            
+        Returns:
+            Resultados com as matrizes ids e scores (uma linha por consulta); results[i] retorna
+            os resultados da consulta i no formato de similarity_search
+        """
+        if not queries or not self.vector_store:
+            if queries:
+                logger.warning("Nenhum armazenamento vetorial para buscar")
+            return SearchResults.empty(queries)
+        
+        try:
+            logger.info(f"Realizando busca por similaridade para {len(queries)} consultas (k={k})")
+            query_vectors = self.query_embedder.embed_queries(queries)
+            distances, ids = self.vector_store.search(query_vectors, k)
+            logger.info(f"Busca concluída para {len(queries)} consultas")
+            return SearchResults(queries, ids, distances, self._fetch_results)
+        except Exception as e:
+            logger.error(f"Erro na busca por similaridade: {str(e)}")
+            return SearchResults.empty(queries)
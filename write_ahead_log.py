@@ -0,0 +1,157 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o lock entre threads
+    fcntl = None
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def _to_ranges(ids: List[int]) -> List[List[int]]:
+    """Compacta IDs em intervalos [início, fim) de IDs consecutivos."""
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    if not len(ids):
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    return [[int(run[0]), int(run[-1]) + 1] for run in np.split(ids, breaks)]
+
+def _from_ranges(ranges: List[List[int]]) -> np.ndarray:
+    """Expande intervalos [início, fim) em IDs."""
+    if not ranges:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([np.arange(start, end, dtype=np.int64) for start, end in ranges])
+
+class InterProcessLock:
+    """
+    Lock exclusivo entre processos (flock em um arquivo) e entre threads do processo.
+
+    Reentrante na mesma thread: apenas a aquisição mais externa bloqueia o arquivo. Em sistemas
+    sem fcntl (Windows), protege apenas as threads do processo.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Caminho do arquivo de lock (criado se não existir)
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._file = None
+        self.depth = 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Adquire o lock.
+
+        Args:
+            blocking: Esperar o lock; com False, retorna imediatamente se ele estiver ocupado
+
+        Returns:
+            True se o lock foi adquirido
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        try:
+            if not self.depth and fcntl is not None:
+                self._file = open(self.path, "a")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            self._lock.release()
+            return False
+        except Exception:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._lock.release()
+            raise
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if not self.depth and self._file is not None:
+            # Fechar o arquivo libera o flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class WriteAheadLog:
+    """
+    Registro da operação de escrita em andamento na base de conhecimento.
+
+    Antes de gravar uma alteração no banco e no índice, o escritor registra os IDs dos chunks
+    adicionados e removidos; o registro só é apagado depois que as duas partes foram gravadas.
+    Um registro encontrado ao adquirir o lock indica uma operação interrompida, que é concluída
+    ou desfeita comparando o índice com o banco para esses IDs. O arquivo é substituído
+    atomicamente e sincronizado com o disco.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Caminho do arquivo do registro
+        """
+        self.path = path
+
+    def pending(self) -> bool:
+        """Indica se há uma operação registrada e não concluída."""
+        return os.path.exists(self.path)
+
+    def write(self, added: List[int], removed: List[int], dimension: Optional[int]):
+        """
+        Registra uma operação antes de gravá-la.
+
+        Args:
+            added: IDs dos chunks adicionados
+            removed: IDs dos chunks removidos
+            dimension: Dimensão dos vetores do índice
+        """
+        entry = {"added": _to_ranges(added), "removed": _to_ranges(removed), "dimension": dimension}
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def read(self) -> Optional[Dict[str, object]]:
+        """
+        Lê a operação registrada.
+
+        Returns:
+            Dicionário com "added" e "removed" (arrays de IDs) e "dimension", ou None se não
+            houver registro (ou se ele estiver corrompido, caso em que é descartado)
+        """
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+            return {"added": _from_ranges(entry["added"]), "removed": _from_ranges(entry["removed"]),
+                    "dimension": entry.get("dimension")}
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            # O registro é substituído atomicamente; um arquivo ilegível não pode ser recuperado
+            logger.warning(f"Registro de operação inválido descartado ({self.path}): {str(e)}")
+            self.clear()
+            return None
+
+    def clear(self):
+        """Apaga o registro da operação concluída."""
+        if os.path.exists(self.path):
+            os.remove(self.path)